@@ -1,53 +1,84 @@
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, request, jsonify, render_template, send_file, Response, stream_with_context, g
+import contextvars
 import json
 import re
 import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from typing import Optional
 from dotenv import load_dotenv
 from cleaning_jd import EmailExtractor
 from send_email import EmailSender
+from bulk_sender import bulk_engine
+from attachment_cache import attachment_cache
+from smtp_pool import smtp_pool
+from email_outbox import OUTBOX_DB_PATH, EmailOutbox
 from llm_exctration import ResumeOptimizer
 from document_creation import generate_resume_style_1
 from job_scraper import JobScraper
+from llm_client import (CircuitOpenError, StructuredOutputError, get_circuit_states, get_hedge_stats,
+                        get_structured_output_stats, invoke_structured, llm_latency, token_limits)
+from jd_cache import jd_cache_key, jd_prefetcher, jd_response_cache
+from jd_similarity import jd_index
+from resume_artifacts import RESUME_STAGES, resume_artifacts
+from sender_registry import sender_registry
+from mail_merge import MailMerge, MergeRecipient
+from recipient_index import DUPLICATE_SEND_WINDOW_DAYS, recipient_index
+from upload_store import seekable_stream, upload_store
+from send_metrics import send_metrics
+from email_archive import email_archive
+from jd_prompts import JD_SUMMARY_FIELDS, JD_SUMMARY_SCHEMA, jd_summary_messages
+from deadlines import (DeadlineExceeded, budget_note, deadline_scope, remaining_budget, reset_deadline, set_deadline,
+                       timeout_for)
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
-# Initialize EmailSender - load from email.json instead of environment variables
-# Default will be the first email in email.json, or empty if file doesn't exist
-SMTP_USERNAME = ''
-SMTP_PASSWORD = ''
-RESUME_FILE = ''
+OTTER_LINKS_PATH = os.path.join(os.getcwd(), 'otter_links.json')
 
-# Try to load first email from email.json as default
-try:
-    email_json_path = os.path.join(os.getcwd(), 'email.json')
-    if os.path.exists(email_json_path):
-        with open(email_json_path, 'r') as f:
-            emails_data = json.load(f)
-            # Get first email entry
-            if emails_data and isinstance(emails_data, dict):
-                first_email = list(emails_data.keys())[0] if emails_data else ''
-                if first_email and first_email in emails_data:
-                    entry = emails_data[first_email]
-                    if isinstance(entry, list) and len(entry) > 0:
-                        first_entry = entry[0]
-                        SMTP_USERNAME = first_email
-                        SMTP_PASSWORD = first_entry.get('smtp_password') or first_entry.get('app_password') or ''
-except Exception as e:
-    print(f"⚠️ Could not load default email from email.json: {e}")
+# Batch JD extraction limits (LLM concurrency itself is capped by llm_client.llm_rate_limiter)
+BATCH_MAX_ITEMS = int(os.getenv('JD_BATCH_MAX_ITEMS', '50'))
+BATCH_MAX_WORKERS = int(os.getenv('JD_BATCH_MAX_WORKERS', '8'))
 
-email_sender = EmailSender(
-    sender_email=SMTP_USERNAME,
-    app_password=SMTP_PASSWORD,
-    resume_file=RESUME_FILE
-)
+# Shortest pasted text worth a speculative LLM call
+JD_PREFETCH_MIN_CHARS = int(os.getenv('JD_PREFETCH_MIN_CHARS', '200'))
+
+# Largest recipient list accepted by /send_bulk
+BULK_MAX_RECIPIENTS = int(os.getenv('BULK_MAX_RECIPIENTS', '200'))
+
+# Per-request time budget; must stay below gunicorn's 120s worker timeout
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '110'))
+PREFETCH_DEADLINE_SECONDS = float(os.getenv('PREFETCH_DEADLINE_SECONDS', '60'))
 
-EMAIL_ARCHIVE_PATH = os.path.join(os.getcwd(), 'sent_emails.json')
-OTTER_LINKS_PATH = os.path.join(os.getcwd(), 'otter_links.json')
+
+@app.before_request
+def start_request_deadline():
+    """Give every request a deadline that LLM and SMTP calls read their timeouts from"""
+    budget = REQUEST_DEADLINE_SECONDS
+    requested = request.headers.get('X-Request-Timeout')
+    if requested:
+        try:
+            budget = max(min(budget, float(requested)), 1.0)
+        except ValueError:
+            pass
+    g.deadline_token = set_deadline(budget, request.path)
+
+
+@app.teardown_request
+def clear_request_deadline(exc=None):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        try:
+            reset_deadline(token)
+        except ValueError:
+            # Token was created in another context (e.g. a streamed response); nothing to reset
+            pass
 
 
 def _normalise_recipient_list(value: str) -> list:
@@ -114,23 +145,72 @@ def extract_phone_from_text(text: str) -> Optional[str]:
 
 def archive_email_metadata(email_payload: dict) -> None:
     """
-    Persist the outgoing email payload so we keep a simple JSON archive
-    of every email that was attempted.
+    Persist the outgoing email payload so we keep an archive of every email
+    that was attempted (one appended row, see email_archive.py).
     """
     try:
-        existing_records = []
-        if os.path.exists(EMAIL_ARCHIVE_PATH):
-            with open(EMAIL_ARCHIVE_PATH, 'r', encoding='utf-8') as archive_file:
-                loaded = json.load(archive_file)
-                if isinstance(loaded, list):
-                    existing_records = loaded
+        email_archive.append(email_payload)
+    except Exception as archive_error:
+        print(f"⚠️ Failed to archive email payload: {archive_error}")
+        return
+    try:
+        recipient_index.record(email_payload)
+    except Exception as index_error:
+        print(f"⚠️ Failed to index archived email: {index_error}")
+
 
-        existing_records.append(email_payload)
+def update_archive_send_status(message_id: str, status: str, details: dict) -> None:
+    """Record an outbox status transition (queued/sending/retrying/sent/dead) on the archived email"""
+    try:
+        recipient_index.update_status(message_id, status)
+    except Exception as index_error:
+        print(f"⚠️ Failed to update recipient index for {message_id}: {index_error}")
+    def apply(record: dict) -> None:
+        record['send_status'] = status
+        if 'attempts' in details:
+            record['send_attempts'] = details['attempts']
+        if details.get('error'):
+            record['send_error'] = details['error']
+        if details.get('sent_at'):
+            record['sent_at'] = datetime.utcfromtimestamp(details['sent_at']).isoformat()
+            record.pop('send_error', None)
 
-        with open(EMAIL_ARCHIVE_PATH, 'w', encoding='utf-8') as archive_file:
-            json.dump(existing_records, archive_file, indent=2, ensure_ascii=False)
+    try:
+        email_archive.update_by_message_id(message_id, apply)
     except Exception as archive_error:
-        print(f"⚠️ Failed to archive email payload: {archive_error}")
+        print(f"⚠️ Failed to update send status for {message_id}: {archive_error}")
+
+
+def resolve_sender(sender_email: str = '', resume_file: str = '', original_filename: Optional[str] = None) -> EmailSender:
+    """
+    EmailSender for a registered address (or the default sender when empty).
+    Raises ValueError when no SMTP password can be found.
+    """
+    profile = sender_registry.get(sender_email) if sender_email else sender_registry.default()
+    if profile is not None:
+        sender_email = profile.email
+    smtp_pw = (profile.smtp_password if profile else '') or os.getenv('SMTP_PASSWORD', '')
+    if not smtp_pw:
+        raise ValueError(f'No SMTP password found for selected email: {sender_email}')
+    sender = EmailSender(sender_email=sender_email, app_password=smtp_pw, resume_file=resume_file)
+    if original_filename:
+        sender._original_filename = original_filename
+    return sender
+
+
+try:
+    email_archive.migrate_from_json()
+except Exception as e:
+    print(f"⚠️ Could not migrate sent_emails.json into the archive database: {e}")
+
+email_outbox = EmailOutbox(OUTBOX_DB_PATH, resolve_sender, load_attachment=upload_store.read,
+                           on_status=update_archive_send_status)
+email_outbox.start()
+
+try:
+    recipient_index.ensure_built(email_archive.iter_records)
+except Exception as e:
+    print(f"⚠️ Could not build recipient index from archive: {e}")
 
 @app.route('/')
 def index():
@@ -187,68 +267,52 @@ def otter_link():
 
 @app.route('/sent_emails_data', methods=['GET'])
 def sent_emails_data():
-    """Return sent emails data from JSON archive with pagination support"""
+    """
+    Return sent emails data from the archive with pagination support.
+
+    Pages are newest first. Pass ?after=<next_cursor> from the previous
+    response to get the next page (any depth costs the same); ?page= still works.
+
+    ?search= uses the full-text index: words match as prefixes, "quoted words"
+    as a phrase, and name:/to:/from:/subject:/phone:/body:/comment: limit a term
+    to one field. Matches are ranked best first unless ?sort=recent.
+    """
     try:
         # Get pagination parameters
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 25))
-        search_term = request.args.get('search', '').strip().lower()
+        search_term = request.args.get('search', '').strip()
         
-        if not os.path.exists(EMAIL_ARCHIVE_PATH):
+        if search_term:
+            sort = request.args.get('sort', 'relevance')
+            paginated_emails, total = email_archive.search(search_term, per_page, (page - 1) * per_page, sort)
+            total_pages = (total + per_page - 1) // per_page
             return jsonify({
-                'emails': [],
-                'total': 0,
+                'emails': paginated_emails,
+                'total': total,
                 'page': page,
                 'per_page': per_page,
-                'total_pages': 0,
-                'has_more': False
+                'total_pages': total_pages,
+                'has_more': page * per_page < total,
+                'sort': sort
             }), 200
         
-        # Read file in chunks to avoid loading all into memory at once
-        with open(EMAIL_ARCHIVE_PATH, 'r', encoding='utf-8') as f:
-            emails = json.load(f)
-        
-        if not isinstance(emails, list):
-            emails = []
-        
-        # Sort by timestamp (latest first) - do this once
-        emails.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        # Apply search filter if provided
-        if search_term:
-            filtered_emails = []
-            for email in emails:
-                name = (email.get('name', '') or '').lower()
-                to_email = (email.get('to_email', '') or '').lower()
-                from_email = (email.get('from_email', '') or '').lower()
-                subject = (email.get('subject', '') or '').lower()
-                phone = (email.get('phone', '') or '').lower()
-                body = (email.get('body', '') or '').lower()
-                comment = (email.get('comment', '') or '').lower()
-                
-                if (search_term in name or search_term in to_email or 
-                    search_term in from_email or search_term in subject or 
-                    search_term in phone or search_term in body or 
-                    search_term in comment):
-                    filtered_emails.append(email)
-            emails = filtered_emails
-        
-        # Calculate pagination
-        total = len(emails)
-        total_pages = (total + per_page - 1) // per_page  # Ceiling division
-        start_index = (page - 1) * per_page
-        end_index = start_index + per_page
-        
-        # Get only the emails for this page
-        paginated_emails = emails[start_index:end_index]
+        # Newest first from the timestamp index; ?after=<next_cursor> continues without an offset scan
+        after = request.args.get('after')
+        try:
+            paginated_emails, next_cursor = email_archive.page(per_page, after=after, offset=(page - 1) * per_page)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'emails': []}), 400
+        total = email_archive.count()
         
         return jsonify({
             'emails': paginated_emails,
             'total': total,
-            'page': page,
+            'page': None if after else page,
             'per_page': per_page,
-            'total_pages': total_pages,
-            'has_more': end_index < total
+            'total_pages': (total + per_page - 1) // per_page,  # Ceiling division
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor
         }), 200
     except Exception as e:
         print(f"❌ Error reading sent emails: {e}")
@@ -258,36 +322,15 @@ def sent_emails_data():
 
 @app.route('/sent_emails_stats', methods=['GET'])
 def sent_emails_stats():
-    """Return statistics about sent emails without loading all data"""
+    """
+    Return statistics about sent emails from counters kept up to date on every
+    archive write: totals plus by_sender, by_day (?days=30), by_domain (?top=20)
+    and by_status.
+    """
     try:
-        if not os.path.exists(EMAIL_ARCHIVE_PATH):
-            return jsonify({
-                'total': 0,
-                'with_resume': 0,
-                'with_phone': 0
-            }), 200
-        
-        # Read and count without loading full data
-        total = 0
-        with_resume = 0
-        with_phone = 0
-        
-        with open(EMAIL_ARCHIVE_PATH, 'r', encoding='utf-8') as f:
-            emails = json.load(f)
-        
-        if isinstance(emails, list):
-            total = len(emails)
-            for email in emails:
-                if email.get('resume_attached'):
-                    with_resume += 1
-                if email.get('phone') and email.get('phone', '').strip():
-                    with_phone += 1
-        
-        return jsonify({
-            'total': total,
-            'with_resume': with_resume,
-            'with_phone': with_phone
-        }), 200
+        days = int(request.args.get('days', 30))
+        top = int(request.args.get('top', 20))
+        return jsonify(email_archive.stats(days, top)), 200
     except Exception as e:
         print(f"❌ Error reading email stats: {e}")
         return jsonify({
@@ -296,68 +339,60 @@ def sent_emails_stats():
             'with_phone': 0
         }), 200
 
+@app.route('/sent_emails_stats/rebuild', methods=['POST'])
+def rebuild_sent_emails_stats():
+    """Recompute the archive counters from scratch (e.g. after editing the database by hand)"""
+    try:
+        counted = email_archive.rebuild_counters()
+        return jsonify({'success': True, 'counted': counted, 'stats': email_archive.stats()}), 200
+    except Exception as e:
+        print(f"❌ Error rebuilding email stats: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/sent_emails_export', methods=['GET'])
+def sent_emails_export():
+    """Download the whole archive in the old sent_emails.json format"""
+    try:
+        return Response(email_archive.export(), mimetype='application/json',
+                        headers={'Content-Disposition': 'attachment; filename=sent_emails.json'})
+    except Exception as e:
+        print(f"❌ Error exporting sent emails: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/save_email_comment', methods=['POST'])
 def save_email_comment():
-    """Save comment for a specific email entry"""
+    """
+    Save comment for a specific email entry. ``email_id`` is the email's stable
+    id (``id`` in /sent_emails_data); the older base64(timestamp|||to|||from)
+    ids are still accepted.
+    """
     try:
         import base64
         
         data = request.get_json()
-        email_id_encoded = data.get('email_id', '')
+        email_id = data.get('email_id', '')
         comment = data.get('comment', '').strip()
         
-        if not email_id_encoded:
+        if not email_id:
             return jsonify({'success': False, 'error': 'Email ID is required'}), 400
         
-        # Decode email_id (format: base64(timestamp|||to_email|||from_email))
-        try:
-            email_id_decoded = base64.b64decode(email_id_encoded).decode('utf-8')
-            parts = email_id_decoded.split('|||')
-            if len(parts) < 3:
-                return jsonify({'success': False, 'error': 'Invalid email ID format'}), 400
-            
-            timestamp = parts[0]
-            to_email = parts[1]
-            from_email = parts[2]
-        except Exception as decode_error:
-            print(f"❌ Error decoding email ID: {decode_error}")
-            return jsonify({'success': False, 'error': 'Invalid email ID encoding'}), 400
-        
-        if not os.path.exists(EMAIL_ARCHIVE_PATH):
-            return jsonify({'success': False, 'error': 'Email archive not found'}), 404
-        
-        # Load existing emails
-        with open(EMAIL_ARCHIVE_PATH, 'r', encoding='utf-8') as f:
-            emails = json.load(f)
-        
-        if not isinstance(emails, list):
-            emails = []
-        
-        # Find matching email entry
-        found = False
-        for email in emails:
-            email_timestamp = email.get('timestamp', '')
-            email_to = email.get('to_email', '')
-            email_from = email.get('from_email', '')
-            
-            # Match by timestamp, to_email, and from_email
-            if (email_timestamp == timestamp and 
-                email_to == to_email and 
-                email_from == from_email):
-                # Update comment
-                email['comment'] = comment
-                found = True
-                break
-        
-        if not found:
+        if not email_archive.is_email_id(email_id):
+            # Decode legacy email_id (format: base64(timestamp|||to_email|||from_email))
+            try:
+                parts = base64.b64decode(email_id).decode('utf-8').split('|||')
+                if len(parts) < 3:
+                    return jsonify({'success': False, 'error': 'Invalid email ID format'}), 400
+            except Exception as decode_error:
+                print(f"❌ Error decoding email ID: {decode_error}")
+                return jsonify({'success': False, 'error': 'Invalid email ID encoding'}), 400
+            email_id = email_archive.find_id(parts[0], parts[1], parts[2])
+        
+        # One row in the annotations table; the archived email itself is untouched
+        if not email_id or not email_archive.set_comment(email_id, comment):
             return jsonify({'success': False, 'error': 'Email entry not found'}), 404
         
-        # Save updated emails back to file
-        with open(EMAIL_ARCHIVE_PATH, 'w', encoding='utf-8') as f:
-            json.dump(emails, f, indent=2, ensure_ascii=False)
-        
-        print(f"✅ Comment saved for email: {to_email} (timestamp: {timestamp})")
-        return jsonify({'success': True}), 200
+        print(f"✅ Comment saved for email {email_id}")
+        return jsonify({'success': True, 'email_id': email_id}), 200
         
     except Exception as e:
         print(f"❌ Error saving comment: {e}")
@@ -535,11 +570,9 @@ def extract_docx_text():
         # Try to extract text using python-docx
         try:
             from docx import Document
-            import io
             
-            # Read file content
-            file_content = file.read()
-            doc = Document(io.BytesIO(file_content))
+            # Parse straight from the upload stream (spooled only if it cannot seek)
+            doc = Document(seekable_stream(file.stream))
             
             # Extract text from all paragraphs
             text_content = []
@@ -569,6 +602,81 @@ def extract_docx_text():
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+def _lookup_years_of_experience(sender_email: str) -> str:
+    """Return years_of_experience for the sender from the sender registry (defaults to 10+ years)"""
+    years_of_experience = "10+ years"  # Default
+    if not sender_email:
+        print(f"ℹ️ No sender email provided, using default years_of_experience: {years_of_experience}")
+        return years_of_experience
+    profile = sender_registry.get(sender_email)
+    if profile is None:
+        print(f"⚠️ Sender email '{sender_email}' not found in email.json, using default: {years_of_experience}")
+    elif profile.years_of_experience:
+        years_of_experience = profile.years_of_experience
+        print(f"✅ Using years_of_experience: '{years_of_experience}' for {sender_email}")
+    return years_of_experience
+
+
+def _parse_extractor_output(result_json: str) -> Optional[dict]:
+    """Parse the JSON string returned by EmailExtractor, tolerating stray newlines"""
+    # Try to parse JSON directly first
+    try:
+        result_dict = json.loads(result_json)
+        print("\n=== Successfully parsed JSON on first try ===")
+        return result_dict
+    except json.JSONDecodeError:
+        print("\n=== First parse failed, trying to fix newlines ===")
+    # Extract JSON and try to fix it
+    json_match = re.search(r'\{.*\}', result_json, re.DOTALL)
+    if json_match:
+        cleaned_json = json_match.group(0)
+        # Try multiple parsing strategies
+        for strategy in ['direct', 'replace_all']:
+            try:
+                if strategy == 'direct':
+                    result_dict = json.loads(cleaned_json)
+                    print("=== Parsed successfully with direct method ===")
+                elif strategy == 'replace_all':
+                    fixed_json = cleaned_json.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
+                    result_dict = json.loads(fixed_json)
+                    print("=== Parsed successfully by replacing all newlines with spaces ===")
+                return result_dict
+            except json.JSONDecodeError:
+                continue
+    print("\n❌ No valid JSON found after all attempts")
+    return None
+
+
+def _extract_email_draft(raw_text: str, years_of_experience: str) -> Optional[dict]:
+    """Run EmailExtractor on one JD and return the parsed draft (None if unparseable)"""
+    # Pass to cleaning_jd.py (port 5002 uses profile 1)
+    extractor = EmailExtractor(raw_text, use_profile_2=False, years_of_experience=years_of_experience)
+    result_json = extractor.extract_email_info_from_jd(raw_text)
+    print(f"\n=== Response from cleaning_jd.py ===\nLength: {len(result_json)} chars\nFirst 200 chars: {result_json[:200]}")
+    return _parse_extractor_output(result_json)
+
+
+def _cached_email_draft(raw_text: str, years_of_experience: str) -> Optional[dict]:
+    """
+    Return the email draft from the response cache (or an in-flight prefetch), else
+    extract it. Joining a prefetch is bounded by the request deadline; if the
+    prefetch has not finished by then we extract directly (which raises
+    DeadlineExceeded when no budget is left).
+    """
+    cache_key = jd_cache_key(raw_text, years_of_experience)
+    result_dict = jd_response_cache.get(cache_key)
+    if result_dict is None:
+        result_dict = jd_prefetcher.wait_for(cache_key, timeout=timeout_for(PREFETCH_DEADLINE_SECONDS, 'prefetch join'))
+    if result_dict is not None:
+        print(f"⚡ Using cached email draft ({cache_key[:12]})")
+        return result_dict
+
+    result_dict = _extract_email_draft(raw_text, years_of_experience)
+    if result_dict is not None:
+        jd_response_cache.set(cache_key, result_dict)
+    return result_dict
+
+
 @app.route('/clean_job_description', methods=['POST'])
 def clean_job_description():
     try:
@@ -582,73 +690,129 @@ def clean_job_description():
         print(f"📧 Sender email received: '{sender_email}' (empty: {not sender_email})")
         
         # Get years_of_experience from email.json if sender_email is provided
-        years_of_experience = "10+ years"  # Default
-        if sender_email:
-            try:
-                email_json_path = os.path.join(os.getcwd(), 'email.json')
-                if os.path.exists(email_json_path):
-                    with open(email_json_path, 'r') as f:
-                        emails_data = json.load(f)
-                    print(f"📋 Checking email.json for: {sender_email}")
-                    print(f"📋 Available emails: {list(emails_data.keys())}")
-                    if sender_email in emails_data and isinstance(emails_data[sender_email], list) and len(emails_data[sender_email]) > 0:
-                        entry = emails_data[sender_email][0]
-                        years_of_experience = entry.get('years_of_experience', '10+ years')
-                        print(f"✅ Using years_of_experience: '{years_of_experience}' for {sender_email}")
-                    else:
-                        print(f"⚠️ Sender email '{sender_email}' not found in email.json, using default: {years_of_experience}")
-                else:
-                    print(f"⚠️ email.json not found at {email_json_path}, using default: {years_of_experience}")
-            except Exception as e:
-                print(f"⚠️ Could not load years_of_experience from email.json: {e}")
-                import traceback
-                traceback.print_exc()
-        else:
-            print(f"ℹ️ No sender email provided, using default years_of_experience: {years_of_experience}")
+        years_of_experience = _lookup_years_of_experience(sender_email)
         
-        # Pass to cleaning_jd.py (port 5002 uses profile 1)
         print("\n=== Calling cleaning_jd.py EmailExtractor ===")
-        extractor = EmailExtractor(raw_text, use_profile_2=False, years_of_experience=years_of_experience)
-        print("Extractor created")
-        
-        result_json = extractor.extract_email_info_from_jd(raw_text)
-        print(f"\n=== Response from cleaning_jd.py ===\nLength: {len(result_json)} chars\nFirst 200 chars: {result_json[:200]}")
-        
-        # Try to parse JSON directly first
         try:
-            result_dict = json.loads(result_json)
-            print("\n=== Successfully parsed JSON on first try ===")
+            result_dict = _cached_email_draft(raw_text, years_of_experience)
+        except (DeadlineExceeded, CircuitOpenError) as llm_error:
+            print(f"⏱️ {llm_error}")
+            timed_out = isinstance(llm_error, DeadlineExceeded)
+            if data.get('allow_fallback', True) is False:
+                if timed_out:
+                    return jsonify({'error': f'Timed out: {llm_error}', 'timeout': True}), 504
+                return jsonify({'error': f'LLM provider unavailable: {llm_error}', 'circuit_open': True}), 503
+            # Fast deterministic fallback: recruiter contact only, no drafted email
+            reason = 'LLM timed out' if timed_out else 'LLM provider unavailable'
+            result_dict = EmailExtractor(raw_text).fallback_email_info()
+            result_dict.update({'degraded': True, 'warning': f'{reason} ({llm_error}); showing recruiter contact only'})
             return jsonify(result_dict), 200
-        except json.JSONDecodeError:
-            print("\n=== First parse failed, trying to fix newlines ===")
-            # Extract JSON and try to fix it
-            json_match = re.search(r'\{.*\}', result_json, re.DOTALL)
-            if json_match:
-                cleaned_json = json_match.group(0)
-                # Try multiple parsing strategies
-                for strategy in ['direct', 'replace_all']:
-                    try:
-                        if strategy == 'direct':
-                            result_dict = json.loads(cleaned_json)
-                            print("=== Parsed successfully with direct method ===")
-                        elif strategy == 'replace_all':
-                            fixed_json = cleaned_json.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
-                            result_dict = json.loads(fixed_json)
-                            print("=== Parsed successfully by replacing all newlines with spaces ===")
-                        return jsonify(result_dict), 200
-                    except json.JSONDecodeError:
-                        continue
-            print("\n❌ No valid JSON found after all attempts")
+        if result_dict is None:
             return jsonify({'error': 'No valid JSON found in response'}), 500
-    except json.JSONDecodeError as e:
-        print(f"\n❌ JSON Error: {str(e)}")
-        return jsonify({'error': f'Failed to parse JSON: {str(e)}'}), 500
+        return jsonify(result_dict), 200
     except Exception as e:
         print(f"\n❌ Exception: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/prefetch_job_description', methods=['POST'])
+def prefetch_job_description():
+    """
+    Speculatively start the email-draft extraction while the user is still editing,
+    so the later /clean_job_description call is served from the response cache.
+    Sending new text (or cancel=true) for the same prefetch_id cancels the previous job.
+    """
+    try:
+        data = request.get_json() or {}
+        raw_text = (data.get('raw_text') or '').strip()
+        sender_email = data.get('sender_email', '')
+        prefetch_id = data.get('prefetch_id') or request.remote_addr or 'default'
+
+        if data.get('cancel') or len(raw_text) < JD_PREFETCH_MIN_CHARS:
+            cancelled = jd_prefetcher.cancel(prefetch_id)
+            return jsonify({'status': 'cancelled' if cancelled else 'skipped'}), 200
+
+        years_of_experience = _lookup_years_of_experience(sender_email)
+        cache_key = jd_cache_key(raw_text, years_of_experience)
+        def compute():
+            with deadline_scope(PREFETCH_DEADLINE_SECONDS, 'prefetch'):
+                return _extract_email_draft(raw_text, years_of_experience)
+
+        status = jd_prefetcher.start(prefetch_id, cache_key, compute)
+        print(f"🔮 Prefetch {status} for {cache_key[:12]} ({len(raw_text)} chars)")
+        return jsonify({'status': status}), 202
+    except Exception as e:
+        print(f"❌ Error starting prefetch: {e}")
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+@app.route('/clean_job_descriptions_batch', methods=['POST'])
+def clean_job_descriptions_batch():
+    """
+    Generate email drafts for many JDs at once.
+
+    Extractions run concurrently (bounded by the shared LLM rate limiter) and each
+    result is streamed back as one NDJSON line as soon as it completes, followed
+    by a final summary line.
+    """
+    try:
+        data = request.get_json() or {}
+        raw_texts = data.get('raw_texts') or data.get('job_descriptions') or []
+        sender_email = data.get('sender_email', '')
+
+        if not isinstance(raw_texts, list) or not raw_texts:
+            return jsonify({'error': 'raw_texts must be a non-empty list'}), 400
+        if len(raw_texts) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'At most {BATCH_MAX_ITEMS} job descriptions per batch'}), 400
+
+        years_of_experience = _lookup_years_of_experience(sender_email)
+        print(f"\n=== Batch extraction: {len(raw_texts)} JDs ===")
+    except Exception as e:
+        print(f"❌ Error starting batch extraction: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    def run_one(index: int, raw_text: str) -> dict:
+        started = time.perf_counter()
+        item = {'index': index}
+        try:
+            if not isinstance(raw_text, str) or not raw_text.strip():
+                raise ValueError('Empty job description')
+            result_dict = _cached_email_draft(raw_text, years_of_experience)
+            if result_dict is None:
+                raise ValueError('No valid JSON found in response')
+            item.update({'success': True, 'result': result_dict})
+        except Exception as item_error:
+            print(f"❌ Batch item {index} failed: {item_error}")
+            item.update({'success': False, 'error': str(item_error)})
+        item['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return item
+
+    def generate():
+        batch_started = time.perf_counter()
+        succeeded = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(raw_texts))) as executor:
+            # Each worker runs in a copy of this context so it sees the request deadline
+            futures = [executor.submit(contextvars.copy_context().run, run_one, i, text) for i, text in enumerate(raw_texts)]
+            for future in as_completed(futures):
+                item = future.result()
+                if item['success']:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield json.dumps(item, ensure_ascii=False) + '\n'
+        summary = {
+            'done': True,
+            'total': len(raw_texts),
+            'succeeded': succeeded,
+            'failed': failed,
+            'elapsed_ms': round((time.perf_counter() - batch_started) * 1000, 1)
+        }
+        print(f"✅ Batch extraction finished: {succeeded} ok, {failed} failed")
+        yield json.dumps(summary) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/list_resumes', methods=['GET'])
 def list_resumes():
     """List available resume files"""
@@ -809,24 +973,43 @@ def list_folder_files():
 
 @app.route('/create_resume', methods=['POST'])
 def create_resume():
-    """Create optimized resume using ResumeOptimizer and convert to DOCX"""
+    """
+    Create optimized resume using ResumeOptimizer and convert to DOCX.
+
+    Completed stages (skills, resume_json, document) are stored per JD hash, so a
+    rerun only redoes what is missing. Pass "regenerate": "<stage>" (or true for
+    everything) to redo that stage and the ones after it.
+    """
     try:
         data = request.get_json()
         job_description = data.get('job_description', '')
+        regenerate = data.get('regenerate')
         
         if not job_description:
             return jsonify({'error': 'Job description is required'}), 400
+        if regenerate not in (None, False, True) and regenerate not in RESUME_STAGES:
+            return jsonify({'error': f'regenerate must be true or one of: {", ".join(RESUME_STAGES)}'}), 400
         
         print(f"\n=== Creating Resume ===")
         print(f"Job description length: {len(job_description)} chars")
         
         # Step 1: Initialize ResumeOptimizer
-        optimizer = ResumeOptimizer(job_description)
+        optimizer = ResumeOptimizer(job_description, artifact_store=resume_artifacts)
+        jd_hash = optimizer.jd_hash
+        if regenerate:
+            removed = resume_artifacts.invalidate(jd_hash, RESUME_STAGES[0] if regenerate is True else regenerate)
+            print(f"♻️ Regenerating stages: {removed or 'none stored'}")
+        
+        stored_document = resume_artifacts.get(jd_hash, 'document')
+        if stored_document and os.path.exists(stored_document.get('resume_path', '')):
+            print(f"✅ Reusing resume DOCX for JD {jd_hash[:12]}: {stored_document['resume_path']}")
+            return jsonify({'resume_path': stored_document['resume_path'], 'success': True, 'jd_hash': jd_hash,
+                            'stages': {stage: 'artifact' for stage in RESUME_STAGES}}), 200
         
         # Step 2: Extract skills from job description
         print("\n=== Step 1: Extracting skills from JD ===")
         extracted_skills = optimizer.extract_skills()
-        print(f"✅ Skills extracted: {len(extracted_skills)} chars")
+        print(f"✅ Skills extracted ({optimizer.stage_sources.get('skills', 'failed')}): {len(extracted_skills)} chars{budget_note()}")
         
         # Step 3: Generate optimized resume JSON
         print("\n=== Step 2: Generating optimized resume ===")
@@ -867,14 +1050,40 @@ def create_resume():
             return jsonify({'error': 'Failed to create resume document'}), 500
         
         print(f"✅ Resume DOCX created at: {docx_resume_path}")
-        return jsonify({'resume_path': docx_resume_path, 'success': True}), 200
-        
+        resume_artifacts.put(jd_hash, 'document', {'resume_path': docx_resume_path, 'json_path': json_resume_path})
+        optimizer.stage_sources['document'] = 'generated'
+        return jsonify({'resume_path': docx_resume_path, 'success': True, 'jd_hash': jd_hash,
+                        'stages': optimizer.stage_sources}), 200
+        
+    except DeadlineExceeded as e:
+        print(f"⏱️ Resume creation timed out: {e}")
+        return jsonify({'error': f'Timed out: {e}', 'timeout': True}), 504
+    except CircuitOpenError as e:
+        print(f"⚡ Resume creation skipped, LLM circuit open: {e}")
+        return jsonify({'error': f'LLM provider unavailable, try again shortly: {e}', 'circuit_open': True}), 503
     except Exception as e:
         print(f"❌ Error creating resume: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/resume_artifacts/<jd_hash>', methods=['GET', 'DELETE'])
+def resume_artifact_stages(jd_hash):
+    """
+    GET: which resume stages are stored for a JD hash (with their timestamps).
+    DELETE: drop stored stages, from ?from=<stage> (default: all) onwards.
+    """
+    try:
+        removed = []
+        if request.method == 'DELETE':
+            removed = resume_artifacts.invalidate(jd_hash, request.args.get('from', RESUME_STAGES[0]))
+        return jsonify({'jd_hash': jd_hash, 'stages': resume_artifacts.stages(jd_hash), 'removed': removed}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"❌ Error reading resume artifacts: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/generate_resume_from_json', methods=['POST'])
 def generate_resume_from_json():
     """Generate resume directly from JSON input without LLM"""
@@ -1166,37 +1375,38 @@ def scrape_jobs():
 @app.route('/available_senders', methods=['GET'])
 def available_senders():
     """Return available sender emails (no passwords) from email.json"""
-    try:
-        email_json_path = os.path.join(os.getcwd(), 'email.json')
-        if not os.path.exists(email_json_path):
-            return jsonify({'senders': []}), 200
-
-        with open(email_json_path, 'r') as f:
-            data = json.load(f)
-
-        senders = []
-        # data is expected to be { email: [ {name, phone_number, smtp_username, smtp_password}, ... ] }
-        for email, entries in data.items():
-            if isinstance(entries, list) and len(entries) > 0 and isinstance(entries[0], dict):
-                e = entries[0]
-                senders.append({
-                    'email': email,
-                    'name': e.get('name', ''),
-                    'phone': e.get('phone_number', ''),
-                    'linkedin': e.get('linkedin_url', '') or ''
-                })
-            else:
-                senders.append({'email': email, 'name': '', 'phone': '', 'linkedin': ''})
+    return jsonify({'senders': [profile.public() for profile in sender_registry.all()]}), 200
 
-        return jsonify({'senders': senders}), 200
+@app.route('/check_recipient', methods=['GET'])
+def check_recipient():
+    """
+    Have we emailed this address recently? Query: email, optional subject and days
+    (default DUPLICATE_SEND_WINDOW_DAYS). "duplicate" means same subject, which
+    /send_email refuses without allow_duplicate.
+    """
+    email = (request.args.get('email') or '').strip()
+    if '@' not in email:
+        return jsonify({'recipient': email.lower(), 'contacted': False, 'duplicate': False, 'contacts': []}), 200
+    try:
+        days = float(request.args.get('days', DUPLICATE_SEND_WINDOW_DAYS))
+        history = recipient_index.check(email, request.args.get('subject'), days)
+        history['message'] = recipient_index.describe(history)
+        return jsonify(history), 200
     except Exception as e:
-        print('❌ Error reading email.json:', e)
-        return jsonify({'senders': []}), 200
+        print(f"❌ Error checking recipient: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/send_email', methods=['POST'])
+@send_metrics.timed('send_email_request')
 def send_email():
-    """Send email with resume attachment using EmailSender class"""
-    temp_path = None
+    """
+    Queue an email (with optional resume attachment) in the durable outbox.
+
+    Returns 202 with a message_id as soon as the email is stored; the outbox
+    worker delivers it in the background with retries, and the archive entry's
+    send_status follows it (queued -> sending -> sent, or retrying / dead).
+    Each stage of the request is timed (see /send_metrics).
+    """
     try:
         # Get form data
         recruiter_name = request.form.get('recruiter_name', 'Hiring Manager')
@@ -1207,43 +1417,55 @@ def send_email():
         bcc = request.form.get('bcc', '').strip()  # Optional BCC
         resume_file = request.files.get('resume')
         resume_path = request.form.get('resume_path', '')
+        sender_override = request.form.get('sender_email') or request.form.get('from_email')
+        default_sender = sender_registry.default()
+        send_metrics.annotate(sender=sender_override or (default_sender.email if default_sender else ''),
+                              recipient=recruiter_email)
+        send_metrics.lap('parse_form')
         
         if not recruiter_email:
             return jsonify({'success': False, 'error': 'Recruiter email is required'}), 400
         
         if not body:
             return jsonify({'success': False, 'error': 'Email body is required'}), 400
-        
-        # Handle resume attachment - check for server-side path or uploaded file
+
+        # Same recruiter about the same subject recently: refuse unless the user confirmed a re-send
+        if request.form.get('allow_duplicate', '').lower() not in ('1', 'true', 'yes'):
+            try:
+                history = recipient_index.check(recruiter_email, subject)
+            except Exception as index_error:
+                print(f"⚠️ Recipient index lookup failed, not checking for duplicates: {index_error}")
+                history = None
+            if history and history['duplicate']:
+                reason = recipient_index.describe(history)
+                print(f"⛔ {reason}")
+                return jsonify({'success': False, 'duplicate': True, 'error': reason, 'history': history}), 409
+        send_metrics.lap('duplicate_check')
+        
+        # Handle resume attachment - server-side path or uploaded file, stored once by content hash
+        stored_upload = None
         if resume_path and os.path.exists(resume_path):
             # Use the server-side generated resume
-            email_sender.resume_file = resume_path
-            email_sender._original_filename = os.path.basename(resume_path)
-            attach_resume = True
+            stored_upload = upload_store.ingest_path(resume_path)
         elif resume_file:
-            # Save uploaded resume temporarily
-            original_filename = resume_file.filename
-            print(f"📎 Original filename from upload: {original_filename}")
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            temp_filename = f"resume_{timestamp}_{original_filename}"
-            temp_path = os.path.join(os.getcwd(), temp_filename)
-            resume_file.save(temp_path)
-            
-            # Override filename in EmailSender to use original name (not the temp filename)
-            email_sender.resume_file = temp_path
-            email_sender._original_filename = original_filename
-            print(f"✅ Preserving original filename for attachment: {original_filename}")
-            attach_resume = True
-        else:
-            attach_resume = False
-            email_sender.resume_file = ''
-            if hasattr(email_sender, '_original_filename'):
-                delattr(email_sender, '_original_filename')
-        
-        # Determine which sender to use. If frontend provided a sender_email, try to lookup its SMTP password
-        sender_override = request.form.get('sender_email') or request.form.get('from_email')
-
-        # Prepare metadata archive entry before attempting to send
+            print(f"📎 Original filename from upload: {resume_file.filename}")
+            stored_upload = upload_store.ingest(resume_file.stream, resume_file.filename)
+        if stored_upload:
+            print(f"✅ Attachment {stored_upload.filename} ({stored_upload.size} bytes, "
+                  f"{'reused stored copy' if stored_upload.reused else 'stored'})")
+        send_metrics.lap('store_attachment')
+        
+        # Determine which sender to use. If frontend provided a sender_email, check its SMTP password now
+        try:
+            resolve_sender(sender_override)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return jsonify({'success': False, 'error': str(e)}), 400
+        sender_address = sender_override or (default_sender.email if default_sender else '')
+        send_metrics.annotate(sender=sender_address)
+        send_metrics.lap('resolve_sender')
+
+        # Prepare metadata archive entry before queueing
         cc_list_normalised = _normalise_recipient_list(cc)
         bcc_list_normalised = _normalise_recipient_list(bcc)
         
@@ -1269,112 +1491,257 @@ def send_email():
         if not phone_number:
             phone_number = None
             print(f"ℹ️ Phone field will be null (no phone number found)")
+        send_metrics.lap('phone_extraction')
 
+        message_id = uuid.uuid4().hex
         email_archive_entry = {
             "to_email": recruiter_email,
             "name": recruiter_name,
             "subject": subject,
-            "from_email": sender_override or email_sender.sender_email or '',
+            "from_email": sender_address,
             "body": body,
             "timestamp": datetime.utcnow().isoformat(),
-            "phone": phone_number if phone_number else None
+            "phone": phone_number if phone_number else None,
+            "message_id": message_id,
+            "send_status": "queued"
         }
 
         if cc_list_normalised:
             email_archive_entry["cc"] = cc_list_normalised
         if bcc_list_normalised:
             email_archive_entry["bcc"] = bcc_list_normalised
-        email_archive_entry["resume_attached"] = bool(attach_resume and (email_sender.resume_file or resume_path or resume_file))
+        email_archive_entry["resume_attached"] = bool(stored_upload)
 
         archive_email_metadata(email_archive_entry)
+        send_metrics.lap('archive_write')
 
-        if sender_override:
-            # Load email.json from repo root and try to find matching entry
-            try:
-                print(f"\n=== Using sender email from selection: {sender_override} ===")
-                email_json_path = os.path.join(os.getcwd(), 'email.json')
-                if os.path.exists(email_json_path):
-                    with open(email_json_path, 'r') as ef:
-                        emails_data = json.load(ef)
-                    print(f"✅ Loaded email.json with {len(emails_data)} email entries")
-                else:
-                    emails_data = {}
-                    print(f"⚠️ email.json not found at {email_json_path}")
-
-                # emails_data format: { "email@x.com": [ { name, phone_number, smtp_username, smtp_password } ] }
-                smtp_pw = None
-                sender_name = None
-                if sender_override in emails_data and isinstance(emails_data[sender_override], list) and len(emails_data[sender_override])>0:
-                    first = emails_data[sender_override][0]
-                    smtp_pw = first.get('smtp_password') or first.get('app_password')
-                    sender_name = first.get('name')
-                    print(f"✅ Found SMTP credentials for {sender_override} (Name: {sender_name})")
-                else:
-                    print(f"⚠️ Email {sender_override} not found in email.json")
-
-                # Fallback to environment if password not found
-                if not smtp_pw:
-                    smtp_pw = os.getenv('SMTP_PASSWORD', '')
-                    print(f"⚠️ Using fallback SMTP password from environment variables")
-
-                if not smtp_pw:
-                    print(f"❌ No SMTP password found for {sender_override}")
-                    return jsonify({'success': False, 'error': f'No SMTP password found for selected email: {sender_override}'}), 400
-
-                # Create a temporary EmailSender for this send so we don't mutate global
-                temp_sender = EmailSender(sender_email=sender_override, app_password=smtp_pw, resume_file=email_sender.resume_file)
-                # Preserve the original filename so attachment uses original name, not temp filename
-                if hasattr(email_sender, '_original_filename'):
-                    temp_sender._original_filename = email_sender._original_filename
-                print(f"📧 Sending email using {sender_override}")
-
-                success = temp_sender.send_email(
-                    recruiter_email=recruiter_email,
-                    recruiter_name=recruiter_name,
-                    subject=subject,
-                    body=body,
-                    attach_resume=attach_resume,
-                    cc=cc if cc else None,
-                    bcc=bcc if bcc else None
-                )
-            except Exception as e:
-                print(f'❌ Error preparing sender override: {e}')
-                import traceback
-                traceback.print_exc()
-                success = False
-        else:
-            # Use default configured email_sender instance
-            success = email_sender.send_email(
-                recruiter_email=recruiter_email,
-                recruiter_name=recruiter_name,
-                subject=subject,
-                body=body,
-                attach_resume=attach_resume,
-                cc=cc if cc else None,
-                bcc=bcc if bcc else None
-            )
-        
-        if success:
-            print(f"✅ Email sent successfully to {recruiter_email}")
-            return jsonify({'success': True, 'message': 'Email sent successfully'}), 200
-        else:
-            return jsonify({'success': False, 'error': 'Failed to send email'}), 500
+        try:
+            email_outbox.enqueue(sender_address, {
+                "recruiter_email": recruiter_email,
+                "recruiter_name": recruiter_name,
+                "subject": subject,
+                "body": body,
+                "cc": cc or None,
+                "bcc": bcc or None,
+                "original_filename": stored_upload.filename if stored_upload else None
+            }, attachment_digest=stored_upload.digest if stored_upload else None, message_id=message_id)
+        except Exception as enqueue_error:
+            # Archived first so the worker's status updates always find the entry; never leave it 'queued'
+            update_archive_send_status(message_id, 'failed', {'error': f"Could not queue: {enqueue_error}"})
+            raise
+        send_metrics.lap('enqueue')
+        send_metrics.annotate(message_id=message_id)
+        print(f"📮 Email to {recruiter_email} queued as {message_id}")
+        return jsonify({'success': True, 'queued': True, 'message_id': message_id, 'status': 'queued',
+                        'message': 'Email queued for delivery'}), 202
         
     except Exception as e:
-        print(f"❌ Error sending email: {str(e)}")
+        print(f"❌ Error queueing email: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
-    
-    finally:
-        # Clean up temp file if created
-        if temp_path and os.path.exists(temp_path):
+
+@app.route('/outbox/<message_id>', methods=['GET'])
+def outbox_message_status(message_id):
+    """Delivery status of a queued email: status, attempts, last_error, sent_at"""
+    message = email_outbox.get(message_id)
+    if message is None:
+        return jsonify({'error': 'Unknown message id'}), 404
+    return jsonify(message), 200
+
+@app.route('/outbox', methods=['GET'])
+def outbox_messages():
+    """Counts per status plus recent messages; ?status=dead lists the dead-letter queue"""
+    try:
+        status = request.args.get('status')
+        limit = min(int(request.args.get('limit', 100)), 500)
+        return jsonify({'counts': email_outbox.counts(), 'messages': email_outbox.list_messages(status, limit)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/outbox/<message_id>/retry', methods=['POST'])
+def outbox_retry(message_id):
+    """Re-queue a dead-lettered email"""
+    if not email_outbox.retry(message_id):
+        return jsonify({'success': False, 'error': 'Message is not in the dead-letter queue'}), 409
+    return jsonify({'success': True, 'message_id': message_id, 'status': 'queued'}), 200
+
+@app.route('/mail_stats', methods=['GET'])
+def mail_stats():
+    """Send-path counters: pooled SMTP sessions, cached attachment parts and stored uploads"""
+    return jsonify({'smtp_pool': smtp_pool.snapshot(), 'attachment_cache': attachment_cache.snapshot(),
+                    'uploads': upload_store.snapshot()}), 200
+
+@app.route('/send_metrics', methods=['GET'])
+def send_metrics_view():
+    """
+    Stage latency histograms by sender account: ?sender= and ?operation= filter
+    (operations: send_email_request, outbox_delivery, bulk_delivery, deliver)
+    """
+    return jsonify(send_metrics.snapshot(request.args.get('sender'), request.args.get('operation'))), 200
+
+
+@app.route('/send_bulk', methods=['POST'])
+def send_bulk():
+    """
+    Send one personalised email per recipient, in parallel over pooled SMTP
+    connections and throttled to the sender account's daily and per-minute quotas.
+
+    JSON body: recipients ([{"email", "name", "company", "role", "location",
+    "resume_path"}] or plain addresses), subject and body templates using the
+    mail_merge.MERGE_FIELDS placeholders (e.g. {first_name}, {company|your team}),
+    optional jd_analysis (company, role and location shared by all recipients,
+    e.g. the /extract_jd result; its recruiter fields are ignored), sender_email,
+    resume_path (default resume) and attach_resume.
+    Templates and recipients are validated before anything is sent; with
+    "validate_only": true the response is the validation result plus a preview.
+    Recipients already emailed about the same subject within
+    DUPLICATE_SEND_WINDOW_DAYS are skipped unless "allow_duplicates": true.
+    Batches that the per-minute throttle could not finish within the request
+    deadline are rejected up front with "max_recipients" set.
+    Streams one NDJSON line per recipient as it finishes, then a summary line.
+    Successfully sent emails are added to the archive.
+    """
+    try:
+        data = request.get_json() or {}
+        subject = data.get('subject', 'Application for Position')
+        body = data.get('body', '')
+        attach_resume = bool(data.get('attach_resume', True))
+        resume_path = data.get('resume_path', '')
+        sender_override = data.get('sender_email') or data.get('from_email')
+        shared_fields = data.get('jd_analysis') if isinstance(data.get('jd_analysis'), dict) else {}
+
+        recipients = [MergeRecipient.from_value(recipient, shared_fields)
+                      for recipient in data.get('recipients') or [] if isinstance(recipient, (str, dict))]
+        # One email per address even if the list repeats it
+        unique_recipients = {}
+        for recipient in recipients:
+            if recipient.email:
+                unique_recipients.setdefault(recipient.email.lower(), recipient)
+        recipients = list(unique_recipients.values())
+        allow_duplicates = bool(data.get('allow_duplicates', False))
+
+        if not recipients:
+            return jsonify({'success': False, 'error': 'At least one recipient email is required'}), 400
+        if len(recipients) > BULK_MAX_RECIPIENTS:
+            return jsonify({'success': False, 'error': f'At most {BULK_MAX_RECIPIENTS} recipients per bulk send'}), 400
+        if resume_path and not os.path.exists(resume_path):
+            return jsonify({'success': False, 'error': f'Resume not found: {resume_path}'}), 400
+        # The batch is streamed from this request, so it must finish before the worker is
+        # killed (gunicorn --timeout); a killed worker leaves a half-sent, half-archived batch
+        budget = remaining_budget()
+        budget = REQUEST_DEADLINE_SECONDS if budget is None else budget
+        if bulk_engine.estimated_seconds(len(recipients)) > budget:
+            max_recipients = bulk_engine.max_recipients_within(budget)
+            return jsonify({
+                'success': False,
+                'error': f'{len(recipients)} recipients need about {bulk_engine.estimated_seconds(len(recipients)):.0f}s '
+                         f'at {bulk_engine.per_minute:g}/min, longer than one request may run ({budget:.0f}s); '
+                         f'split the list into batches of at most {max_recipients}',
+                'max_recipients': max_recipients
+            }), 400
+
+        try:
+            sender = resolve_sender(sender_override, resume_file=resume_path)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        profile = sender_registry.get(sender.sender_email)
+        merge = MailMerge(subject, body, sender_fields={
+            'sender_name': profile.name, 'sender_phone': profile.phone, 'sender_linkedin': profile.linkedin_url
+        } if profile else None)
+        errors = merge.validate(recipients, attach_resume)
+        if data.get('validate_only'):
+            preview = [dict(zip(('to', 'subject', 'body'), (r.email, *merge.render(r)))) for r in recipients[:3]]
+            duplicates = []
+            if not allow_duplicates:
+                for r in recipients:
+                    reason = recipient_index.duplicate_reason(r.email, merge.render_subject(r))
+                    if reason:
+                        duplicates.append({'email': r.email, 'reason': reason})
+            return jsonify({'success': not errors, 'valid': not errors, 'errors': errors,
+                            'recipients': len(recipients), 'duplicates': duplicates, 'preview': preview}), 200
+        if errors:
+            return jsonify({'success': False, 'error': errors[0], 'errors': errors}), 400
+        print(f"\n=== Bulk send: {len(recipients)} recipients from {sender.sender_email} ===")
+    except Exception as e:
+        print(f"❌ Error starting bulk send: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    def skip_duplicate(recipient, rendered_subject):
+        # Recipients already emailed about the same subject recently are skipped, not failed
+        try:
+            return recipient_index.duplicate_reason(recipient.email, rendered_subject)
+        except Exception as index_error:
+            print(f"⚠️ Recipient index lookup failed for {recipient.email}: {index_error}")
+            return None
+
+    def archive_sent(result):
+        # Runs on the engine's worker threads, so every sent email is archived
+        # even if the client disconnects or the streaming request is killed
+        recipient = recipients[result['index']]
+        sent_subject, sent_body = merge.render(recipient)
+        attached_resume = recipient.resume_path or sender.resume_file
+        archive_email_metadata({
+            "to_email": result['email'],
+            "name": result['name'],
+            "subject": sent_subject,
+            "from_email": sender.sender_email,
+            "body": sent_body,
+            "timestamp": datetime.utcnow().isoformat(),
+            "phone": None,
+            "resume_attached": bool(attach_resume and attached_resume and os.path.exists(attached_resume)),
+            "send_status": "sent"
+        })
+
+    def generate():
+        started = time.perf_counter()
+        updates = queue.Queue()
+
+        def progress(result, done, total):
+            if result['success']:
+                archive_sent(result)
+            updates.put((result, done))
+
+        def run():
             try:
-                os.remove(temp_path)
-            except:
-                pass
-        if hasattr(email_sender, '_original_filename'):
-            delattr(email_sender, '_original_filename')
+                bulk_engine.send(sender, recipients, merge, attach_resume, progress=progress,
+                                 guard=None if allow_duplicates else skip_duplicate)
+            except Exception as e:
+                updates.put(e)
+            finally:
+                updates.put(None)
+
+        threading.Thread(target=run, name='bulk-send-driver', daemon=True).start()
+        counts = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+        while True:
+            update = updates.get()
+            if update is None:
+                break
+            if isinstance(update, Exception):
+                print(f"❌ Bulk send aborted: {update}")
+                yield json.dumps({'error': str(update)}) + '\n'
+                continue
+            result, done = update
+            if result['success']:
+                counts['succeeded'] += 1
+            elif result.get('skipped'):
+                counts['skipped'] += 1
+            else:
+                counts['failed'] += 1
+            yield json.dumps({**result, 'completed': done, 'total': len(recipients)}, ensure_ascii=False) + '\n'
+
+        summary = {
+            'done': True,
+            'total': len(recipients),
+            **counts,
+            'remaining_today': bulk_engine.throttle_for(sender.sender_email).remaining_today(),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+        print(f"✅ Bulk send finished: {counts['succeeded']} sent, {counts['failed']} failed, {counts['skipped']} skipped")
+        yield json.dumps(summary) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/extract_jd', methods=['POST'])
 def extract_jd():
@@ -1389,7 +1756,6 @@ def extract_jd():
         # Use ResumeOptimizer or create a simple extraction
         try:
             from langchain_groq import ChatGroq
-            from langchain_core.messages import HumanMessage, SystemMessage
             
             groq_key = os.getenv("GROQ_API_KEY")
             if groq_key:
@@ -1399,43 +1765,18 @@ def extract_jd():
                     api_key=groq_key
                 )
                 
-                system_prompt = """You are an expert job description analyzer. Extract the following information from the job description in JSON format:
-{
-  "recruiter_name": "Name of recruiter or hiring manager if mentioned",
-  "company_name": "Company name",
-  "location": "Job location (city, state, country)",
-  "key_focus": "Key technologies/skills mentioned (comma-separated)",
-  "linkedin_note": "Generate a professional LinkedIn connection note mentioning: years of experience (assume 10+), key skills from JD, and phone number: 9733271133. Keep it brief and professional."
-}
-
-Only return valid JSON, no additional text."""
-
-                messages = [
-                    SystemMessage(content=system_prompt),
-                    HumanMessage(content=f"Job Description:\n\n{job_description}")
-                ]
+                messages = jd_summary_messages(job_description)
+                
+                extracted_data = invoke_structured(groq_model, messages, JD_SUMMARY_SCHEMA, call_type='jd_summary', hedge=True)
                 
-                response = groq_model.invoke(messages)
-                result_text = response.content.strip()
+                # Ensure all fields exist
+                result = {field: extracted_data.get(field) or '' for field in JD_SUMMARY_FIELDS}
                 
-                # Try to extract JSON from response
-                import json
-                json_match = re.search(r'\{[^}]+\}', result_text, re.DOTALL)
-                if json_match:
-                    extracted_data = json.loads(json_match.group())
-                    
-                    # Ensure all fields exist
-                    result = {
-                        'recruiter_name': extracted_data.get('recruiter_name', ''),
-                        'company_name': extracted_data.get('company_name', ''),
-                        'location': extracted_data.get('location', ''),
-                        'key_focus': extracted_data.get('key_focus', ''),
-                        'linkedin_note': extracted_data.get('linkedin_note', '')
-                    }
-                    
-                    print(f"✅ JD extracted: {result['company_name']}")
-                    return jsonify(result), 200
+                print(f"✅ JD extracted: {result['company_name']}")
+                return jsonify(result), 200
                 
+        except StructuredOutputError as ai_error:
+            print(f"⚠️ AI extraction returned invalid JSON: {ai_error.errors[:3]}, using fallback")
         except Exception as ai_error:
             print(f"⚠️ AI extraction failed: {ai_error}, using fallback")
         
@@ -1474,6 +1815,40 @@ Only return valid JSON, no additional text."""
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness plus LLM circuit-breaker state; status is 'degraded' while any circuit is not closed"""
+    circuits = get_circuit_states()
+    degraded = any(state['state'] != 'closed' for state in circuits.values())
+    return jsonify({
+        'status': 'degraded' if degraded else 'ok',
+        'llm_circuits': circuits
+    }), 200
+
+@app.route('/llm_stats', methods=['GET'])
+def llm_stats():
+    """LLM counters: structured-output outcomes, hedge win rate, latency, response-cache hits and near-duplicate reuse"""
+    return jsonify({
+        'structured_output': get_structured_output_stats(),
+        'hedging': get_hedge_stats(),
+        'latency': llm_latency.summary(),
+        'jd_response_cache': jd_response_cache.stats(),
+        'jd_near_duplicates': jd_index.reuse_report()
+    }), 200
+
+@app.route('/llm_token_limits', methods=['GET', 'POST'])
+def llm_token_limits():
+    """
+    GET: per-call-type max_tokens, observed output-length percentiles, truncations
+    and the learned recommendation. POST: apply the recommendations and save them.
+    """
+    try:
+        changed = token_limits.learn() if request.method == 'POST' else {}
+        return jsonify({'limits': token_limits.report(), 'updated': changed}), 200
+    except Exception as e:
+        print(f"❌ Error updating token limits: {e}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5002)
 
@@ -0,0 +1,106 @@
+import email.policy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.message import EmailMessage, MIMEPart
+from typing import Dict, Tuple
+
+
+@dataclass(frozen=True)
+class AttachmentData:
+    """File content to attach, already in memory; ``digest`` (SHA-256) keys the cache."""
+    data: bytes
+    filename: str
+    digest: str = ''
+
+    def cache_digest(self) -> str:
+        return self.digest or hashlib.sha256(self.data).hexdigest()
+
+
+def mime_type_for(filename: str) -> Tuple[str, str]:
+    """(maintype, subtype) for a resume file name; unknown extensions are sent as PDF"""
+    file_ext = os.path.splitext((filename or '').lower())[1]
+    if file_ext == '.docx':
+        return 'application', 'vnd.openxmlformats-officedocument.wordprocessingml.document'
+    if file_ext == '.doc':
+        return 'application', 'msword'
+    return 'application', 'pdf'
+
+
+class AttachmentCache:
+    """
+    LRU cache of ready-to-send MIME attachment parts.
+
+    Files are keyed by (path, size, mtime, filename, content type), so editing
+    or replacing a resume invalidates its entry automatically; in-memory
+    attachments are keyed by their content hash. A cached part
+    already holds the base64 body, so sending the same resume to many
+    recipients (from any sender) reads and encodes the file once. Entries are
+    evicted least-recently-used once their encoded size exceeds ``max_bytes``;
+    files larger than the whole budget are never cached.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._parts: "OrderedDict[Tuple, Tuple[MIMEPart, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get_part(self, path: str, filename: str, maintype: str, subtype: str) -> MIMEPart:
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_size, st.st_mtime_ns, filename, maintype, subtype)
+
+        def load() -> bytes:
+            with open(path, 'rb') as f:
+                return f.read()
+        return self._get_or_build(key, load, filename, maintype, subtype)
+
+    def get_part_for(self, attachment: AttachmentData, maintype: str, subtype: str) -> MIMEPart:
+        key = ('sha256', attachment.cache_digest(), attachment.filename, maintype, subtype)
+        return self._get_or_build(key, lambda: attachment.data, attachment.filename, maintype, subtype)
+
+    def _get_or_build(self, key: Tuple, load, filename: str, maintype: str, subtype: str) -> MIMEPart:
+        with self._lock:
+            entry = self._parts.get(key)
+            if entry is not None:
+                self._parts.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+
+        data = load()
+        part = MIMEPart(policy=email.policy.default)
+        part.set_content(data, maintype=maintype, subtype=subtype, filename=filename)
+        cost = len(part.get_payload())
+
+        if cost <= self.max_bytes:
+            with self._lock:
+                if key not in self._parts:
+                    self._parts[key] = (part, cost)
+                    self._bytes += cost
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted_cost) = self._parts.popitem(last=False)
+                    self._bytes -= evicted_cost
+                    self.stats['evictions'] += 1
+        return part
+
+    def attach(self, msg: EmailMessage, path: str, filename: str, maintype: str, subtype: str) -> None:
+        """Equivalent of msg.add_attachment(file bytes, ...) using the cached part."""
+        part = self.get_part(path, filename, maintype, subtype)
+        msg.make_mixed()
+        msg.attach(part)
+
+    def attach_data(self, msg: EmailMessage, attachment: AttachmentData, maintype: str, subtype: str) -> None:
+        part = self.get_part_for(attachment, maintype, subtype)
+        msg.make_mixed()
+        msg.attach(part)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, 'entries': len(self._parts), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+
+attachment_cache = AttachmentCache(max_bytes=int(os.getenv('ATTACHMENT_CACHE_MAX_MB', '32')) * 1024 * 1024)
@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from llm_client import RateLimiter
+from mail_merge import MailMerge, MergeRecipient
+from recipient_index import RecipientIndex, recipient_index
+from send_metrics import send_metrics
+
+# Gmail allows ~500 recipients/day on personal accounts (2000 on Workspace) and
+# throttles bursts; stay under both per sending account
+BULK_DAILY_LIMIT = int(os.getenv('BULK_DAILY_LIMIT', '500'))
+BULK_PER_MINUTE = float(os.getenv('BULK_PER_MINUTE', '20'))
+BULK_CONNECTIONS_PER_SENDER = int(os.getenv('BULK_CONNECTIONS_PER_SENDER', '2'))
+# Longest a recipient waits for a burst slot before it is reported as throttled
+BULK_SLOT_WAIT_SECONDS = float(os.getenv('BULK_SLOT_WAIT_SECONDS', '300'))
+
+
+class SenderThrottle:
+    """
+    Quota for one sending account: a rolling 24h recipient cap kept in the
+    shared recipient index (so every worker draws from the same quota and it
+    survives restarts) plus a token bucket for bursts, whose concurrency cap
+    is the number of SMTP connections used in parallel.
+    """
+
+    def __init__(self, sender_email: str, daily_limit: int, per_minute: float, max_connections: int,
+                 ledger: RecipientIndex):
+        self.sender_email = sender_email
+        self.daily_limit = daily_limit
+        self.max_connections = max(int(max_connections), 1)
+        self.burst = RateLimiter(requests_per_minute=per_minute, max_concurrency=self.max_connections)
+        self.ledger = ledger
+
+    def reserve_daily(self, recipient: str) -> Optional[int]:
+        """Claim one recipient from today's quota; a reservation id, or None once it is used up."""
+        return self.ledger.reserve_send(self.sender_email, recipient, self.daily_limit)
+
+    def refund_daily(self, reservation: int) -> None:
+        """Give back a reservation for a message that was never accepted."""
+        self.ledger.release_send(reservation)
+
+    def remaining_today(self) -> int:
+        return max(self.daily_limit - self.ledger.sends_today(self.sender_email), 0)
+
+
+class BulkSendEngine:
+    """
+    Send one message per recipient over several pooled SMTP connections per
+    sender in parallel, throttled per account.
+
+    The daily quota is counted in ``ledger`` (the shared recipient index by
+    default), so it holds across workers and restarts.
+    """
+
+    def __init__(self, daily_limit: int = BULK_DAILY_LIMIT, per_minute: float = BULK_PER_MINUTE,
+                 connections_per_sender: int = BULK_CONNECTIONS_PER_SENDER,
+                 ledger: Optional[RecipientIndex] = None):
+        self.daily_limit = daily_limit
+        self.per_minute = per_minute
+        self.connections_per_sender = connections_per_sender
+        self.ledger = ledger or recipient_index
+        self._throttles: Dict[str, SenderThrottle] = {}
+        self._lock = threading.Lock()
+
+    def estimated_seconds(self, count: int) -> float:
+        """
+        Least time the burst limit lets ``count`` recipients take: the first
+        ``connections_per_sender`` go out at once, the rest at ``per_minute``.
+        """
+        return max(count - max(int(self.connections_per_sender), 1), 0) * 60.0 / max(self.per_minute, 1.0)
+
+    def max_recipients_within(self, seconds: float) -> int:
+        """Largest batch whose estimated_seconds() fits in ``seconds``"""
+        return max(int(self.connections_per_sender), 1) + int(max(seconds, 0) * max(self.per_minute, 1.0) / 60.0)
+
+    def throttle_for(self, sender_email: str) -> SenderThrottle:
+        key = (sender_email or '').lower()
+        with self._lock:
+            throttle = self._throttles.get(key)
+            if throttle is None:
+                throttle = self._throttles[key] = SenderThrottle(
+                    key, self.daily_limit, self.per_minute, self.connections_per_sender, self.ledger
+                )
+            return throttle
+
+    def send(self, sender: Any, recipients: List[MergeRecipient], merge: MailMerge,
+             attach_resume: bool = True, progress: Optional[Callable[[Dict[str, Any], int, int], None]] = None,
+             guard: Optional[Callable[[MergeRecipient, str], Optional[str]]] = None) -> List[Dict[str, Any]]:
+        """
+        Send ``merge`` personalised for every recipient (with the recipient's own
+        resume when it names one) and return one result per recipient, in input
+        order. Validate the merge first; this does not. ``progress(result, done,
+        total)`` is called from worker threads as each recipient finishes.
+        ``guard(recipient, subject)`` may return a reason to skip a recipient
+        (e.g. already contacted); it runs before any quota is used.
+        """
+        throttle = self.throttle_for(sender.sender_email)
+        total = len(recipients)
+        results: List[Optional[Dict[str, Any]]] = [None] * total
+        state = {'done': 0}
+        state_lock = threading.Lock()
+
+        def deliver(index: int, recipient: MergeRecipient) -> None:
+            email, name = recipient.email, recipient.name
+            result = {'index': index, 'email': email, 'name': name, 'success': False}
+            started = time.perf_counter()
+            subject, body = merge.render(recipient)
+            skip_reason = guard(recipient, subject) if guard is not None else None
+            slot_wait_started = time.perf_counter()
+            reservation = quota_error = None
+            if not skip_reason:
+                try:
+                    reservation = throttle.reserve_daily(email)
+                except Exception as e:
+                    logging.warning(f"⚠️ Could not check the daily quota for {sender.sender_email}: {e}")
+                    quota_error = 'Could not check the daily sending quota'
+            if skip_reason:
+                result.update(error=skip_reason, skipped=True, duplicate=True)
+            elif quota_error:
+                result.update(error=quota_error, skipped=True)
+            elif reservation is None:
+                result.update(error='Daily sending quota reached for this account', skipped=True)
+            elif not throttle.burst.acquire(timeout=BULK_SLOT_WAIT_SECONDS):
+                throttle.refund_daily(reservation)
+                result.update(error='Timed out waiting for a send slot', skipped=True)
+            else:
+                try:
+                    with send_metrics.operation('bulk_delivery', sender.sender_email, recipient=email) as timing:
+                        timing.add('slot_wait', time.perf_counter() - slot_wait_started)
+                        sender.deliver(email, name, subject, body, attach_resume,
+                                       resume_file=recipient.resume_path or None)
+                    result['success'] = True
+                except Exception as e:
+                    throttle.refund_daily(reservation)
+                    result['error'] = str(e)
+                finally:
+                    throttle.burst.release()
+            result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            with state_lock:
+                state['done'] += 1
+                done = state['done']
+                results[index] = result
+            if progress is not None:
+                try:
+                    progress(result, done, total)
+                except Exception as e:
+                    logging.warning(f"⚠️ Bulk progress callback failed: {e}")
+
+        workers = min(throttle.max_connections, max(total, 1))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-send') as executor:
+            for future in [executor.submit(deliver, i, r) for i, r in enumerate(recipients)]:
+                future.result()
+        return results
+
+
+bulk_engine = BulkSendEngine()
@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import os
@@ -9,6 +10,10 @@ from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_groq import ChatGroq
 
+from deadlines import DeadlineExceeded
+from jd_similarity import jd_index
+from llm_client import CircuitOpenError, StructuredOutputError, invoke_structured
+
 # Load environment variables for Groq
 load_dotenv()
 
@@ -27,6 +32,30 @@ except Exception as e:
 
 parser = StrOutputParser()
 
+# Shape of the reply requested in extract_email_info_from_jd (validated in JSON mode)
+EMAIL_DRAFT_SCHEMA = {
+    "type": "object",
+    "required": ["intent", "recruiter", "email"],
+    "properties": {
+        "intent": {"type": ["string", "null"]},
+        "recruiter": {
+            "type": "object",
+            "properties": {
+                "name": {"type": ["string", "null"]},
+                "email": {"type": ["string", "null"]}
+            }
+        },
+        "email": {
+            "type": "object",
+            "required": ["subject", "body"],
+            "properties": {
+                "subject": {"type": "string"},
+                "body": {"type": "string"}
+            }
+        }
+    }
+}
+
 
 class EmailExtractor:
     """
@@ -41,6 +70,10 @@ class EmailExtractor:
     def extract_email_info_from_jd(self, cleaned_jd: str) -> str:
         try:
             years_exp = self.years_of_experience
+            reused = jd_index.find("email_draft", cleaned_jd, variant=years_exp)
+            if reused:
+                return json.dumps(self._retarget_draft(reused['payload'], cleaned_jd), indent=2)
+
             system_prompt = f"""
             You are an expert technical recruiter assistant. Analyze the input text (job description, recruiter email, LinkedIn message, or other hiring communication) and perform TWO tasks.
 
@@ -137,15 +170,13 @@ class EmailExtractor:
                     "email": {"subject": None, "body": None}
                 })
 
-            llm_raw_response = groq_model.invoke(messages)
-            parsed_response = parser.invoke(llm_raw_response)
-            json_candidate = self.clean_json_response(parsed_response)
-
-            if not self.is_valid_json(json_candidate):
-                logging.error("❌ LLM response is not valid JSON.")
-                return json_candidate
-
-            parsed_json: dict[str, Any] = json.loads(json_candidate)
+            try:
+                parsed_json: dict[str, Any] = invoke_structured(
+                    groq_model, messages, EMAIL_DRAFT_SCHEMA, call_type="email_draft", hedge=True
+                )
+            except StructuredOutputError as exc:
+                logging.error(f"❌ LLM response is not valid JSON: {exc.errors[:3]}")
+                return self.clean_json_response(exc.raw_text)
 
             # Normalise intent
             intent = (parsed_json.get('intent') or '').strip().lower()
@@ -187,7 +218,13 @@ class EmailExtractor:
                 "email": recruiter_email_clean
             }
 
+            # Outreach replies quote the recruiter's own message, so only posting-style drafts are reusable
+            if intent != "recruiter_outreach" and (parsed_json.get('email') or {}).get('body'):
+                jd_index.add("email_draft", cleaned_jd, parsed_json, variant=years_exp)
+
             return json.dumps(parsed_json, indent=2)
+        except (DeadlineExceeded, CircuitOpenError):
+            raise
         except Exception as exc:
             logging.error(f"❌ Failed to extract email info: {exc}")
             import traceback
@@ -198,6 +235,35 @@ class EmailExtractor:
                 "email": {"subject": None, "body": None}
             }, indent=2)
 
+    def fallback_email_info(self, text: Optional[str] = None) -> dict:
+        """
+        Deterministic (no LLM) extraction of the recruiter contact, used when the
+        LLM is too slow or its circuit is open. Subject and body are left empty.
+        """
+        text = text if text is not None else self.email_text
+        emails = re.findall(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', text or '')
+        recruiter_email = emails[0] if emails else None
+        recruiter_name = self._derive_name_from_email(recruiter_email) if recruiter_email else None
+        return {
+            "intent": "other",
+            "recruiter": {"name": recruiter_name, "email": recruiter_email},
+            "email": {"subject": None, "body": None}
+        }
+
+    def _retarget_draft(self, draft: dict, text: str) -> dict:
+        """
+        Adapt a draft reused from a near-duplicate JD: recruiter fields are
+        re-extracted deterministically from ``text`` and the greeting follows them.
+        """
+        draft = copy.deepcopy(draft)
+        recruiter = self.fallback_email_info(text)["recruiter"]
+        draft["recruiter"] = recruiter
+        body = (draft.get("email") or {}).get("body")
+        if body:
+            body = re.sub(r'^\s*(Hello|Hi)\s+[^,\n]+\s*,', r'\1,', body, flags=re.IGNORECASE)
+            draft["email"]["body"] = self._ensure_prefixed_greeting(body, recruiter["name"] or "", greeting="Hello")
+        return draft
+
     def clean_json_response(self, raw_response: str) -> str:
         """
         Extract JSON from the LLM response, handling fenced code blocks gracefully.
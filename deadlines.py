@@ -0,0 +1,77 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the per-request time budget runs out before (or during) a slow call."""
+
+
+class Deadline:
+    """Absolute point in time by which the current request must finish."""
+
+    def __init__(self, seconds: float, label: str = 'request'):
+        self.label = label
+        self.budget = float(seconds)
+        self.expires_at = time.monotonic() + self.budget
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def __repr__(self) -> str:
+        return f"Deadline({self.label}, {self.remaining():.1f}s of {self.budget:.0f}s left)"
+
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar('request_deadline', default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def set_deadline(seconds: float, label: str = 'request') -> contextvars.Token:
+    """Install a deadline for the current context; pass the token to reset_deadline()."""
+    return _current_deadline.set(Deadline(seconds, label))
+
+
+def reset_deadline(token: contextvars.Token) -> None:
+    _current_deadline.reset(token)
+
+
+@contextmanager
+def deadline_scope(seconds: float, label: str = 'request'):
+    token = set_deadline(seconds, label)
+    try:
+        yield _current_deadline.get()
+    finally:
+        reset_deadline(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left on the current deadline, or None when no deadline is set."""
+    deadline = _current_deadline.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def timeout_for(default: float, what: str = 'call', floor: float = 0.5) -> float:
+    """
+    Timeout to use for a blocking call: the smaller of ``default`` and the
+    remaining budget. Raises DeadlineExceeded if less than ``floor`` seconds remain.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining < floor:
+        raise DeadlineExceeded(f"{what}: {deadline.label} deadline of {deadline.budget:.0f}s exceeded")
+    return min(default, remaining)
+
+
+def budget_note() -> str:
+    """Short log suffix with the remaining budget, e.g. ' [budget 42.1s left]'."""
+    remaining = remaining_budget()
+    return '' if remaining is None else f" [budget {remaining:.1f}s left]"
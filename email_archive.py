@@ -0,0 +1,500 @@
+import base64
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+EMAIL_ARCHIVE_DB_PATH = os.getenv('EMAIL_ARCHIVE_DB_PATH', os.path.join(os.getcwd(), 'sent_emails.db'))
+# The JSON file the archive used to be kept in; migrated into the database once, then renamed
+LEGACY_ARCHIVE_PATH = os.path.join(os.getcwd(), 'sent_emails.json')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    email_id TEXT,
+    message_id TEXT,
+    timestamp TEXT,
+    to_email TEXT,
+    from_email TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS emails_message ON emails (message_id);
+CREATE INDEX IF NOT EXISTS emails_match ON emails (timestamp, to_email, from_email);
+CREATE INDEX IF NOT EXISTS emails_recent ON emails (timestamp, seq);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS annotations (
+    email_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (email_id, key)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5 (
+    name, to_email, from_email, subject, phone, body, comment,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+"""
+
+# Records are read with their viewer comment, which lives in the annotations table
+_SELECT_RECORDS = ("SELECT e.seq, e.timestamp, e.record, a.value AS comment FROM emails e "
+                   "LEFT JOIN annotations a ON a.email_id = e.email_id AND a.key = 'comment'")
+_EMAIL_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Searchable record fields (also the FTS column names) and their bm25 weights
+SEARCH_FIELDS = ['name', 'to_email', 'from_email', 'subject', 'phone', 'body', 'comment']
+_SEARCH_WEIGHTS = [5.0, 5.0, 2.0, 4.0, 3.0, 1.0, 2.0]
+# Field filters accepted in search queries, e.g. "to:acme.com subject:\"data engineer\""
+SEARCH_FILTERS = {
+    'name': 'name', 'to': 'to_email', 'from': 'from_email', 'subject': 'subject',
+    'phone': 'phone', 'body': 'body', 'comment': 'comment',
+}
+_QUERY_TERM_RE = re.compile(r'(?:(\w+):)?(?:"([^"]*)"?|(\S+))')
+
+
+def fts_query(text: str) -> str:
+    """
+    Turn what a user typed into an FTS5 query: every term must match as a word
+    prefix, "quoted words" match as a phrase, and ``field:term`` limits a term
+    to one field. Punctuation is dropped, so input can never be a syntax error.
+    """
+    clauses = []
+    for match in _QUERY_TERM_RE.finditer(text or ''):
+        field, phrase, word = match.group(1), match.group(2), match.group(3)
+        column = SEARCH_FILTERS.get((field or '').lower())
+        if field and column is None:
+            # Not a filter (e.g. a time like 10:30): search the whole term
+            word = f"{field}:{word if phrase is None else phrase}"
+            phrase = None
+        tokens = re.findall(r'\w+', phrase if phrase is not None else word or '')
+        if not tokens:
+            continue
+        clause = '"' + ' '.join(tokens) + '"*'
+        clauses.append(f"{column} : {clause}" if column else clause)
+    return ' AND '.join(clauses)
+
+
+# Bump when counter_names() changes; databases with an older version rebuild their counters
+COUNTERS_VERSION = '2'
+
+
+def counter_names(record: Dict[str, Any]) -> List[str]:
+    """The counters one archived email contributes 1 to"""
+    names = ['total']
+    if record.get('resume_attached'):
+        names.append('with_resume')
+    if str(record.get('phone') or '').strip():
+        names.append('with_phone')
+    names.append('sender:' + (str(record.get('from_email') or '').strip().lower() or 'unknown'))
+    timestamp = str(record.get('timestamp') or '')
+    names.append('day:' + (timestamp[:10] if re.match(r'\d{4}-\d{2}-\d{2}', timestamp) else 'unknown'))
+    to_email = str(record.get('to_email') or '').strip().lower()
+    names.append('domain:' + (to_email.rsplit('@', 1)[1] if '@' in to_email else 'unknown'))
+    if record.get('send_status'):
+        names.append('status:' + str(record['send_status']))
+    return names
+
+
+def encode_cursor(timestamp: str, seq: int) -> str:
+    """Opaque page cursor: the (timestamp, seq) of the last email on a page"""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, seq]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        timestamp, seq = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return str(timestamp), int(seq)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid page cursor: {cursor!r}") from e
+
+
+class EmailArchive:
+    """
+    Every email we attempted to send, one row per email in SQLite (WAL mode,
+    shared by all workers).
+
+    Archiving is a single-row insert and a status or comment change is a
+    single-row update, so the cost of a send no longer grows with the size of
+    the history, and concurrent workers can't overwrite each other's records.
+    Pages are read newest first through a (timestamp, seq) index, and the
+    totals behind stats() are counters updated in the same transaction as
+    every insert or update (rebuild_counters() recomputes them).
+    Each row keeps the archived payload as JSON, exactly as it used to be
+    stored in sent_emails.json; export() reproduces that file.
+
+    Every email gets a stable id (``record['id']``) when it is archived.
+    Comments and other annotations are rows in a side table keyed by that id,
+    so saving one never touches the archived payload.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+        self._ensure_ids()
+        self._ensure_search_index()
+        self._ensure_counters()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> Dict[str, Any]:
+        record = json.loads(row['record'])
+        if row['comment'] is not None:
+            record['comment'] = row['comment']
+        return record
+
+    @staticmethod
+    def _index(conn: sqlite3.Connection, seq: int, record: Dict[str, Any], replace: bool = False) -> None:
+        """(Re)index a record for search; ``record`` must include its comment"""
+        if replace:
+            conn.execute('DELETE FROM emails_fts WHERE rowid = ?', (seq,))
+        placeholders = ', '.join('?' * (len(SEARCH_FIELDS) + 1))
+        conn.execute(f"INSERT INTO emails_fts (rowid, {', '.join(SEARCH_FIELDS)}) VALUES ({placeholders})",
+                     (seq, *(str(record.get(field) or '') for field in SEARCH_FIELDS)))
+
+    @staticmethod
+    def _annotate(conn: sqlite3.Connection, email_id: str, key: str, value: Optional[str]) -> None:
+        if value:
+            conn.execute('INSERT INTO annotations (email_id, key, value, updated_at) VALUES (?, ?, ?, ?) '
+                         'ON CONFLICT (email_id, key) DO UPDATE SET value = excluded.value, '
+                         'updated_at = excluded.updated_at', (email_id, key, value, time.time()))
+        else:
+            conn.execute('DELETE FROM annotations WHERE email_id = ? AND key = ?', (email_id, key))
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, name: str, delta: int = 1) -> None:
+        conn.execute('INSERT INTO counters (name, value) VALUES (?, ?) '
+                     'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value', (name, delta))
+
+    def _count(self, conn: sqlite3.Connection, record: Dict[str, Any], delta: int = 1) -> None:
+        for name in counter_names(record):
+            self._bump(conn, name, delta)
+
+    @staticmethod
+    def _row(record: Dict[str, Any]):
+        return (record.get('message_id'), record.get('timestamp') or '', record.get('to_email'),
+                record.get('from_email'), json.dumps(record, ensure_ascii=False))
+
+    def _insert(self, conn: sqlite3.Connection, record: Dict[str, Any]) -> str:
+        record = dict(record)
+        email_id = record.setdefault('id', uuid.uuid4().hex)
+        comment = record.pop('comment', None)
+        seq = conn.execute('INSERT INTO emails (email_id, message_id, timestamp, to_email, from_email, record) '
+                           'VALUES (?, ?, ?, ?, ?, ?)', (email_id, *self._row(record))).lastrowid
+        self._annotate(conn, email_id, 'comment', comment)
+        self._index(conn, seq, {**record, 'comment': comment})
+        self._count(conn, record)
+        return email_id
+
+    def append(self, record: Dict[str, Any]) -> str:
+        """Archive one email payload; returns its stable id (also stored as ``record['id']``)"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                email_id = self._insert(conn, record)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            return email_id
+
+    def _update(self, conn: sqlite3.Connection, row: sqlite3.Row, change: Callable[[Dict[str, Any]], None]) -> None:
+        record = json.loads(row['record'])
+        self._count(conn, record, -1)
+        change(record)
+        self._count(conn, record)
+        conn.execute('UPDATE emails SET message_id = ?, timestamp = ?, to_email = ?, from_email = ?, record = ? '
+                     'WHERE seq = ?', (*self._row(record), row['seq']))
+        self._index(conn, row['seq'], {**record, 'comment': row['comment']}, replace=True)
+
+    def update_by_message_id(self, message_id: str, change: Callable[[Dict[str, Any]], None]) -> bool:
+        """Apply ``change`` to the archived record for an outbox message (newest if repeated)"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(f'{_SELECT_RECORDS} WHERE e.message_id = ? ORDER BY e.seq DESC LIMIT 1',
+                                   (message_id,)).fetchone()
+                if row is not None:
+                    self._update(conn, row, change)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return row is not None
+
+    def set_annotation(self, email_id: str, key: str, value: Optional[str]) -> bool:
+        """Set (or, when empty, clear) one annotation on an archived email; False if the id is unknown"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT seq FROM emails WHERE email_id = ?', (email_id,)).fetchone()
+                if row is not None:
+                    self._annotate(conn, email_id, key, value)
+                    if key == 'comment':
+                        conn.execute('UPDATE emails_fts SET comment = ? WHERE rowid = ?', (value or '', row['seq']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return row is not None
+
+    def set_comment(self, email_id: str, comment: str) -> bool:
+        return self.set_annotation(email_id, 'comment', comment)
+
+    def annotations(self, email_id: str) -> Dict[str, str]:
+        with self._connect() as conn:
+            rows = conn.execute('SELECT key, value FROM annotations WHERE email_id = ?', (email_id,)).fetchall()
+        return {row['key']: row['value'] for row in rows}
+
+    def find_id(self, timestamp: str, to_email: str, from_email: str) -> Optional[str]:
+        """Stable id of the email matching (timestamp, to_email, from_email), for ids issued before stable ids"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT email_id FROM emails WHERE timestamp = ? AND to_email = ? AND from_email = ? '
+                               'ORDER BY seq LIMIT 1', (timestamp, to_email, from_email)).fetchone()
+        return row['email_id'] if row else None
+
+    @staticmethod
+    def is_email_id(value: str) -> bool:
+        return bool(_EMAIL_ID_RE.match(value or ''))
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Every archived record, oldest first"""
+        with self._connect() as conn:
+            for row in conn.execute(f'{_SELECT_RECORDS} ORDER BY e.seq'):
+                yield self._record(row)
+
+    def records(self) -> List[Dict[str, Any]]:
+        return list(self.iter_records())
+
+    def search(self, text: str, limit: int = 25, offset: int = 0,
+               sort: str = 'relevance') -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Records matching a search (see fts_query), best match first or, with
+        ``sort='recent'``, newest first. Returns (page of records, total matches).
+        """
+        query = fts_query(text)
+        if not query:
+            return [], 0
+        order = 'e.timestamp DESC, e.seq DESC' if sort == 'recent' else 'rank, e.seq DESC'
+        weights = ', '.join(str(weight) for weight in _SEARCH_WEIGHTS)
+        with self._connect() as conn:
+            total = conn.execute('SELECT COUNT(*) FROM emails_fts WHERE emails_fts MATCH ?', (query,)).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT e.record, a.value AS comment, bm25(emails_fts, {weights}) AS rank FROM emails_fts "
+                f"JOIN emails e ON e.seq = emails_fts.rowid "
+                f"LEFT JOIN annotations a ON a.email_id = e.email_id AND a.key = 'comment' "
+                f"WHERE emails_fts MATCH ? ORDER BY {order} LIMIT ? OFFSET ?", (query, limit, offset)
+            ).fetchall()
+        return [self._record(row) for row in rows], total
+
+    def _ensure_search_index(self) -> None:
+        """Index rows archived before full-text search existed (once, across workers)"""
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'fts_built'").fetchone():
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute("SELECT 1 FROM meta WHERE key = 'fts_built'").fetchone() is None:
+                    conn.execute('DELETE FROM emails_fts')
+                    for row in conn.execute(_SELECT_RECORDS).fetchall():
+                        self._index(conn, row['seq'], self._record(row))
+                    conn.execute("INSERT INTO meta (key, value) VALUES ('fts_built', ?)", (str(time.time()),))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def page(self, limit: int = 25, after: Optional[str] = None,
+             offset: int = 0) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of records, newest first, and the cursor for the next page
+        (None on the last page). With ``after`` (a cursor from a previous page)
+        the page is an index seek, however deep; ``offset`` is kept for
+        page-number clients.
+        """
+        with self._connect() as conn:
+            if after:
+                rows = conn.execute(
+                    f'{_SELECT_RECORDS} WHERE (e.timestamp, e.seq) < (?, ?) '
+                    f'ORDER BY e.timestamp DESC, e.seq DESC LIMIT ?', (*decode_cursor(after), limit + 1)
+                ).fetchall()
+            else:
+                rows = conn.execute(f'{_SELECT_RECORDS} ORDER BY e.timestamp DESC, e.seq DESC LIMIT ? OFFSET ?',
+                                    (limit + 1, offset)).fetchall()
+        page, more = rows[:limit], len(rows) > limit
+        next_cursor = encode_cursor(page[-1]['timestamp'], page[-1]['seq']) if more else None
+        return [self._record(row) for row in page], next_cursor
+
+    def _ensure_ids(self) -> None:
+        """Give rows archived before stable ids an id, and move their comments to the annotations table"""
+        with self._connect() as conn:
+            if 'email_id' in {row['name'] for row in conn.execute('PRAGMA table_info(emails)')}:
+                indexed = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'emails_id'")
+                if indexed.fetchone() and conn.execute(
+                        'SELECT 1 FROM emails WHERE email_id IS NULL LIMIT 1').fetchone() is None:
+                    return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if 'email_id' not in {row['name'] for row in conn.execute('PRAGMA table_info(emails)')}:
+                    conn.execute('ALTER TABLE emails ADD COLUMN email_id TEXT')
+                conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS emails_id ON emails (email_id)')
+                rows = conn.execute('SELECT seq, record FROM emails WHERE email_id IS NULL').fetchall()
+                for row in rows:
+                    record = json.loads(row['record'])
+                    email_id = record.setdefault('id', uuid.uuid4().hex)
+                    comment = record.pop('comment', None)
+                    conn.execute('UPDATE emails SET email_id = ?, record = ? WHERE seq = ?',
+                                 (email_id, json.dumps(record, ensure_ascii=False), row['seq']))
+                    self._annotate(conn, email_id, 'comment', comment)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        if rows:
+            print(f"🆔 Assigned stable ids to {len(rows)} archived email(s)")
+
+    def _ensure_counters(self) -> None:
+        """Build the counters once per COUNTERS_VERSION (across workers)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'counters_version'").fetchone()
+            if row and row['value'] == COUNTERS_VERSION:
+                return
+            # Rows archived before the timestamp column was always set would fall
+            # outside keyset pages ((timestamp, seq) < cursor is never true for NULL)
+            conn.execute("UPDATE emails SET timestamp = '' WHERE timestamp IS NULL")
+        self.rebuild_counters()
+
+    def rebuild_counters(self) -> int:
+        """Recompute every counter from the archived rows (read-only over emails); returns how many were counted"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                counts: Dict[str, int] = {}
+                rows = 0
+                for row in conn.execute('SELECT record FROM emails'):
+                    rows += 1
+                    for name in counter_names(json.loads(row['record'])):
+                        counts[name] = counts.get(name, 0) + 1
+                conn.execute('DELETE FROM counters')
+                conn.executemany('INSERT INTO counters (name, value) VALUES (?, ?)', counts.items())
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('counters_version', ?)",
+                             (COUNTERS_VERSION,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        print(f"📊 Archive counters rebuilt from {rows} email(s)")
+        return rows
+
+    def count(self) -> int:
+        """Number of archived emails, from the maintained counter"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM counters WHERE name = 'total'").fetchone()
+        return row['value'] if row else 0
+
+    def stats(self, days: int = 30, top: int = 20) -> Dict[str, Any]:
+        """
+        Archive totals from the maintained counters: overall counts plus emails
+        per sender, per recipient domain (``top`` largest), per day (last
+        ``days`` days with sends) and per send status. Totals are read by name
+        and each group is a range read on the counters primary key; the day
+        range stops after ``days`` rows, so old days are never read.
+        """
+        with self._connect() as conn:
+            totals = {row['name']: row['value'] for row in conn.execute(
+                "SELECT name, value FROM counters WHERE name IN ('total', 'with_resume', 'with_phone')")}
+
+            def group(prefix: str, order: str = 'value DESC, name', limit: int = -1) -> Dict[str, int]:
+                # "prefix:" <= name < "prefix;" is every name starting with "prefix:"
+                rows = conn.execute(f'SELECT name, value FROM counters WHERE name >= ? AND name < ? AND value > 0 '
+                                    f'ORDER BY {order} LIMIT ?', (prefix + ':', prefix + ';', limit))
+                return {row['name'][len(prefix) + 1:]: row['value'] for row in rows}
+
+            by_day = group('day', order='name DESC', limit=max(days, 0))
+            return {
+                'total': totals.get('total', 0),
+                'with_resume': totals.get('with_resume', 0),
+                'with_phone': totals.get('with_phone', 0),
+                'by_sender': group('sender'),
+                'by_day': dict(sorted(by_day.items())),
+                'by_domain': group('domain', limit=max(top, 0)),
+                'by_status': group('status', order='name'),
+            }
+
+    def migrate_from_json(self, path: str = LEGACY_ARCHIVE_PATH) -> int:
+        """
+        Import the old sent_emails.json once (across workers), then rename it to
+        ``<path>.migrated`` so it is clear it no longer receives writes.
+        Returns how many records were imported (0 when already migrated).
+        """
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+                return 0
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                imported = 0
+                if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone() is None:
+                    records = []
+                    if os.path.exists(path):
+                        with open(path, 'r', encoding='utf-8') as archive_file:
+                            loaded = json.load(archive_file)
+                        records = [record for record in loaded if isinstance(record, dict)] \
+                            if isinstance(loaded, list) else []
+                    for record in records:
+                        self._insert(conn, record)
+                    conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (str(time.time()),))
+                    imported = len(records)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        if imported and os.path.exists(path):
+            os.replace(path, path + '.migrated')
+            print(f"🗄️ Migrated {imported} archived email(s) from {os.path.basename(path)} into {self.db_path}")
+        return imported
+
+    def export(self, path: Optional[str] = None) -> str:
+        """The archive in the old sent_emails.json format; also written to ``path`` when given"""
+        text = json.dumps(self.records(), indent=2, ensure_ascii=False)
+        if path:
+            with open(path, 'w', encoding='utf-8') as export_file:
+                export_file.write(text)
+        return text
+
+
+email_archive = EmailArchive(EMAIL_ARCHIVE_DB_PATH)
+
+
+def main() -> None:
+    """python email_archive.py export [path]  |  migrate [json path]  |  rebuild-stats"""
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'export':
+        path = sys.argv[2] if len(sys.argv) > 2 else 'sent_emails_export.json'
+        email_archive.export(path)
+        print(f"📤 Exported {email_archive.count()} archived email(s) to {path}")
+    elif command == 'migrate':
+        imported = email_archive.migrate_from_json(sys.argv[2] if len(sys.argv) > 2 else LEGACY_ARCHIVE_PATH)
+        print(f"🗄️ Imported {imported} archived email(s)")
+    elif command == 'rebuild-stats':
+        email_archive.rebuild_counters()
+    else:
+        print(main.__doc__)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from attachment_cache import AttachmentData
+from send_metrics import send_metrics
+
+# Statuses an outbox message moves through; 'sent' and 'dead' are final
+QUEUED, SENDING, RETRYING, SENT, DEAD = 'queued', 'sending', 'retrying', 'sent', 'dead'
+
+OUTBOX_DB_PATH = os.getenv('OUTBOX_DB_PATH', os.path.join(os.getcwd(), 'outbox.db'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv('OUTBOX_BACKOFF_BASE_SECONDS', '30'))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv('OUTBOX_BACKOFF_MAX_SECONDS', '1800'))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '5'))
+
+
+def is_permanent_error(error: BaseException) -> bool:
+    """
+    Whether retrying cannot fix a delivery error: a bad queued message
+    (ValueError), or a 5xx rejection of the message or of every recipient.
+    4xx replies (e.g. Gmail's 421/451 4.7.x rate limiting) are temporary.
+    """
+    if isinstance(error, ValueError):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(code >= 500 for code in codes)
+    if isinstance(error, smtplib.SMTPDataError):
+        return error.smtp_code >= 500
+    return False
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    sender_email TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+class EmailOutbox:
+    """
+    Durable queue of outgoing emails in SQLite, drained by a background thread.
+
+    enqueue() stores the message (its attachment by content digest, see
+    upload_store) and returns an id straight away. The worker claims due messages, sends them,
+    and on failure reschedules with exponential backoff plus jitter; after
+    ``max_attempts`` (or a permanent SMTP rejection) the message is
+    dead-lettered and can be retried by hand. Messages left in 'sending' by a
+    crash are picked up again on start, so delivery is at-least-once.
+
+    ``resolve_sender(sender_email, resume_file, original_filename)`` builds the
+    EmailSender at delivery time, so passwords are never written to the queue;
+    ``load_attachment(digest)`` returns the attachment bytes.
+    ``on_status(message_id, status, details)`` is called on every transition.
+    """
+
+    def __init__(self, db_path: str, resolve_sender: Callable[..., Any],
+                 load_attachment: Optional[Callable[[str], bytes]] = None,
+                 on_status: Optional[Callable[[str, str, Dict[str, Any]], None]] = None,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, backoff_base: float = OUTBOX_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = OUTBOX_BACKOFF_MAX_SECONDS, poll_seconds: float = OUTBOX_POLL_SECONDS):
+        self.db_path = db_path
+        self.resolve_sender = resolve_sender
+        self.load_attachment = load_attachment
+        self.on_status = on_status
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit connection per operation; the worker thread and request threads never share one
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _notify(self, message_id: str, status: str, **details: Any) -> None:
+        if self.on_status is None:
+            return
+        try:
+            self.on_status(message_id, status, details)
+        except Exception as e:
+            logging.warning(f"⚠️ Outbox status callback failed for {message_id}: {e}")
+
+    def enqueue(self, sender_email: str, message: Dict[str, Any], attachment_digest: Optional[str] = None,
+                message_id: Optional[str] = None) -> str:
+        """
+        Queue one email. ``message`` holds the EmailSender.deliver arguments
+        (recruiter_email, recruiter_name, subject, body, cc, bcc) plus an optional
+        original_filename, the attachment's name. ``attachment_digest`` names a
+        blob that ``load_attachment`` can return at delivery time.
+        """
+        message_id = message_id or uuid.uuid4().hex
+        payload = dict(message)
+        if attachment_digest:
+            payload['attachment_digest'] = attachment_digest
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO outbox (id, status, sender_email, payload, next_attempt_at, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (message_id, QUEUED, sender_email, json.dumps(payload, ensure_ascii=False), now, now, now)
+            )
+        self._wake.set()
+        return message_id
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM outbox WHERE id = ?', (message_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_messages(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        query, params = 'SELECT * FROM outbox', []
+        if status:
+            query, params = query + ' WHERE status = ?', [status]
+        with self._connect() as conn:
+            rows = conn.execute(query + ' ORDER BY created_at DESC LIMIT ?', params + [limit]).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return {row['status']: row['n'] for row in conn.execute('SELECT status, COUNT(*) AS n FROM outbox GROUP BY status')}
+
+    def retry(self, message_id: str) -> bool:
+        """Put a dead-lettered message back in the queue."""
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                'UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ?, updated_at = ? WHERE id = ? AND status = ?',
+                (QUEUED, now, now, message_id, DEAD)
+            ).rowcount
+        if updated:
+            self._notify(message_id, QUEUED)
+            self._wake.set()
+        return bool(updated)
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        payload = json.loads(record.pop('payload'))
+        record['recruiter_email'] = payload.get('recruiter_email')
+        record['subject'] = payload.get('subject')
+        return record
+
+    def _claim_due(self) -> Optional[sqlite3.Row]:
+        """Atomically move the oldest due message to 'sending' (safe across worker processes)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT * FROM outbox WHERE status IN (?, ?) AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT 1',
+                    (QUEUED, RETRYING, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE outbox SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                                 (SENDING, now, row['id']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return row
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _finish(self, message_id: str, status: str, **fields: Any) -> None:
+        assignments = ', '.join(f"{name} = ?" for name in ['status', 'updated_at', *fields])
+        with self._connect() as conn:
+            conn.execute(f'UPDATE outbox SET {assignments} WHERE id = ?',
+                         (status, time.time(), *fields.values(), message_id))
+
+    def _deliver(self, row: sqlite3.Row) -> None:
+        message_id = row['id']
+        attempts = row['attempts'] + 1
+        payload = json.loads(row['payload'])
+        # Messages queued before attachments were stored by digest carry their own file copy
+        attachment_path = payload.get('attachment_path')
+        digest = payload.get('attachment_digest')
+        self._notify(message_id, SENDING, attempts=attempts)
+        try:
+            with send_metrics.operation('outbox_delivery', row['sender_email'], message_id=message_id,
+                                        attempt=attempts) as timing:
+                # How long the message sat due in the queue before a worker picked it up
+                timing.add('queue_wait', max(0.0, time.time() - row['next_attempt_at']))
+                attachment = None
+                if digest:
+                    try:
+                        with send_metrics.stage('load_attachment'):
+                            data = self.load_attachment(digest)
+                    except FileNotFoundError:
+                        raise ValueError('The queued attachment is no longer stored')
+                    attachment = AttachmentData(data, payload.get('original_filename') or 'resume.pdf', digest)
+                with send_metrics.stage('resolve_sender'):
+                    sender = self.resolve_sender(row['sender_email'], attachment_path or '',
+                                                 payload.get('original_filename'))
+                sender.deliver(
+                    payload['recruiter_email'], payload.get('recruiter_name', ''), payload.get('subject', ''),
+                    payload.get('body', ''), attach_resume=bool(attachment_path or attachment),
+                    cc=payload.get('cc'), bcc=payload.get('bcc'), attachment=attachment
+                )
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if is_permanent_error(e) or attempts >= self.max_attempts:
+                print(f"💀 Outbox {message_id} dead-lettered after {attempts} attempt(s): {error}")
+                self._finish(message_id, DEAD, last_error=error)
+                self._notify(message_id, DEAD, attempts=attempts, error=error)
+            else:
+                delay = self._backoff(attempts)
+                print(f"🔁 Outbox {message_id} attempt {attempts} failed ({error}); retrying in {delay:.0f}s")
+                self._finish(message_id, RETRYING, last_error=error, next_attempt_at=time.time() + delay)
+                self._notify(message_id, RETRYING, attempts=attempts, error=error)
+            return
+
+        sent_at = time.time()
+        self._finish(message_id, SENT, sent_at=sent_at, last_error=None)
+        self._notify(message_id, SENT, attempts=attempts, sent_at=sent_at)
+        if attachment_path and os.path.exists(attachment_path):
+            os.remove(attachment_path)
+
+    def _recover_interrupted(self) -> None:
+        """Messages a crashed worker left in 'sending' go back in the queue."""
+        with self._connect() as conn:
+            recovered = conn.execute(
+                'UPDATE outbox SET status = ?, next_attempt_at = ?, updated_at = ? WHERE status = ? AND updated_at < ?',
+                (RETRYING, time.time(), time.time(), SENDING, time.time() - 300)
+            ).rowcount
+        if recovered:
+            print(f"🔁 Outbox: re-queued {recovered} message(s) interrupted mid-send")
+
+    def drain(self) -> int:
+        """Deliver every message that is due now; returns how many were attempted."""
+        attempted = 0
+        while not self._stop.is_set():
+            row = self._claim_due()
+            if row is None:
+                return attempted
+            attempted += 1
+            self._deliver(row)
+        return attempted
+
+    def _run(self) -> None:
+        self._recover_interrupted()
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                logging.error(f"❌ Outbox worker error: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def jd_cache_key(raw_text: str, *parts: str) -> str:
+    """Stable cache key for a JD plus any options that change the LLM output."""
+    digest = hashlib.sha256((raw_text or '').strip().encode('utf-8'))
+    for part in parts:
+        digest.update(b'\x00')
+        digest.update((part or '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe in-memory LRU cache with a per-entry TTL.
+
+    Used to keep recent /clean_job_description results so a repeated or
+    prefetched JD is answered without another LLM call.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 1800):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class PrefetchManager:
+    """
+    Run JD extractions speculatively while the user is still editing.
+
+    Each editor session is identified by a client-chosen prefetch_id. Starting a
+    new prefetch for the same id cancels the previous one: a job still waiting
+    out its debounce delay never reaches the LLM, and a job already running has
+    its result discarded instead of cached. Jobs for the same cache key are
+    shared, so the real request can join an in-flight prefetch.
+    """
+
+    def __init__(self, cache: ResponseCache, max_workers: int = 2, debounce_seconds: float = 0.75):
+        self.cache = cache
+        self.debounce_seconds = debounce_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jd-prefetch')
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._by_session: Dict[str, Tuple[str, threading.Event]] = {}
+
+    def start(self, prefetch_id: str, key: str, compute: Callable[[], Optional[Any]]) -> str:
+        """Schedule ``compute`` for ``key``; returns 'cached', 'in_flight' or 'started'."""
+        if self.cache.get(key) is not None:
+            self.cancel(prefetch_id)
+            return 'cached'
+
+        with self._lock:
+            previous = self._by_session.get(prefetch_id)
+            if previous and previous[0] == key and key in self._in_flight:
+                return 'in_flight'
+            if previous:
+                previous[1].set()
+
+            cancelled = threading.Event()
+            self._by_session[prefetch_id] = (key, cancelled)
+            if key in self._in_flight:
+                return 'in_flight'
+
+            future = self._executor.submit(self._run, key, compute, cancelled)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _f, k=key: self._forget(k))
+            return 'started'
+
+    def cancel(self, prefetch_id: str) -> bool:
+        with self._lock:
+            previous = self._by_session.pop(prefetch_id, None)
+        if previous:
+            previous[1].set()
+            return True
+        return False
+
+    def wait_for(self, key: str, timeout: Optional[float] = None) -> Optional[Any]:
+        """Join an in-flight prefetch for ``key`` (if any) and return its result."""
+        with self._lock:
+            future = self._in_flight.get(key)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            logging.warning(f"⚠️ Prefetch for {key[:12]} did not complete: {e}")
+            return None
+
+    def _run(self, key: str, compute: Callable[[], Optional[Any]], cancelled: threading.Event) -> Optional[Any]:
+        # Debounce: rapid edits cancel this job before it spends an LLM call
+        if cancelled.wait(self.debounce_seconds):
+            logging.info(f"Prefetch {key[:12]} cancelled before start")
+            return None
+        result = compute()
+        if cancelled.is_set():
+            logging.info(f"Prefetch {key[:12]} finished after cancellation; result discarded")
+            return None
+        if result is not None:
+            self.cache.set(key, result)
+        return result
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+
+jd_response_cache = ResponseCache(
+    max_entries=int(os.getenv('JD_CACHE_MAX_ENTRIES', '256')),
+    ttl_seconds=float(os.getenv('JD_CACHE_TTL_SECONDS', '1800'))
+)
+jd_prefetcher = PrefetchManager(jd_response_cache, debounce_seconds=float(os.getenv('JD_PREFETCH_DEBOUNCE_SECONDS', '0.75')))
@@ -0,0 +1,28 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+
+# Fields returned by /extract_jd (validated in JSON mode). Kept out of app.py so
+# extraction_eval.py can import the prompt without starting the app.
+JD_SUMMARY_FIELDS = ['recruiter_name', 'company_name', 'location', 'key_focus', 'linkedin_note']
+JD_SUMMARY_SCHEMA = {
+    "type": "object",
+    "required": JD_SUMMARY_FIELDS,
+    "properties": {field: {"type": ["string", "null"]} for field in JD_SUMMARY_FIELDS}
+}
+JD_SUMMARY_PROMPT = """You are an expert job description analyzer. Extract the following information from the job description in JSON format:
+{
+  "recruiter_name": "Name of recruiter or hiring manager if mentioned",
+  "company_name": "Company name",
+  "location": "Job location (city, state, country)",
+  "key_focus": "Key technologies/skills mentioned (comma-separated)",
+  "linkedin_note": "Generate a professional LinkedIn connection note mentioning: years of experience (assume 10+), key skills from JD, and phone number: 9733271133. Keep it brief and professional."
+}
+
+Only return valid JSON, no additional text."""
+
+
+def jd_summary_messages(job_description: str) -> list:
+    """Prompt used by /extract_jd (also replayed by extraction_eval.py)"""
+    return [
+        SystemMessage(content=JD_SUMMARY_PROMPT),
+        HumanMessage(content=f"Job Description:\n\n{job_description}")
+    ]
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: the local dev server is a single process
+    fcntl = None
+
+SIMHASH_BITS = 64
+MIN_TOKENS = 25
+
+_EMAIL_RE = re.compile(r'\b[\w.%+-]+@[\w.-]+\.[a-z]{2,}\b', re.IGNORECASE)
+_URL_RE = re.compile(r'https?://\S+|www\.\S+', re.IGNORECASE)
+_PHONE_RE = re.compile(r'\+?\d[\d\s().-]{8,}\d')
+_SIGN_OFF_RE = re.compile(r'^\s*(thanks|thank you|regards|best regards|warm regards|sincerely|cheers)\b', re.IGNORECASE)
+_GREETING_RE = re.compile(r'^\s*(hi|hello|dear|greetings|good (morning|afternoon|evening))\b.{0,40}$|^\s*please (find|see|review)\b', re.IGNORECASE)
+
+
+def normalize_jd(text: str) -> List[List[str]]:
+    """
+    Per-line tokens of a JD with recruiter-specific noise removed (greeting,
+    signature block, emails, URLs, phone numbers, punctuation, case), so vendor
+    reposts of one role look alike.
+    """
+    lines = []
+    for line in (text or '').splitlines():
+        if _SIGN_OFF_RE.match(line):
+            break
+        if _GREETING_RE.match(line):
+            continue
+        line = _PHONE_RE.sub(' ', _URL_RE.sub(' ', _EMAIL_RE.sub(' ', line.lower())))
+        tokens = re.sub(r'[^a-z0-9+#]+', ' ', line).split()
+        if tokens:
+            lines.append(tokens)
+    return lines
+
+
+def simhash(lines: List[List[str]], shingle_size: int = 3) -> int:
+    """
+    64-bit SimHash over word shingles. Shingles never span lines, so reposts
+    that shuffle bullet points keep the same fingerprint.
+    """
+    weights = [0] * SIMHASH_BITS
+    shingles = defaultdict(int)
+    for tokens in lines:
+        for i in range(max(len(tokens) - shingle_size + 1, 1)):
+            shingles[' '.join(tokens[i:i + shingle_size])] += 1
+    for shingle, count in shingles.items():
+        h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if (h >> bit) & 1 else -count
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+@contextmanager
+def _locked_file(path: str, mode: str, exclusive: bool):
+    """Open ``path`` holding an flock shared with other workers; released on close"""
+    with open(path, mode) as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield f
+
+
+class NearDuplicateIndex:
+    """
+    Local SimHash index of previously analysed JDs, per namespace
+    ('email_draft', 'skills', 'job_parse', ...).
+
+    The fingerprint is split into max_distance + 1 bands; two hashes within
+    max_distance bits must agree exactly on at least one band, so a lookup is a
+    handful of dict probes followed by an exact Hamming check on the candidates.
+    Entries are appended to a JSONL file, and new lines written by other workers
+    are picked up on the next lookup. Workers append under an exclusive flock
+    and read under a shared one, and ``_offset`` is always a byte position taken
+    from the file itself, so it never lands inside another worker's line.
+    """
+
+    def __init__(self, path: str, similarity_threshold: float = 0.9):
+        self.path = path
+        self.enabled = True
+        self.similarity_threshold = similarity_threshold
+        self.max_distance = max(int(round((1 - similarity_threshold) * SIMHASH_BITS)), 0)
+        band_count = self.max_distance + 1
+        width = SIMHASH_BITS // band_count
+        self._bands = [(i * width, SIMHASH_BITS if i == band_count - 1 else (i + 1) * width) for i in range(band_count)]
+        self._entries: List[Dict[str, Any]] = []
+        self._buckets: Dict[Tuple[str, int, int], List[int]] = defaultdict(list)
+        self._offset = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {'lookups': 0, 'reused': 0, 'stored': 0})
+
+    def _band_keys(self, namespace: str, fingerprint: int):
+        for index, (start, end) in enumerate(self._bands):
+            yield (namespace, index, (fingerprint >> start) & ((1 << (end - start)) - 1))
+
+    def _add_entry(self, entry: Dict[str, Any]) -> None:
+        position = len(self._entries)
+        self._entries.append(entry)
+        for key in self._band_keys(entry['ns'], entry['simhash']):
+            self._buckets[key].append(position)
+
+    def _read_new(self, f) -> None:
+        """Index lines after ``_offset`` from an open (and flocked) binary handle."""
+        f.seek(self._offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # partially written line; read it next time
+            self._offset += len(line)
+            try:
+                self._add_entry(json.loads(line))
+            except (ValueError, KeyError):
+                continue
+
+    def _refresh(self) -> None:
+        """Read lines appended since the last refresh (ours or another worker's)."""
+        try:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) <= self._offset:
+                return
+            with _locked_file(self.path, 'rb', exclusive=False) as f:
+                self._read_new(f)
+        except Exception as e:
+            logging.warning(f"⚠️ Could not refresh JD index {self.path}: {e}")
+
+    def find(self, namespace: str, text: str, variant: str = '') -> Optional[Dict[str, Any]]:
+        """Return {'payload', 'similarity'} for the closest earlier JD within the threshold."""
+        if not self.enabled:
+            return None
+        lines = normalize_jd(text)
+        with self._lock:
+            self.stats[namespace]['lookups'] += 1
+            if sum(map(len, lines)) < MIN_TOKENS:
+                return None
+            fingerprint = simhash(lines)
+            self._refresh()
+            best = None
+            seen = set()
+            for key in self._band_keys(namespace, fingerprint):
+                for position in self._buckets.get(key, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    entry = self._entries[position]
+                    if entry.get('variant', '') != variant:
+                        continue
+                    distance = hamming(fingerprint, entry['simhash'])
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, entry)
+            if best is None:
+                return None
+            self.stats[namespace]['reused'] += 1
+        similarity = 1 - best[0] / SIMHASH_BITS
+        logging.info(f"♻️ Near-duplicate JD for {namespace} (similarity {similarity:.2f})")
+        return {'payload': best[1]['payload'], 'similarity': round(similarity, 3)}
+
+    def add(self, namespace: str, text: str, payload: Any, variant: str = '') -> None:
+        if not self.enabled:
+            return
+        lines = normalize_jd(text)
+        if sum(map(len, lines)) < MIN_TOKENS:
+            return
+        entry = {'ns': namespace, 'variant': variant, 'simhash': simhash(lines), 'ts': time.time(), 'payload': payload}
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            try:
+                # Catch up and append under one exclusive lock, so no other worker's
+                # line can land between what we have read and what we write
+                with _locked_file(self.path, 'ab+', exclusive=True) as f:
+                    self._read_new(f)
+                    f.write(line)
+                    f.flush()
+                    self._offset = f.tell()
+                self._add_entry(entry)
+                self.stats[namespace]['stored'] += 1
+            except Exception as e:
+                logging.warning(f"⚠️ Could not store JD in index {self.path}: {e}")
+
+    def reuse_report(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            report = {ns: dict(counts) for ns, counts in self.stats.items()}
+        for counts in report.values():
+            counts['reuse_rate'] = round(counts['reused'] / counts['lookups'], 3) if counts['lookups'] else None
+        return {'similarity_threshold': self.similarity_threshold, 'entries': len(self._entries), 'namespaces': report}
+
+
+jd_index = NearDuplicateIndex(
+    os.getenv('JD_INDEX_PATH', os.path.join(os.getcwd(), 'jd_index.jsonl')),
+    similarity_threshold=float(os.getenv('JD_NEAR_DUP_THRESHOLD', '0.9'))
+)
@@ -6,10 +6,27 @@ from langchain_groq import ChatGroq
 from langchain_core.messages import SystemMessage, HumanMessage
 from dotenv import load_dotenv
 import os
+import copy
 import logging
+from cleaning_jd import EmailExtractor
+from deadlines import DeadlineExceeded, timeout_for
+from jd_similarity import jd_index
+from llm_client import CircuitOpenError, StructuredOutputError, invoke_structured
 
 load_dotenv()
 
+_NULLABLE_STRING = {"type": ["string", "null"]}
+
+# Fields requested from the LLM in _enhance_with_llm
+JOB_PARSE_SCHEMA = {
+    "type": "object",
+    "required": ["title", "company", "location", "recruiter_name", "phone", "email", "visa_type", "jd", "requirements"],
+    "properties": {
+        field: _NULLABLE_STRING
+        for field in ["title", "company", "location", "recruiter_name", "phone", "email", "visa_type", "jd", "requirements"]
+    }
+}
+
 class JobScraper:
     def __init__(self):
         self.groq_api_key = os.getenv('GROQ_API_KEY')
@@ -34,7 +51,7 @@ class JobScraper:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
-            response = requests.get(url, headers=headers, timeout=30)
+            response = requests.get(url, headers=headers, timeout=timeout_for(30, 'job page fetch'))
             response.raise_for_status()
             
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -140,9 +157,14 @@ class JobScraper:
         try:
             enhanced_jobs = []
             
-            for job in jobs:
+            for index, job in enumerate(jobs):
                 job_text = job.get('jd', '')
                 
+                reused = jd_index.find("job_parse", job_text)
+                if reused:
+                    enhanced_jobs.append(self._reuse_parsed_job(reused['payload'], job))
+                    continue
+                
                 system_prompt = """You are an expert job data parser. Extract structured information from job listings.
                 Return ONLY valid JSON with these exact fields:
                 {
@@ -169,18 +191,18 @@ class JobScraper:
                 ]
                 
                 try:
-                    response = self.groq_model.invoke(messages)
-                    response_text = response.content.strip()
-                    
-                    # Extract JSON from response
-                    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                    if json_match:
-                        parsed_job = json.loads(json_match.group(0))
-                        enhanced_jobs.append(parsed_job)
-                    else:
-                        # Fallback to original data
-                        enhanced_jobs.append(job)
-                        
+                    parsed_job = invoke_structured(self.groq_model, messages, JOB_PARSE_SCHEMA, call_type="job_parse")
+                    enhanced_jobs.append(parsed_job)
+                    jd_index.add("job_parse", job_text, parsed_job)
+                except (DeadlineExceeded, CircuitOpenError) as e:
+                    # Out of time or provider down: return what we have, remaining jobs unenhanced
+                    logging.warning(f"⏱️ {e}; returning {len(jobs) - index} jobs without LLM parsing")
+                    enhanced_jobs.extend(jobs[index:])
+                    break
+                except StructuredOutputError as e:
+                    # Fallback to original data
+                    logging.error(f"LLM returned invalid job JSON: {e.errors[:3]}")
+                    enhanced_jobs.append(job)
                 except Exception as e:
                     logging.error(f"LLM parsing error: {e}")
                     enhanced_jobs.append(job)
@@ -190,6 +212,19 @@ class JobScraper:
         except Exception as e:
             logging.error(f"Error enhancing with LLM: {e}")
             return jobs
+    
+    @staticmethod
+    def _reuse_parsed_job(parsed_job, job):
+        """Parsed fields of a near-duplicate posting, with this listing's own contact details and text"""
+        reused = copy.deepcopy(parsed_job)
+        email = job.get('email')
+        reused.update({
+            'recruiter_name': EmailExtractor._derive_name_from_email(email) if email else None,
+            'email': email,
+            'phone': job.get('phone'),
+            'jd': job.get('jd', '')
+        })
+        return reused
 
 if __name__ == "__main__":
     scraper = JobScraper()
@@ -0,0 +1,768 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+import httpx
+from groq import APIConnectionError, APITimeoutError, BadRequestError
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_groq import ChatGroq
+
+from deadlines import DeadlineExceeded, budget_note, timeout_for
+
+load_dotenv()
+
+# Upper bound for a single LLM call when the request deadline allows more
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "60"))
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter with a cap on in-flight calls.
+
+    One instance is shared by every LLM call site in the worker process so
+    batch endpoints cannot blow through the provider's per-minute quota.
+    """
+
+    def __init__(self, requests_per_minute: float = 30, max_concurrency: int = 4):
+        self.requests_per_minute = max(float(requests_per_minute), 1.0)
+        self.capacity = max(int(max_concurrency), 1)
+        self._tokens = float(self.capacity)
+        self._refill_rate = self.requests_per_minute / 60.0
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(float(self.capacity), self._tokens + elapsed * self._refill_rate)
+        self._last_refill = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a token and a concurrency slot are available. If no slot
+        frees up in time the token is refunded, so a failed acquire costs nothing.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                wait = (1 - self._tokens) / self._refill_rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        if not self._slots.acquire(timeout=remaining):
+            with self._lock:
+                self._refill()
+                self._tokens = min(float(self.capacity), self._tokens + 1)
+            return False
+        return True
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+# Shared limiter for all Groq/Cohere calls in this worker
+llm_rate_limiter = RateLimiter(
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+)
+
+
+def get_response_text(response: Any) -> str:
+    """Pull the text content out of a LangChain chat response."""
+    if hasattr(response, 'content'):
+        return response.content
+    if hasattr(response, 'message') and hasattr(response.message, 'content'):
+        return response.message.content
+    return str(response)
+
+
+# Per-call-type output caps live here; /llm_token_limits can re-learn and save them
+LLM_TOKEN_LIMITS_PATH = os.getenv("LLM_TOKEN_LIMITS_PATH", os.path.join(os.getcwd(), 'llm_token_limits.json'))
+DEFAULT_TOKEN_LIMITS = {
+    'email_draft': 1200,
+    'jd_summary': 600,
+    'job_parse': 2048,
+    'skills_yaml': 1536,
+    'resume_json': 8192,
+}
+DEFAULT_MAX_TOKENS = 4096
+
+
+class TokenLimits:
+    """
+    Output-token caps per call type, learned from observed completion lengths.
+
+    Limits are read from LLM_TOKEN_LIMITS_PATH (falling back to
+    DEFAULT_TOKEN_LIMITS). Every call records its output tokens and whether it
+    was cut off; recommend() proposes p99 plus headroom, and learn() saves the
+    recommendations back to the config file.
+    """
+
+    HEADROOM = 1.25
+    MIN_SAMPLES = 20
+    FLOOR = 256
+    CEILING = 8192
+
+    def __init__(self, path: str):
+        self.path = path
+        self.limits: Dict[str, int] = dict(DEFAULT_TOKEN_LIMITS)
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=500))
+        self._truncations: Dict[str, int] = defaultdict(int)
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+                if isinstance(stored, dict):
+                    self.limits.update({k: int(v) for k, v in stored.items() if isinstance(v, (int, float))})
+        except Exception as e:
+            logging.warning(f"⚠️ Could not load token limits from {self.path}: {e}")
+
+    def max_tokens_for(self, call_type: str) -> int:
+        return self.limits.get(call_type.removesuffix('_repair'), DEFAULT_MAX_TOKENS)
+
+    def observe(self, call_type: str, response: Any) -> bool:
+        """Record output length for a response; returns True if it was truncated."""
+        base_type = call_type.removesuffix('_repair')
+        usage = getattr(response, 'usage_metadata', None) or {}
+        metadata = getattr(response, 'response_metadata', None) or {}
+        finish_reason = str(metadata.get('finish_reason') or '').lower()
+        truncated = finish_reason in ('length', 'max_tokens')
+        with self._lock:
+            self._calls[base_type] += 1
+            if usage.get('output_tokens'):
+                self._samples[base_type].append(int(usage['output_tokens']))
+            if truncated:
+                self._truncations[base_type] += 1
+        if truncated:
+            logging.warning(f"✂️ LLM output truncated for {call_type} at max_tokens={self.max_tokens_for(call_type)}")
+        return truncated
+
+    def recommend(self, call_type: str) -> Optional[int]:
+        with self._lock:
+            samples = sorted(self._samples.get(call_type, ()))
+            truncations = self._truncations.get(call_type, 0)
+            calls = self._calls.get(call_type, 0)
+        if len(samples) < self.MIN_SAMPLES:
+            return None
+        p99 = samples[min(int(0.99 * len(samples)), len(samples) - 1)]
+        proposal = p99 * self.HEADROOM
+        # Truncated outputs are censored at the cap, so the true p99 is higher than observed
+        if calls and truncations / calls > 0.01:
+            proposal = max(proposal, self.max_tokens_for(call_type) * 1.5)
+        return int(min(max(-(-proposal // 64) * 64, self.FLOOR), self.CEILING))
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        call_types = set(self.limits) | set(self._calls)
+        report = {}
+        for call_type in sorted(call_types):
+            with self._lock:
+                samples = sorted(self._samples.get(call_type, ()))
+                calls = self._calls.get(call_type, 0)
+                truncations = self._truncations.get(call_type, 0)
+
+            def pct(p: float) -> Optional[int]:
+                return samples[min(int(p * len(samples)), len(samples) - 1)] if samples else None
+
+            report[call_type] = {
+                'max_tokens': self.max_tokens_for(call_type),
+                'calls': calls,
+                'truncated': truncations,
+                'output_tokens_p50': pct(0.5),
+                'output_tokens_p95': pct(0.95),
+                'output_tokens_p99': pct(0.99),
+                'recommended_max_tokens': self.recommend(call_type),
+            }
+        return report
+
+    def learn(self) -> Dict[str, int]:
+        """Apply recommendations that have enough samples and save them to the config file."""
+        changed = {}
+        for call_type in list(self.limits) + [c for c in self._calls if c not in self.limits]:
+            recommended = self.recommend(call_type)
+            if recommended is not None and recommended != self.limits.get(call_type):
+                self.limits[call_type] = recommended
+                changed[call_type] = recommended
+        if changed:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.limits, f, indent=2, sort_keys=True)
+            logging.info(f"✅ Saved learned token limits to {self.path}: {changed}")
+        return changed
+
+
+token_limits = TokenLimits(LLM_TOKEN_LIMITS_PATH)
+
+
+class CircuitOpenError(Exception):
+    """Raised immediately while the provider's circuit is open (recently failing)."""
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one LLM provider.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls
+    fail fast for ``reset_timeout`` seconds. Then a single probe call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.rejected_calls = 0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected_calls += 1
+                    raise CircuitOpenError(f"{self.name} circuit is open after repeated failures ({self.last_error})")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected_calls += 1
+                    raise CircuitOpenError(f"{self.name} circuit is half-open; waiting on probe call")
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info(f"✅ {self.name} circuit closed")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:200]
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logging.error(f"❌ {self.name} circuit opened: {self.last_error}")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """The call never reached the provider (e.g. rate-limiter timeout); don't count it."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(self.reset_timeout - (time.monotonic() - self.opened_at), 0), 1)
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected_calls,
+                'retry_in_seconds': retry_in,
+                'last_error': self.last_error,
+            }
+
+
+LLM_CIRCUIT_MIN_TIMEOUT_SECONDS = 5.0
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_lock = threading.Lock()
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """
+    Whether an error says the provider is unhealthy: connection failures,
+    timeouts, 429 and 5xx. Client errors (400 json_validate_failed, context
+    length, 401, 413) mean the provider answered and must not open the circuit.
+    """
+    if isinstance(error, (APIConnectionError, httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def get_circuit_breaker(model: Any) -> CircuitBreaker:
+    """Breaker shared by every call site that talks to the same provider."""
+    base = getattr(model, 'bound', model)
+    provider = 'groq' if isinstance(base, ChatGroq) else type(base).__name__.lower().replace('chat', '') or 'llm'
+    with _circuit_lock:
+        breaker = _circuit_breakers.get(provider)
+        if breaker is None:
+            breaker = _circuit_breakers[provider] = CircuitBreaker(
+                provider,
+                failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+            )
+        return breaker
+
+
+def get_circuit_states() -> Dict[str, Dict[str, Any]]:
+    with _circuit_lock:
+        breakers = list(_circuit_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+# Calls run here so the caller can stop waiting when its deadline passes
+_llm_call_pool = ThreadPoolExecutor(max_workers=llm_rate_limiter.capacity, thread_name_prefix='llm-call')
+
+# Request hedging (off by default): duplicate a slow call once it passes the
+# observed latency percentile, within a budget of extra calls
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+LLM_HEDGE_BUDGET_RATIO = float(os.getenv("LLM_HEDGE_BUDGET_RATIO", "0.1"))
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "4"))
+LLM_HEDGE_MIN_SAMPLES = 20
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per call type."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def record(self, call_type: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[call_type].append(seconds)
+
+    def percentile(self, call_type: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(call_type, ()))
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(int(pct * len(samples)), len(samples) - 1)]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {call_type: sorted(samples) for call_type, samples in self._samples.items()}
+        return {
+            call_type: {
+                'samples': len(samples),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 1),
+                'p95_ms': round(samples[min(int(0.95 * len(samples)), len(samples) - 1)] * 1000, 1),
+            }
+            for call_type, samples in snapshot.items() if samples
+        }
+
+
+class HedgeBudget:
+    """Each primary call earns ``ratio`` of a hedge token; a hedge spends one."""
+
+    def __init__(self, ratio: float = 0.1, burst: float = 3.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def refund(self) -> None:
+        """Give back a token spent on a hedge that was never sent"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+llm_latency = LatencyTracker()
+hedge_budget = HedgeBudget(ratio=LLM_HEDGE_BUDGET_RATIO)
+hedge_stats: Dict[str, Dict[str, int]] = defaultdict(
+    lambda: {'hedged': 0, 'hedge_wins': 0, 'primary_wins': 0, 'skipped_budget': 0, 'skipped_no_slot': 0}
+)
+_hedge_stats_lock = threading.Lock()
+_hedge_models: Dict[str, Any] = {}
+_hedge_models_lock = threading.Lock()
+
+
+def _count_hedge(call_type: str, counter: str) -> None:
+    with _hedge_stats_lock:
+        hedge_stats[call_type][counter] += 1
+
+
+def get_hedge_stats() -> Dict[str, Dict[str, Any]]:
+    """Hedge counters and win rate per call type."""
+    with _hedge_stats_lock:
+        stats = {call_type: dict(counters) for call_type, counters in hedge_stats.items()}
+    for counters in stats.values():
+        counters['hedge_win_rate'] = round(counters['hedge_wins'] / counters['hedged'], 3) if counters['hedged'] else None
+    return stats
+
+
+def get_hedge_model(model: Any) -> Any:
+    """
+    Model used for the duplicate call. GROQ_HEDGE_API_KEY / GROQ_HEDGE_MODEL point
+    it at a second key or model; otherwise the primary model is reused.
+    """
+    hedge_key = os.getenv("GROQ_HEDGE_API_KEY")
+    hedge_model_name = os.getenv("GROQ_HEDGE_MODEL")
+    base = getattr(model, 'bound', model)
+    if not (hedge_key or hedge_model_name) or not isinstance(base, ChatGroq):
+        return model
+
+    cache_key = f"{base.model_name}|{base.temperature}"
+    with _hedge_models_lock:
+        hedge_base = _hedge_models.get(cache_key)
+        if hedge_base is None:
+            hedge_base = _hedge_models[cache_key] = ChatGroq(
+                model=hedge_model_name or base.model_name,
+                temperature=base.temperature,
+                api_key=hedge_key or base.groq_api_key
+            )
+    bound_kwargs = getattr(model, 'kwargs', None)
+    return hedge_base.bind(**bound_kwargs) if bound_kwargs else hedge_base
+
+
+def _supports_timeout_kwarg(model: Any) -> bool:
+    """Groq clients accept per-call timeout and max_tokens; others get them at construction."""
+    return isinstance(getattr(model, 'bound', model), ChatGroq)
+
+
+def _submit_call(model: Any, messages: list, timeout: float, call_type: str) -> Future:
+    """Start a call on the pool; the caller must already hold a rate-limiter slot."""
+    kwargs = {}
+    if _supports_timeout_kwarg(model):
+        kwargs = {'timeout': timeout, 'max_tokens': token_limits.max_tokens_for(call_type)}
+    started = time.perf_counter()
+    try:
+        future = _llm_call_pool.submit(model.invoke, messages, **kwargs)
+    except BaseException:
+        llm_rate_limiter.release()
+        raise
+
+    def on_done(f: Future) -> None:
+        # The slot is held until the call really ends, even if nobody waits for it
+        llm_rate_limiter.release()
+        if not f.cancelled() and f.exception() is None:
+            llm_latency.record(call_type, time.perf_counter() - started)
+
+    future.add_done_callback(on_done)
+    return future
+
+
+def _first_success(futures: List[Future], timeout: float) -> Tuple[Future, Any]:
+    """Wait for the first future that succeeds; re-raise the last error if all fail."""
+    pending = set(futures)
+    end = time.monotonic() + timeout
+    last_error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, timeout=max(end - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            raise FutureTimeoutError()
+        for future in done:
+            if future.exception() is None:
+                return future, future.result()
+            last_error = future.exception()
+    raise last_error
+
+
+def invoke_llm(model: Any, messages: list, call_type: str = 'default', hedge: bool = False) -> Any:
+    """
+    Invoke a chat model under the shared rate limiter and the current request deadline.
+
+    The wait for a rate-limiter slot and the call itself both count against the
+    remaining budget; DeadlineExceeded is raised as soon as it runs out. With
+    ``hedge=True`` (and LLM_HEDGING_ENABLED) a duplicate call is sent once the
+    primary is slower than the call type's latency percentile; the first reply
+    wins and the other is abandoned. While the provider's circuit is open,
+    CircuitOpenError is raised without calling it. Returns the raw LangChain
+    response so existing callers keep their parsing.
+    """
+    if model is None:
+        raise Exception("LLM model not initialized")
+
+    what = f"LLM call ({call_type})"
+    breaker = get_circuit_breaker(model)
+    breaker.before_call()
+    try:
+        if not llm_rate_limiter.acquire(timeout=timeout_for(LLM_CALL_TIMEOUT_SECONDS, what)):
+            raise DeadlineExceeded(f"{what}: timed out waiting for the rate limiter")
+    except BaseException:
+        breaker.release_probe()
+        raise
+
+    try:
+        timeout = timeout_for(LLM_CALL_TIMEOUT_SECONDS, what)
+    except BaseException:
+        llm_rate_limiter.release()
+        breaker.release_probe()
+        raise
+    logging.info(f"{what} starting with {timeout:.1f}s timeout{budget_note()}")
+    started = time.perf_counter()
+    call_end = time.monotonic() + timeout
+    primary = _submit_call(model, messages, timeout, call_type)
+    futures = [primary]
+
+    try:
+        if hedge and LLM_HEDGING_ENABLED:
+            hedge_budget.earn()
+            delay = llm_latency.percentile(call_type, LLM_HEDGE_PERCENTILE) or LLM_HEDGE_DEFAULT_DELAY_SECONDS
+            done, _ = wait(futures, timeout=min(delay, timeout))
+            hedge_timeout = call_end - time.monotonic()
+            if not done and hedge_timeout > 0.5:
+                if not hedge_budget.try_spend():
+                    _count_hedge(call_type, 'skipped_budget')
+                elif not llm_rate_limiter.acquire(timeout=0):
+                    hedge_budget.refund()
+                    _count_hedge(call_type, 'skipped_no_slot')
+                else:
+                    logging.info(f"{what} slower than {delay:.1f}s, sending hedge request")
+                    _count_hedge(call_type, 'hedged')
+                    futures.append(_submit_call(get_hedge_model(model), messages, hedge_timeout, call_type))
+
+        winner, response = _first_success(futures, max(call_end - time.monotonic(), 0))
+    except (FutureTimeoutError, APITimeoutError) as exc:
+        # A timeout under a tiny remaining budget says little about provider health
+        if timeout >= LLM_CIRCUIT_MIN_TIMEOUT_SECONDS:
+            breaker.record_failure(exc)
+        else:
+            breaker.release_probe()
+        raise DeadlineExceeded(f"{what}: no response within {timeout:.1f}s") from exc
+    except Exception as exc:
+        if is_provider_failure(exc):
+            breaker.record_failure(exc)
+        else:
+            # The provider answered (e.g. 400 for this request): it is healthy
+            breaker.record_success()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+    breaker.record_success()
+    token_limits.observe(call_type, response)
+    if len(futures) > 1:
+        _count_hedge(call_type, 'hedge_wins' if winner is not primary else 'primary_wins')
+    logging.info(f"{what} finished in {(time.perf_counter() - started) * 1000:.0f} ms{budget_note()}")
+    return response
+
+
+class StructuredOutputError(Exception):
+    """Raised when the model cannot produce JSON matching the schema, even after a repair call."""
+
+    def __init__(self, message: str, raw_text: str = '', errors: Optional[List[str]] = None):
+        super().__init__(message)
+        self.raw_text = raw_text
+        self.errors = errors or []
+
+
+_JSON_TYPES = {
+    'object': (dict,),
+    'array': (list,),
+    'string': (str,),
+    'integer': (int,),
+    'number': (int, float),
+    'boolean': (bool,),
+    'null': (type(None),),
+}
+
+
+def compile_schema(schema: Dict[str, Any]) -> Callable[[Any], List[str]]:
+    """
+    Compile a small JSON-Schema subset (type, properties, required, items, enum)
+    into a validator function returning a list of error strings.
+
+    Compiling once per schema keeps per-call validation to plain isinstance checks.
+    """
+
+    def build(node: Dict[str, Any], path: str) -> Callable[[Any, List[str]], None]:
+        types = node.get('type')
+        if isinstance(types, str):
+            types = [types]
+        python_types = tuple(t for name in (types or []) for t in _JSON_TYPES[name])
+        enum = node.get('enum')
+        required = node.get('required', [])
+        properties = {key: build(child, f"{path}.{key}") for key, child in node.get('properties', {}).items()}
+        items = build(node['items'], f"{path}[]") if 'items' in node else None
+
+        def check(value: Any, errors: List[str]) -> None:
+            if python_types:
+                # bool is an int subclass; don't let True pass as a number
+                if not isinstance(value, python_types) or (isinstance(value, bool) and bool not in python_types):
+                    errors.append(f"{path}: expected {'/'.join(types)}, got {type(value).__name__}")
+                    return
+            if enum is not None and value not in enum:
+                errors.append(f"{path}: {value!r} is not one of {enum}")
+            if isinstance(value, dict):
+                for key in required:
+                    if key not in value:
+                        errors.append(f"{path}: missing required field '{key}'")
+                for key, child_check in properties.items():
+                    if key in value:
+                        child_check(value[key], errors)
+            if items is not None and isinstance(value, list):
+                for element in value:
+                    items(element, errors)
+
+        return check
+
+    root = build(schema, '$')
+
+    def validate(instance: Any) -> List[str]:
+        errors: List[str] = []
+        root(instance, errors)
+        return errors
+
+    return validate
+
+
+# Keyed by the schema's canonical JSON: an id() can be reused by another schema once the first is collected
+_compiled_schemas: Dict[str, Callable[[Any], List[str]]] = {}
+_stats_lock = threading.Lock()
+structured_output_stats: Dict[str, Dict[str, int]] = defaultdict(
+    lambda: {'calls': 0, 'first_pass_ok': 0, 'repair_calls': 0, 'repaired_ok': 0, 'failed': 0}
+)
+
+
+def _record(call_type: str, *counters: str) -> None:
+    with _stats_lock:
+        stats = structured_output_stats[call_type]
+        for counter in counters:
+            stats[counter] += 1
+
+
+def get_structured_output_stats() -> Dict[str, Dict[str, int]]:
+    """Snapshot of structured-output counters per call type."""
+    with _stats_lock:
+        return {call_type: dict(stats) for call_type, stats in structured_output_stats.items()}
+
+
+def _json_mode(model: Any) -> Any:
+    """Bind provider JSON mode when the model supports it; otherwise return the model unchanged."""
+    try:
+        return model.bind(response_format={"type": "json_object"})
+    except Exception:
+        return model
+
+
+def _parse_json_text(text: str) -> Any:
+    text = (text or '').strip()
+    fenced = re.search(r'```(?:json)?\s*(.*?)\s*```', text, re.DOTALL | re.IGNORECASE)
+    if fenced:
+        text = fenced.group(1)
+    return json.loads(text)
+
+
+def invoke_structured(model: Any, messages: list, schema: Dict[str, Any], call_type: str = 'default',
+                      hedge: bool = False) -> Any:
+    """
+    Invoke a chat model in JSON mode and validate the reply against ``schema``.
+
+    On a parse or validation failure (including Groq rejecting the reply with
+    400 json_validate_failed) one targeted repair call is made, quoting the
+    errors back to the model. Raises StructuredOutputError if that fails too.
+    """
+    schema_key = json.dumps(schema, sort_keys=True)
+    validator = _compiled_schemas.get(schema_key)
+    if validator is None:
+        validator = _compiled_schemas[schema_key] = compile_schema(schema)
+
+    json_model = _json_mode(model)
+    raw_text, errors = _structured_attempt(json_model, messages, call_type, validator, hedge=hedge)
+    if not errors:
+        _record(call_type, 'calls', 'first_pass_ok')
+        return _parse_json_text(raw_text)
+
+    logging.warning(f"⚠️ {call_type}: structured output invalid ({errors[:3]}), attempting one repair call")
+    _record(call_type, 'calls', 'repair_calls')
+    repair_messages = list(messages) + [
+        AIMessage(content=raw_text or '(empty reply)'),
+        HumanMessage(content=(
+            "Your previous reply was not valid for the required JSON schema.\n"
+            f"Problems: {'; '.join(errors[:10])}\n"
+            f"Schema: {json.dumps(schema)}\n"
+            "Return ONLY the corrected JSON object."
+        ))
+    ]
+    repaired_text, repair_errors = _structured_attempt(json_model, repair_messages, f"{call_type}_repair", validator)
+    if not repair_errors:
+        _record(call_type, 'repaired_ok')
+        return _parse_json_text(repaired_text)
+
+    _record(call_type, 'failed')
+    raise StructuredOutputError(f"{call_type}: structured output invalid after repair", repaired_text, repair_errors)
+
+
+def _json_validate_failure(error: BaseException) -> Optional[Dict[str, Any]]:
+    """The error detail when Groq JSON mode rejected the model's reply (400 json_validate_failed), else None"""
+    if not isinstance(error, BadRequestError) or not isinstance(error.body, dict):
+        return None
+    detail = error.body.get('error', error.body)
+    return detail if isinstance(detail, dict) and detail.get('code') == 'json_validate_failed' else None
+
+
+def _structured_attempt(model: Any, messages: list, call_type: str, validator: Callable[[Any], List[str]],
+                        hedge: bool = False) -> Tuple[str, List[str]]:
+    """
+    One JSON-mode call: (reply text, validation errors). A reply the provider
+    itself rejected as invalid JSON comes back as a validation failure carrying
+    the rejected generation, so it takes the same repair path.
+    """
+    try:
+        raw_text = get_response_text(invoke_llm(model, messages, call_type, hedge=hedge))
+    except BadRequestError as exc:
+        detail = _json_validate_failure(exc)
+        if detail is None:
+            raise
+        return str(detail.get('failed_generation') or ''), [f"invalid JSON: {detail.get('message') or exc}"]
+    return raw_text, _check_structured(raw_text, validator)
+
+
+def _check_structured(raw_text: str, validator: Callable[[Any], List[str]]) -> List[str]:
+    try:
+        parsed = _parse_json_text(raw_text)
+    except (json.JSONDecodeError, TypeError) as exc:
+        return [f"invalid JSON: {exc}"]
+    return validator(parsed)
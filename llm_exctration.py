@@ -6,6 +6,9 @@ from datetime import datetime
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langchain_core.messages import HumanMessage, SystemMessage
+from deadlines import DeadlineExceeded
+from jd_similarity import jd_index
+from llm_client import CircuitOpenError, invoke_llm, token_limits
 try:
     from langchain.chat_models import init_chat_model
 except ImportError:
@@ -44,7 +47,11 @@ def get_cohere_model():
             if init_chat_model is None:
                 logging.warning("init_chat_model not available, Cohere model will not be initialized")
                 return None
-            cohere_model = init_chat_model("command-a-03-2025", model_provider="cohere")
+            cohere_model = init_chat_model(
+                "command-a-03-2025",
+                model_provider="cohere",
+                max_tokens=token_limits.max_tokens_for("resume_json")
+            )
         except Exception as e:
             logging.error(f"Failed to initialize Cohere model: {e}")
             cohere_model = None
@@ -59,12 +66,14 @@ class ResumeOptimizer:
         resume_file_path = optimizer.workflow()
     """
      
-    def __init__(self, job_description):
+    def __init__(self, job_description, artifact_store=None):
         """
         Initialize the ResumeOptimizer with a job description.
         
         Args:
             job_description (str): The job description to optimize the resume for
+            artifact_store (ArtifactStore, optional): Where completed stages are persisted,
+                so a rerun for the same JD skips the LLM calls that already succeeded
         """
         # Setup logging
         logging.basicConfig(level=logging.INFO)
@@ -95,11 +104,44 @@ class ResumeOptimizer:
         # Initialize variables to store intermediate results
         self.extracted_skills = None
         self.resume_json = None
+        
+        # Persisted stage outputs, keyed by JD hash
+        self.artifact_store = artifact_store
+        self.jd_hash = artifact_store.jd_hash(job_description) if artifact_store else None
+        self.stage_sources = {}
+    
+    def _load_artifact(self, stage):
+        """Return the stored output of a stage, or None"""
+        if self.artifact_store is None:
+            return None
+        value = self.artifact_store.get(self.jd_hash, stage)
+        if value is not None:
+            self.stage_sources[stage] = "artifact"
+            self.info_log(f"Reusing stored {stage} artifact for JD {self.jd_hash[:12]}")
+        return value
+    
+    def _save_artifact(self, stage, value):
+        self.stage_sources[stage] = "generated"
+        if self.artifact_store is None:
+            return
+        try:
+            self.artifact_store.put(self.jd_hash, stage, value)
+        except Exception as e:
+            self.error_log(f"Could not persist {stage} artifact: {e}")
     
     def extract_skills(self):
         """Extract skills from job description using LLM and then parse using strouptparse"""
         try:
             cleaned_jd = self.job_description.strip()
+            stored = self._load_artifact("skills")
+            if stored is not None:
+                self.extracted_skills = stored
+                return self.extracted_skills
+            reused = jd_index.find("skills", cleaned_jd)
+            if reused:
+                self.extracted_skills = reused['payload']
+                self._save_artifact("skills", self.extracted_skills)
+                return self.extracted_skills
             messages = [
                 SystemMessage(content=("""
                    You are an expert technical recruiter and hiring manager.
@@ -181,7 +223,7 @@ class ResumeOptimizer:
                 )),
                 HumanMessage(content=cleaned_jd),
             ]
-            extract_skills = self.groq_model.invoke(messages)
+            extract_skills = invoke_llm(self.groq_model, messages, call_type="skills_yaml")
             # Extract content from response
             if hasattr(extract_skills, 'content'):
                 raw_content = extract_skills.content
@@ -193,9 +235,16 @@ class ResumeOptimizer:
             try:
                 self.extracted_skills = strouptparse(raw_content)
             except Exception as e:
+                # Use the raw text for this run only; persisting it would replay the bad output
                 self.error_log(f"Error parsing LLM skills output with strouptparse: {e}")
                 self.extracted_skills = raw_content
+                self.stage_sources["skills"] = "unparsed"
+                return self.extracted_skills
+            jd_index.add("skills", cleaned_jd, self.extracted_skills)
+            self._save_artifact("skills", self.extracted_skills)
             return self.extracted_skills
+        except (DeadlineExceeded, CircuitOpenError):
+            raise
         except Exception as e:
             self.error_log(f"Error in LLM skills extraction: {e}")
             return f"Error extracting skills: {str(e)}"
@@ -203,6 +252,10 @@ class ResumeOptimizer:
     def generate_resume(self):
         """Generate optimized resume based on extracted skills, and parse with strouptparse after llm invoke"""
         try:
+            stored = self._load_artifact("resume_json")
+            if stored is not None:
+                self.resume_json = stored
+                return self.resume_json
             if not self.groq_model:
                 raise Exception("Groq model not initialized")
             if not self.extracted_skills:
@@ -588,16 +641,22 @@ RESUME_JSON: Candidate’s raw resume data
                 SystemMessage(content=f"{SYSTEM_PROMPT}"),
                 HumanMessage(content=f"Job Description:\n{self.job_description[:1800]}\n\nGenerate optimized resume JSON following ALL rules above. Return ONLY valid JSON.")
             ]
-            # Try Cohere model first, fallback to Groq if not available
+            # Try Cohere model first, fallback to Groq if not available (or its circuit is open)
             cohere_model = get_cohere_model()
+            final_response = None
             if cohere_model is not None:
-                final_response = cohere_model.invoke(combined_messages)
-            elif self.groq_model is not None:
-                final_response = self.groq_model.invoke(combined_messages)
-            else:
-                error_msg = "Neither Cohere nor Groq model is available. "
-                error_msg += "Please set CO_API_KEY (for Cohere) or GROQ_API_KEY (for Groq) environment variable."
-                raise Exception(error_msg)
+                try:
+                    final_response = invoke_llm(cohere_model, combined_messages, call_type="resume_json")
+                except CircuitOpenError as e:
+                    if self.groq_model is None:
+                        raise
+                    self.info_log(f"Cohere unavailable ({e}), using Groq for resume generation")
+            if final_response is None:
+                if self.groq_model is None:
+                    error_msg = "Neither Cohere nor Groq model is available. "
+                    error_msg += "Please set CO_API_KEY (for Cohere) or GROQ_API_KEY (for Groq) environment variable."
+                    raise Exception(error_msg)
+                final_response = invoke_llm(self.groq_model, combined_messages, call_type="resume_json")
             # Extract content from response
             if hasattr(final_response, 'content'):
                 raw_response = final_response.content
@@ -621,11 +680,26 @@ RESUME_JSON: Candidate’s raw resume data
             # CRITICAL: Force restore original technical skills to ensure they are never modified by AI
             self._restore_original_technical_skills()
             
+            # Only a resume that parses, built from skills that parsed, is worth keeping
+            if self._is_json_resume(self.resume_json) and self.stage_sources.get("skills") != "unparsed":
+                self._save_artifact("resume_json", self.resume_json)
+            
             return self.resume_json
+        except (DeadlineExceeded, CircuitOpenError):
+            raise
         except Exception as e:
             self.error_log(f"Error in LLM final response: {e}")
             return f"Error generating final response: {str(e)}"
     
+    @staticmethod
+    def _is_json_resume(value):
+        if isinstance(value, dict):
+            return True
+        try:
+            return isinstance(json.loads(value), dict)
+        except (TypeError, ValueError):
+            return False
+    
     def _restore_original_technical_skills(self):
         """Force restore the original technical skills from the template to prevent AI modifications"""
         if not self.resume_json or not isinstance(self.resume_json, dict):
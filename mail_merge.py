@@ -0,0 +1,174 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_RECIPIENT_NAME = 'Hiring Manager'
+
+# Placeholders a subject or body may use, e.g. "Hello {first_name}" or "{company|your team}"
+MERGE_FIELDS = {
+    'name': 'Recipient name (defaults to "Hiring Manager")',
+    'first_name': 'First word of the recipient name',
+    'email': 'Recipient email address',
+    'company': 'Company, from the JD analysis',
+    'role': 'Job title, from the JD analysis',
+    'location': 'Job location, from the JD analysis',
+    'sender_name': 'Name on the sending account',
+    'sender_phone': 'Phone on the sending account',
+    'sender_linkedin': 'LinkedIn URL on the sending account',
+}
+
+# Job fields a shared jd_analysis may supply; everything else is per recipient
+SHARED_FIELDS = ('company', 'role', 'location')
+
+# Keys produced by /extract_jd and the job parser, mapped onto merge fields
+FIELD_ALIASES = {
+    'recruiter_name': 'name',
+    'recruiter_email': 'email',
+    'company_name': 'company',
+    'title': 'role',
+    'job_title': 'role',
+    'position': 'role',
+}
+
+# {field} or {field|fallback}; braces around anything else (JSON, "{}") are left as literal text
+_PLACEHOLDER_RE = re.compile(r'\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*(?:\|([^{}]*))?\}')
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class TemplateError(ValueError):
+    """A template or recipient list failed validation; ``errors`` lists every problem."""
+
+    def __init__(self, errors: List[str]):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+class MergeTemplate:
+    """
+    A subject or body template parsed once into literal text and field slots.
+
+    Rendering is a single join over the precompiled segments, so the same
+    template can be personalised for thousands of recipients cheaply.
+    """
+
+    def __init__(self, text: str):
+        self.text = text or ''
+        self._segments: List[Tuple[str, Optional[str], Optional[str]]] = []
+        position = 0
+        for match in _PLACEHOLDER_RE.finditer(self.text):
+            field = match.group(1).lower()
+            if match.start() > position:
+                self._segments.append((self.text[position:match.start()], None, None))
+            fallback = match.group(2).strip() if match.group(2) is not None else None
+            self._segments.append(('', FIELD_ALIASES.get(field, field), fallback))
+            position = match.end()
+        if position < len(self.text):
+            self._segments.append((self.text[position:], None, None))
+        self.fields = {field for _, field, _ in self._segments if field}
+        self.required_fields = {field for _, field, fallback in self._segments if field and fallback is None}
+        self.unknown_fields = sorted(self.fields - set(MERGE_FIELDS))
+
+    def render(self, values: Dict[str, str]) -> str:
+        return ''.join(
+            literal if field is None else (values.get(field) or fallback or '')
+            for literal, field, fallback in self._segments
+        )
+
+
+@dataclass(frozen=True)
+class MergeRecipient:
+    """One bulk-send recipient with its merge fields and optional resume override."""
+    email: str
+    name: str = DEFAULT_RECIPIENT_NAME
+    company: str = ''
+    role: str = ''
+    location: str = ''
+    resume_path: str = ''
+
+    @classmethod
+    def from_value(cls, value: Any, shared: Optional[Dict[str, Any]] = None) -> 'MergeRecipient':
+        """
+        Build from a plain address or a dict. ``shared`` job fields (company,
+        role, location from the JD analysis) apply to every recipient unless the
+        recipient sets its own; a shared recruiter name or email is ignored, since
+        it belongs to one person rather than to the whole list.
+        """
+        data = {'email': value} if isinstance(value, str) else dict(value or {})
+        fields = {}
+        for key, item in (shared or {}).items():
+            key = FIELD_ALIASES.get(key, key)
+            if key in SHARED_FIELDS and item:
+                fields[key] = str(item).strip()
+        for key, item in data.items():
+            key = FIELD_ALIASES.get(key, key)
+            if key in ('email', 'name', 'resume_path') + SHARED_FIELDS and item:
+                fields[key] = str(item).strip()
+        fields.setdefault('name', DEFAULT_RECIPIENT_NAME)
+        return cls(**{'email': '', **fields})
+
+    def values(self) -> Dict[str, str]:
+        return {
+            'name': self.name,
+            'first_name': self.name.split()[0] if self.name and self.name != DEFAULT_RECIPIENT_NAME else self.name,
+            'email': self.email,
+            'company': self.company,
+            'role': self.role,
+            'location': self.location,
+        }
+
+
+class MailMerge:
+    """
+    Compiled subject + body templates for one bulk send.
+
+    ``sender_fields`` (sender_name, sender_phone, sender_linkedin) are shared by
+    every message. Call validate() before sending; render() assumes it passed.
+    """
+
+    def __init__(self, subject: str, body: str, sender_fields: Optional[Dict[str, str]] = None):
+        self.subject = MergeTemplate(subject)
+        self.body = MergeTemplate(body)
+        self.sender_fields = {key: value for key, value in (sender_fields or {}).items() if value}
+
+    def _values(self, recipient: MergeRecipient) -> Dict[str, str]:
+        return {**self.sender_fields, **recipient.values()}
+
+    def render(self, recipient: MergeRecipient) -> Tuple[str, str]:
+        values = self._values(recipient)
+        return self.subject.render(values), self.body.render(values)
+
+    def render_subject(self, recipient: MergeRecipient) -> str:
+        return self.subject.render(self._values(recipient))
+
+    def validate(self, recipients: Iterable[MergeRecipient], attach_resume: bool = True) -> List[str]:
+        """Every problem that would make a message wrong, as readable strings (empty when valid)"""
+        errors = []
+        if not self.body.text.strip():
+            errors.append('Email body is required')
+        unknown = sorted(set(self.subject.unknown_fields) | set(self.body.unknown_fields))
+        if unknown:
+            errors.append(f"Unknown merge field(s): {', '.join('{' + f + '}' for f in unknown)} "
+                          f"(available: {', '.join(MERGE_FIELDS)})")
+        required = (self.subject.required_fields | self.body.required_fields) & set(MERGE_FIELDS)
+        checked_resumes = {}
+        for index, recipient in enumerate(recipients):
+            label = f"Recipient {index + 1} ({recipient.email or 'no email'})"
+            if not _EMAIL_RE.match(recipient.email):
+                errors.append(f"{label}: invalid email address")
+            values = self._values(recipient)
+            missing = sorted(field for field in required if not values.get(field))
+            if missing:
+                errors.append(f"{label}: no value for {', '.join('{' + f + '}' for f in missing)} "
+                              f"(set it or add a fallback like {{{missing[0]}|...}})")
+            if attach_resume and recipient.resume_path:
+                if recipient.resume_path not in checked_resumes:
+                    checked_resumes[recipient.resume_path] = os.path.exists(recipient.resume_path)
+                if not checked_resumes[recipient.resume_path]:
+                    errors.append(f"{label}: resume not found: {recipient.resume_path}")
+        return errors
+
+    def check(self, recipients: Iterable[MergeRecipient], attach_resume: bool = True) -> None:
+        errors = self.validate(recipients, attach_resume)
+        if errors:
+            raise TemplateError(errors)
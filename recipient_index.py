@@ -0,0 +1,238 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+RECIPIENT_INDEX_PATH = os.getenv('RECIPIENT_INDEX_PATH', os.path.join(os.getcwd(), 'recipient_index.db'))
+# Re-sending to the same recipient about the same subject within this window is blocked
+DUPLICATE_SEND_WINDOW_DAYS = float(os.getenv('DUPLICATE_SEND_WINDOW_DAYS', '30'))
+
+DAY_SECONDS = 24 * 3600
+
+# Words that vary between two emails about the same role without changing what it is
+_SUBJECT_NOISE = {
+    're', 'fw', 'fwd', 'a', 'an', 'the', 'for', 'of', 'at', 'to', 'in', 'with', 'and', 'my',
+    'application', 'applying', 'interest', 'interested', 'regarding', 'role', 'position', 'opportunity', 'job',
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    subject_key TEXT NOT NULL,
+    subject TEXT,
+    from_email TEXT,
+    contacted_at REAL NOT NULL,
+    message_id TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS contacts_recipient ON contacts (recipient, contacted_at);
+CREATE INDEX IF NOT EXISTS contacts_sender ON contacts (from_email, contacted_at);
+CREATE INDEX IF NOT EXISTS contacts_message ON contacts (message_id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS send_quota (
+    id INTEGER PRIMARY KEY,
+    from_email TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    reserved_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS send_quota_sender ON send_quota (from_email, reserved_at);
+"""
+
+
+def subject_key(subject: str) -> str:
+    """
+    Fingerprint of what an email is about: lower-cased words minus reply
+    prefixes, filler and punctuation, order-independent. "Application for
+    Senior ML Engineer - Acme" and "Re: Acme: senior ML engineer role" match.
+    """
+    words = {w for w in re.findall(r'[a-z0-9+#]+', (subject or '').lower()) if w not in _SUBJECT_NOISE}
+    return hashlib.sha1(' '.join(sorted(words)).encode('utf-8')).hexdigest()[:16]
+
+
+def _epoch(timestamp: Any) -> Optional[float]:
+    """Archive timestamps are naive UTC ISO strings"""
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        parsed = datetime.fromisoformat(str(timestamp))
+    except ValueError:
+        return None
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class RecipientIndex:
+    """
+    Who we emailed, about what, and when, indexed by recipient address in
+    SQLite (shared by all workers). Fed from the email archive so "already
+    contacted within N days" never needs to scan the archive.
+
+    Dead-lettered emails, and emails that could not be queued ('failed'),
+    stay in the index but never count as a contact.
+
+    It also holds the per-account daily send quota shared by all workers:
+    reserve_send() counts the account's contacts in the last 24h plus sends
+    reserved but not (yet) archived, and claims one inside a single
+    BEGIN IMMEDIATE transaction.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row(record: Dict[str, Any]):
+        recipient = (record.get('to_email') or '').strip().lower()
+        contacted_at = _epoch(record.get('timestamp'))
+        if not recipient or contacted_at is None:
+            return None
+        subject = record.get('subject') or ''
+        return (recipient, subject_key(subject), subject, (record.get('from_email') or '').lower(),
+                contacted_at, record.get('message_id'), record.get('send_status'))
+
+    def record(self, record: Dict[str, Any]) -> None:
+        """Index one archive record (to_email, subject, from_email, timestamp, message_id, send_status)"""
+        row = self._row(record)
+        if row is None:
+            return
+        with self._connect() as conn:
+            conn.execute('INSERT INTO contacts (recipient, subject_key, subject, from_email, contacted_at, message_id, status) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+
+    def update_status(self, message_id: str, status: str) -> None:
+        with self._connect() as conn:
+            conn.execute('UPDATE contacts SET status = ? WHERE message_id = ?', (status, message_id))
+
+    def ensure_built(self, load_records: Callable[[], Iterable[Dict[str, Any]]]) -> None:
+        """Fill the index from the archive the first time it is used (once, across workers)"""
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'built_at'").fetchone():
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute("SELECT 1 FROM meta WHERE key = 'built_at'").fetchone() is None:
+                    rows = [row for row in map(self._row, load_records()) if row]
+                    conn.execute('DELETE FROM contacts')
+                    conn.executemany('INSERT INTO contacts (recipient, subject_key, subject, from_email, contacted_at, '
+                                     'message_id, status) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                    conn.execute("INSERT INTO meta (key, value) VALUES ('built_at', ?)", (str(time.time()),))
+                    print(f"📇 Recipient index built from archive: {len(rows)} contact(s)")
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def check(self, recipient: str, subject: Optional[str] = None,
+              within_days: float = DUPLICATE_SEND_WINDOW_DAYS) -> Dict[str, Any]:
+        """
+        Previous contacts with ``recipient`` in the last ``within_days`` days.
+        ``duplicate`` is True when one of them was about the same subject.
+        """
+        recipient = (recipient or '').strip().lower()
+        since = time.time() - within_days * DAY_SECONDS
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT subject_key, subject, from_email, contacted_at, status FROM contacts '
+                "WHERE recipient = ? AND contacted_at >= ? AND COALESCE(status, '') NOT IN ('dead', 'failed') "
+                'ORDER BY contacted_at DESC LIMIT 20', (recipient, since)
+            ).fetchall()
+        key = subject_key(subject) if subject else None
+        contacts = [{
+            'subject': row['subject'],
+            'from_email': row['from_email'],
+            'contacted_at': datetime.fromtimestamp(row['contacted_at'], timezone.utc).isoformat(),
+            'days_ago': round((time.time() - row['contacted_at']) / DAY_SECONDS, 1),
+            'status': row['status'],
+            'same_subject': key is not None and row['subject_key'] == key,
+        } for row in rows]
+        same = [contact for contact in contacts if contact['same_subject']]
+        return {
+            'recipient': recipient,
+            'within_days': within_days,
+            'contacted': bool(contacts),
+            'duplicate': bool(same),
+            'last_contact': (same or contacts)[0] if contacts else None,
+            'contacts': contacts[:5],
+        }
+
+    @staticmethod
+    def describe(result: Dict[str, Any]) -> Optional[str]:
+        """Why a check() result is a duplicate, or None if it is not"""
+        if not result['duplicate']:
+            return None
+        last = result['last_contact']
+        return (f"Already emailed {result['recipient']} about \"{last['subject']}\" "
+                f"{last['days_ago']:g} day(s) ago (from {last['from_email'] or 'unknown sender'})")
+
+    def duplicate_reason(self, recipient: str, subject: str,
+                         within_days: float = DUPLICATE_SEND_WINDOW_DAYS) -> Optional[str]:
+        return self.describe(self.check(recipient, subject, within_days))
+
+    @staticmethod
+    def _sends_since(conn: sqlite3.Connection, from_email: str, since: float) -> int:
+        contacts = conn.execute(
+            'SELECT COUNT(*) FROM contacts WHERE from_email = ? AND contacted_at >= ? '
+            "AND COALESCE(status, '') NOT IN ('dead', 'failed')", (from_email, since)).fetchone()[0]
+        # A reservation stops counting once its email is archived (and counted above)
+        reserved = conn.execute(
+            'SELECT COUNT(*) FROM send_quota q WHERE q.from_email = ? AND q.reserved_at >= ? AND NOT EXISTS '
+            '(SELECT 1 FROM contacts c WHERE c.recipient = q.recipient AND c.from_email = q.from_email '
+            'AND c.contacted_at >= q.reserved_at)', (from_email, since)).fetchone()[0]
+        return contacts + reserved
+
+    def reserve_send(self, from_email: str, recipient: str, daily_limit: int) -> Optional[int]:
+        """
+        Claim one send from ``from_email``'s rolling 24h quota (across workers and
+        restarts). Returns a reservation id, or None once the quota is used up.
+        """
+        from_email = (from_email or '').lower()
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('DELETE FROM send_quota WHERE reserved_at < ?', (now - DAY_SECONDS,))
+                reservation = None
+                if self._sends_since(conn, from_email, now - DAY_SECONDS) < daily_limit:
+                    reservation = conn.execute(
+                        'INSERT INTO send_quota (from_email, recipient, reserved_at) VALUES (?, ?, ?)',
+                        (from_email, (recipient or '').strip().lower(), now)).lastrowid
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return reservation
+
+    def release_send(self, reservation: int) -> None:
+        """Give back a reservation whose email was never accepted"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM send_quota WHERE id = ?', (reservation,))
+
+    def sends_today(self, from_email: str) -> int:
+        """Sends counted against ``from_email``'s quota in the last 24h"""
+        with self._connect() as conn:
+            return self._sends_since(conn, (from_email or '').lower(), time.time() - DAY_SECONDS)
+
+    def send_times(self, from_email: str, since: float) -> List[float]:
+        """Epoch times of emails archived from a sender since ``since``"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT contacted_at FROM contacts WHERE from_email = ? AND contacted_at >= ?',
+                                ((from_email or '').lower(), since)).fetchall()
+        return [row['contacted_at'] for row in rows]
+
+
+recipient_index = RecipientIndex(RECIPIENT_INDEX_PATH)
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from jd_cache import jd_cache_key
+
+# Resume pipeline stages in order; redoing a stage invalidates every later one
+RESUME_STAGES = ('skills', 'resume_json', 'document')
+
+
+class ArtifactStore:
+    """
+    File-backed store of resume pipeline outputs, keyed by JD hash and stage.
+
+    Layout: <root>/<jd_hash>/<stage>.json holding {"stage", "created_at", "value"}.
+    Writes go through a temp file + os.replace so a crash never leaves a
+    half-written artifact behind.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def jd_hash(job_description: str) -> str:
+        return jd_cache_key(job_description)
+
+    def _path(self, jd_hash: str, stage: str) -> str:
+        if not re.fullmatch(r'[0-9a-f]{64}', jd_hash or ''):
+            raise ValueError(f"Invalid JD hash: {jd_hash!r}")
+        if stage not in RESUME_STAGES:
+            raise ValueError(f"Unknown resume stage: {stage}")
+        return os.path.join(self.root, jd_hash, f"{stage}.json")
+
+    def get(self, jd_hash: str, stage: str) -> Optional[Any]:
+        path = self._path(jd_hash, stage)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['value']
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"⚠️ Ignoring unreadable artifact {path}: {e}")
+            return None
+
+    def put(self, jd_hash: str, stage: str, value: Any) -> None:
+        path = self._path(jd_hash, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'stage': stage, 'created_at': time.time(), 'value': value}, f, indent=2)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+
+    def invalidate(self, jd_hash: str, from_stage: str = RESUME_STAGES[0]) -> list:
+        """Delete ``from_stage`` and all later stages; returns the stages removed."""
+        removed = []
+        for stage in RESUME_STAGES[RESUME_STAGES.index(from_stage):]:
+            try:
+                os.remove(self._path(jd_hash, stage))
+                removed.append(stage)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stages(self, jd_hash: str) -> Dict[str, Optional[float]]:
+        """created_at of each completed stage (None when missing or unreadable)."""
+        completed = {}
+        for stage in RESUME_STAGES:
+            try:
+                with open(self._path(jd_hash, stage), 'r', encoding='utf-8') as f:
+                    completed[stage] = json.load(f).get('created_at')
+            except (OSError, ValueError, AttributeError):
+                completed[stage] = None
+        return completed
+
+
+resume_artifacts = ArtifactStore(os.getenv('RESUME_ARTIFACTS_DIR', os.path.join(os.getcwd(), 'resume_artifacts')))
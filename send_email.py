@@ -12,10 +12,19 @@ from langchain_core.runnables import Runnable
 from langchain_groq import ChatGroq
 from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
+from deadlines import budget_note, timeout_for
+from bulk_sender import bulk_engine
+from smtp_pool import smtp_pool
+from attachment_cache import AttachmentData, attachment_cache, mime_type_for
+from mail_merge import MailMerge, MergeRecipient
+from send_metrics import send_metrics
 
 # Load environment variables
 load_dotenv()
 
+# Upper bound for connect/login/send; shortened further by the request deadline
+SMTP_TIMEOUT_SECONDS = float(os.getenv('SMTP_TIMEOUT_SECONDS', '30'))
+
 # Initialize Groq model and parser
 groq_model = ChatGroq(
     model="llama-3.1-8b-instant",
@@ -56,105 +65,120 @@ class EmailSender:
             bool: True if email sent successfully, False otherwise
         """
         try:
-            # Compose message
-            msg = EmailMessage()
-            msg['Subject'] = subject
-            msg['From'] = self.sender_email
-            msg['To'] = recruiter_email
-            
-            # Handle CC
-            if cc:
-                if isinstance(cc, str):
-                    # Split comma-separated emails and strip whitespace
-                    cc_list = [email.strip() for email in cc.split(',') if email.strip()]
-                    if cc_list:
-                        msg['Cc'] = ', '.join(cc_list)
-                elif isinstance(cc, list):
-                    cc_list = [email.strip() for email in cc if email.strip()]
-                    if cc_list:
-                        msg['Cc'] = ', '.join(cc_list)
-            
-            # Handle BCC
-            if bcc:
-                if isinstance(bcc, str):
-                    # Split comma-separated emails and strip whitespace
-                    bcc_list = [email.strip() for email in bcc.split(',') if email.strip()]
-                    if bcc_list:
-                        msg['Bcc'] = ', '.join(bcc_list)
-                elif isinstance(bcc, list):
-                    bcc_list = [email.strip() for email in bcc if email.strip()]
-                    if bcc_list:
-                        msg['Bcc'] = ', '.join(bcc_list)
-            
-            # Set both plain text and HTML content if HTML is provided
-            if body_html:
-                msg.set_content(body)
-                msg.add_alternative(body_html, subtype='html')
-            else:
-                msg.set_content(body)
-
-            # Attach resume if requested and file exists
-            if attach_resume and os.path.exists(self.resume_file):
-                # Use original filename if set, otherwise use the file path basename
-                # This preserves the original filename for ALL users regardless of their system
-                attachment_filename = getattr(self, '_original_filename', None) or os.path.basename(self.resume_file)
-                print(f"Attaching: {attachment_filename}")
-                
-                # Detect file type from extension to set correct MIME type
-                file_ext = os.path.splitext(attachment_filename.lower())[1]
-                if file_ext == '.pdf':
-                    maintype, subtype = 'application', 'pdf'
-                elif file_ext in ['.doc', '.docx']:
-                    maintype, subtype = 'application', 'vnd.openxmlformats-officedocument.wordprocessingml.document' if file_ext == '.docx' else 'msword'
-                else:
-                    # Default to PDF if unknown
-                    maintype, subtype = 'application', 'pdf'
-                
-                with open(self.resume_file, 'rb') as f:
-                    msg.add_attachment(
-                        f.read(), 
-                        maintype=maintype, 
-                        subtype=subtype, 
-                        filename=attachment_filename
-                    )
-            
-            # Send email
-            with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-                smtp.login(self.sender_email, self.app_password)
-                smtp.send_message(msg)
-            print(f"✅ Sent to {recruiter_name} at {recruiter_email}")
+            self.deliver(recruiter_email, recruiter_name, subject, body, attach_resume, cc, bcc, body_html)
             return True
-            
         except Exception as e:
             print(f"❌ Failed to send to {recruiter_email}: {e}")
             return False
     
+    def deliver(self, recruiter_email: str, recruiter_name: str, subject: str, body: str, 
+                attach_resume: bool = True, cc: Optional[Union[str, List[str]]] = None, 
+                bcc: Optional[Union[str, List[str]]] = None, body_html: Optional[str] = None,
+                resume_file: Optional[str] = None, attachment: Optional[AttachmentData] = None) -> None:
+        """
+        Like send_email, but raises on failure so callers can report the reason.
+        ``resume_file`` attaches that file instead of this sender's resume;
+        ``attachment`` attaches in-memory bytes (e.g. an upload) instead of any file.
+        """
+        # Stage timings (build, SMTP connect/login/DATA) join the caller's timed operation if there is one
+        with send_metrics.operation('deliver', self.sender_email, recipient=recruiter_email):
+            with send_metrics.stage('build_message'):
+                msg = self.build_message(recruiter_email, subject, body, attach_resume, cc, bcc, body_html,
+                                         resume_file, attachment)
+            
+            # Send email
+            smtp_timeout = timeout_for(SMTP_TIMEOUT_SECONDS, 'SMTP send')
+            print(f"📤 Sending via pooled SMTP session with {smtp_timeout:.1f}s timeout{budget_note()}")
+            smtp_pool.send_message(self.sender_email, self.app_password, msg, timeout=smtp_timeout)
+            print(f"✅ Sent to {recruiter_name} at {recruiter_email}")
+    
+    def build_message(self, recruiter_email: str, subject: str, body: str, attach_resume: bool = True,
+                      cc: Optional[Union[str, List[str]]] = None, bcc: Optional[Union[str, List[str]]] = None,
+                      body_html: Optional[str] = None, resume_file: Optional[str] = None,
+                      attachment: Optional[AttachmentData] = None) -> EmailMessage:
+        """Compose the MIME message (headers, body and optional resume attachment)"""
+        # Compose message
+        msg = EmailMessage()
+        msg['Subject'] = subject
+        msg['From'] = self.sender_email
+        msg['To'] = recruiter_email
+        
+        # Handle CC
+        if cc:
+            if isinstance(cc, str):
+                # Split comma-separated emails and strip whitespace
+                cc_list = [email.strip() for email in cc.split(',') if email.strip()]
+                if cc_list:
+                    msg['Cc'] = ', '.join(cc_list)
+            elif isinstance(cc, list):
+                cc_list = [email.strip() for email in cc if email.strip()]
+                if cc_list:
+                    msg['Cc'] = ', '.join(cc_list)
+        
+        # Handle BCC
+        if bcc:
+            if isinstance(bcc, str):
+                # Split comma-separated emails and strip whitespace
+                bcc_list = [email.strip() for email in bcc.split(',') if email.strip()]
+                if bcc_list:
+                    msg['Bcc'] = ', '.join(bcc_list)
+            elif isinstance(bcc, list):
+                bcc_list = [email.strip() for email in bcc if email.strip()]
+                if bcc_list:
+                    msg['Bcc'] = ', '.join(bcc_list)
+        
+        # Set both plain text and HTML content if HTML is provided
+        if body_html:
+            msg.set_content(body)
+            msg.add_alternative(body_html, subtype='html')
+        else:
+            msg.set_content(body)
+
+        # Attach resume if requested: in-memory bytes first, otherwise the file if it exists
+        resume_file = resume_file or self.resume_file
+        if attach_resume and attachment is not None:
+            print(f"Attaching: {attachment.filename}")
+            maintype, subtype = mime_type_for(attachment.filename)
+            with send_metrics.stage('attach_resume'):
+                attachment_cache.attach_data(msg, attachment, maintype, subtype)
+        elif attach_resume and os.path.exists(resume_file):
+            # Use original filename if set, otherwise use the file path basename
+            # This preserves the original filename for ALL users regardless of their system
+            original_filename = getattr(self, '_original_filename', None) if resume_file == self.resume_file else None
+            attachment_filename = original_filename or os.path.basename(resume_file)
+            print(f"Attaching: {attachment_filename}")
+            
+            # Detect file type from extension to set correct MIME type
+            maintype, subtype = mime_type_for(attachment_filename)
+            
+            # Cached, pre-encoded part: repeated sends of the same resume skip the read + base64
+            with send_metrics.stage('attach_resume'):
+                attachment_cache.attach(msg, resume_file, attachment_filename, maintype, subtype)
+        
+        return msg
+    
     def send_bulk_emails(self, recruiter_contacts: dict, subject: str, body: str, 
-                         attach_resume: bool = True) -> List[dict]:
+                         attach_resume: bool = True, progress=None) -> List[dict]:
         """
-        Send emails to multiple recruiters
+        Send emails to multiple recruiters (in parallel, throttled per sender account)
         
         Args:
             recruiter_contacts: Dictionary with {email: name} pairs
             subject: Email subject
-            body: Email body (can use {name} placeholder)
+            body: Email body (can use {name} and the other mail_merge.MERGE_FIELDS placeholders)
             attach_resume: Whether to attach resume file
+            progress: Optional callback(result, done, total) called as each email finishes
             
         Returns:
             List of results for each email sent
+
+        Raises:
+            TemplateError: if the templates or recipients fail validation (nothing is sent)
         """
-        results = []
-        for email, name in recruiter_contacts.items():
-            # Replace {name} placeholder in body if present
-            personalized_body = body.format(name=name) if '{name}' in body else body
-            
-            success = self.send_email(email, name, subject, personalized_body, attach_resume)
-            results.append({
-                'email': email,
-                'name': name,
-                'success': success
-            })
-        return results
+        recipients = [MergeRecipient.from_value({'email': email, 'name': name}) for email, name in recruiter_contacts.items()]
+        merge = MailMerge(subject, body)
+        merge.check(recipients, attach_resume)
+        return bulk_engine.send(self, recipients, merge, attach_resume, progress=progress)
     
 
 
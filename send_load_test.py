@@ -0,0 +1,262 @@
+"""
+Load test of the email send pipeline against a local SMTP sink (no real mail).
+
+Starts smtp_sink.SMTPSink, points the app's SMTP pool at it, serves app.py on a
+local port and drives it at increasing concurrency:
+
+    send_email  N concurrent POST /send_email requests (queued, then delivered by
+                the outbox worker); accept latency is time to the 202, delivery
+                latency is request start to the sink accepting the message
+    bulk        one POST /send_bulk with N recipients and `level` SMTP connections
+
+For each level it reports messages/sec, latency percentiles, and connection
+counts seen by the sink (opened, logins, peak concurrent) and the pool
+(opened vs reused sessions).
+
+Usage:
+    python send_load_test.py --levels 1,2,4,8 --messages 40 --latency-ms 50
+    python send_load_test.py --modes bulk --attachment-kb 200 --output load_report.json
+
+Runs in a throwaway working directory, so email.json, the sent-email archive and the
+outbox database of the real app are never touched.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from smtp_sink import SMTPSink
+
+MODES = ['send_email', 'bulk']
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 1)
+
+
+def _latency_summary(values_ms: List[float]) -> Dict[str, Optional[float]]:
+    return {'p50_ms': _percentile(values_ms, 0.5), 'p95_ms': _percentile(values_ms, 0.95),
+            'p99_ms': _percentile(values_ms, 0.99), 'max_ms': _percentile(values_ms, 1.0)}
+
+
+def _sender_for(mode: str, level: int) -> str:
+    # One account per run, so each run gets fresh bulk throttles sized to its level
+    return f"load-{mode.replace('_', '-')}-c{level}@loadtest.invalid"
+
+
+def _recipient(mode: str, level: int, i: int) -> str:
+    return f"{mode.replace('_', '-')}-c{level}-{i}@loadtest.invalid"
+
+
+def _prepare_workdir(workdir: str, levels: List[int], attachment_kb: int) -> str:
+    senders = {
+        _sender_for(mode, level): [{'name': 'Load Test', 'smtp_username': _sender_for(mode, level),
+                                    'smtp_password': 'sink-accepts-anything', 'years_of_experience': '5'}]
+        for mode in MODES for level in levels
+    }
+    with open(os.path.join(workdir, 'email.json'), 'w') as f:
+        json.dump(senders, f, indent=2)
+    resume_path = os.path.join(workdir, 'Load_Test_Resume.pdf')
+    with open(resume_path, 'wb') as f:
+        f.write(b'%PDF-1.4\n' + os.urandom(max(attachment_kb, 1) * 1024))
+    return resume_path
+
+
+def _post(url: str, data: bytes, content_type: str, timeout: float = 120):
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': content_type}, method='POST')
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def _wait_for_arrivals(sink: SMTPSink, recipients: List[str], timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if all(r in sink.arrivals for r in recipients):
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def run_send_email(base_url: str, sink: SMTPSink, level: int, messages: int, resume_path: str,
+                   timeout: float) -> Dict[str, Any]:
+    sender = _sender_for('send_email', level)
+    recipients = [_recipient('send_email', level, i) for i in range(messages)]
+    started_at: Dict[str, float] = {}
+    accept_ms: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def post_one(recipient: str) -> None:
+        form = urllib.parse.urlencode({
+            'recruiter_email': recipient, 'recruiter_name': 'Load Test', 'subject': 'Load test',
+            'body': 'Hello,\n\nThis is a load test message.\n', 'sender_email': sender, 'resume_path': resume_path,
+        }).encode()
+        start = time.time()
+        try:
+            with _post(f"{base_url}/send_email", form, 'application/x-www-form-urlencoded', timeout) as response:
+                response.read()
+            with lock:
+                started_at[recipient] = start
+                accept_ms.append((time.time() - start) * 1000)
+        except Exception as e:
+            with lock:
+                errors.append(f"{recipient}: {e}")
+
+    run_start = time.time()
+    with ThreadPoolExecutor(max_workers=level) as executor:
+        list(executor.map(post_one, recipients))
+    accepted_for = time.time() - run_start
+    delivered = _wait_for_arrivals(sink, list(started_at), timeout)
+    arrivals = [sink.arrivals[r] for r in started_at if r in sink.arrivals]
+    wall = (max(arrivals) - run_start) if arrivals else None
+    return {
+        'accepted': len(started_at), 'delivered': len(arrivals), 'all_delivered': delivered, 'errors': errors[:5],
+        'accept_per_sec': round(len(started_at) / accepted_for, 1) if accepted_for else None,
+        'msgs_per_sec': round(len(arrivals) / wall, 1) if wall else None,
+        'accept_latency': _latency_summary(accept_ms),
+        'delivery_latency': _latency_summary([(sink.arrivals[r] - started_at[r]) * 1000
+                                              for r in started_at if r in sink.arrivals]),
+    }
+
+
+def run_bulk(base_url: str, sink: SMTPSink, level: int, messages: int, resume_path: str,
+             timeout: float) -> Dict[str, Any]:
+    from bulk_sender import bulk_engine
+    bulk_engine.connections_per_sender = level
+    sender = _sender_for('bulk', level)
+    payload = json.dumps({
+        'recipients': [{'email': _recipient('bulk', level, i), 'name': 'Load Test'} for i in range(messages)],
+        'subject': 'Load test', 'body': 'Hello {name},\n\nThis is a load test message.\n',
+        'sender_email': sender, 'resume_path': resume_path,
+    }).encode()
+
+    send_ms: List[float] = []
+    errors: List[str] = []
+    start = time.time()
+    with _post(f"{base_url}/send_bulk", payload, 'application/json', timeout) as response:
+        for line in response:
+            result = json.loads(line)
+            if 'summary' in result or 'index' not in result:
+                continue
+            if result.get('success'):
+                send_ms.append(result['elapsed_ms'])
+            else:
+                errors.append(f"{result.get('email')}: {result.get('error')}")
+    wall = time.time() - start
+    return {
+        'delivered': len(send_ms), 'errors': errors[:5],
+        'msgs_per_sec': round(len(send_ms) / wall, 1) if wall else None,
+        'send_latency': _latency_summary(send_ms),
+    }
+
+
+RUNNERS = {'send_email': run_send_email, 'bulk': run_bulk}
+
+
+def _delta(after: Dict[str, int], before: Dict[str, int], keys: List[str]) -> Dict[str, int]:
+    return {key: after.get(key, 0) - before.get(key, 0) for key in keys}
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    print(f"\n{'mode':<11}{'conc':>5}{'msgs':>6}{'msg/s':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}"
+          f"{'sink conn':>11}{'peak':>6}{'opened':>8}{'reused':>8}")
+    for r in results:
+        latency = r.get('delivery_latency') or r.get('send_latency') or {}
+        print(f"{r['mode']:<11}{r['concurrency']:>5}{r['delivered']:>6}{str(r['msgs_per_sec']):>8}"
+              f"{str(latency.get('p50_ms')):>9}{str(latency.get('p95_ms')):>9}{str(latency.get('p99_ms')):>9}"
+              f"{r['sink']['connections']:>11}{r['sink']['peak_active']:>6}"
+              f"{r['pool']['opened']:>8}{r['pool']['reused']:>8}")
+        if r.get('accept_latency'):
+            print(f"{'':<16}accept: {r['accept_per_sec']} req/s, p50 {r['accept_latency']['p50_ms']}ms, "
+                  f"p95 {r['accept_latency']['p95_ms']}ms")
+        for error in r.get('errors') or []:
+            print(f"{'':<16}⚠️ {error}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark /send_email and /send_bulk against a local SMTP sink")
+    parser.add_argument('--levels', default='1,2,4,8', help="Comma-separated concurrency levels")
+    parser.add_argument('--messages', type=int, default=40, help="Messages per mode and level")
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--latency-ms', type=float, default=50, help="Sink delay per message (server round-trip)")
+    parser.add_argument('--attachment-kb', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds to wait for each run to deliver")
+    parser.add_argument('--workdir', help="Working directory for the app (default: a new temp dir)")
+    parser.add_argument('--verbose', action='store_true', help="Show the app's own log output")
+    parser.add_argument('--output', help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    unknown = [m for m in modes if m not in RUNNERS]
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+    output = os.path.abspath(args.output) if args.output else None
+
+    sink = SMTPSink(latency_ms=args.latency_ms).start()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='send_load_test_')
+    resume_path = _prepare_workdir(workdir, levels, args.attachment_kb)
+
+    # The app reads its data files from the working directory and its SMTP, outbox and
+    # bulk settings at import time, so all of this must happen before importing it
+    os.chdir(workdir)
+    os.environ.update({'SMTP_HOST': sink.host, 'SMTP_PORT': str(sink.port), 'SMTP_SECURITY': 'none'})
+    os.environ.setdefault('GROQ_API_KEY', 'load-test')
+    os.environ.setdefault('OUTBOX_POLL_SECONDS', '0.5')
+    os.environ.setdefault('BULK_DAILY_LIMIT', '1000000')
+    os.environ.setdefault('BULK_PER_MINUTE', '1000000')
+    os.environ.setdefault('BULK_MAX_RECIPIENTS', str(max(args.messages, 200)))
+
+    from werkzeug.serving import make_server
+    from app import app
+    from smtp_pool import smtp_pool
+
+    if not args.verbose:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-http', daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"📨 Sink on {sink.host}:{sink.port} ({args.latency_ms:g}ms/msg), app on {base_url}, workdir {workdir}")
+
+    results = []
+    for mode in modes:
+        for level in levels:
+            print(f"▶️  {mode} x{args.messages} at concurrency {level}...")
+            smtp_pool.close_all()
+            sink.reset_peak()
+            sink_before, pool_before = sink.snapshot(), smtp_pool.snapshot()
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+            with quiet:
+                result = RUNNERS[mode](base_url, sink, level, args.messages, resume_path, args.timeout)
+            sink_after, pool_after = sink.snapshot(), smtp_pool.snapshot()
+            result.update({
+                'mode': mode, 'concurrency': level, 'messages': args.messages,
+                'sink': {**_delta(sink_after, sink_before, ['connections', 'logins', 'messages']),
+                         'peak_active': sink_after['peak_active']},
+                'pool': _delta(pool_after, pool_before, ['opened', 'reused', 'noop_failed', 'closed']),
+            })
+            results.append(result)
+
+    server.shutdown()
+    sink.stop()
+    print_report(results)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'latency_ms': args.latency_ms, 'attachment_kb': args.attachment_kb, 'results': results}, f, indent=2)
+        print(f"\n✅ Report saved to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+SEND_METRICS_LOG = os.getenv('SEND_METRICS_LOG', 'true').lower() not in ('0', 'false', 'no')
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is everything slower)
+BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+_timing_log = logging.getLogger('send_timing')
+if not _timing_log.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    _timing_log.addHandler(_handler)
+    _timing_log.setLevel(logging.INFO)
+    _timing_log.propagate = False
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, other: 'Histogram') -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation, capped at the slowest one seen"""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count and i < len(BUCKETS_MS):
+                return min(float(BUCKETS_MS[i]), round(self.max_ms, 1))
+        return round(self.max_ms, 1)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 1) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': round(self.max_ms, 1),
+            'buckets': {('le_' + str(bound)) if i < len(BUCKETS_MS) else 'inf': n
+                        for i, (bound, n) in enumerate(zip(BUCKETS_MS + [None], self.counts)) if n},
+        }
+
+
+class SendTiming:
+    """Stage durations for one timed operation (a request, or one delivery)."""
+
+    def __init__(self, operation: str, sender: str = ''):
+        self.operation = operation
+        self.sender = sender or ''
+        self.fields: Dict[str, Any] = {}
+        self.stages: "OrderedDict[str, float]" = OrderedDict()
+        self.started = time.perf_counter()
+        self._lap = self.started
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def lap(self, stage: str) -> None:
+        """Charge the time since the previous lap (or the start) to ``stage``"""
+        now = time.perf_counter()
+        self.add(stage, now - self._lap)
+        self._lap = now
+
+
+_current: contextvars.ContextVar[Optional[SendTiming]] = contextvars.ContextVar('send_timing', default=None)
+
+
+class SendMetrics:
+    """
+    Where the time goes on the send path, per sender account.
+
+    An operation (``operation()`` / ``timed()``) collects stage durations from
+    ``stage()`` blocks and ``lap()`` marks anywhere below it on the same thread
+    or context; nested operations join the outer one. When it ends, one JSON
+    log line is written and every stage (plus ``total``) is added to a
+    histogram keyed by (sender, operation, stage).
+    """
+
+    def __init__(self, log_enabled: bool = SEND_METRICS_LOG):
+        self.log_enabled = log_enabled
+        self._histograms: Dict[str, Dict[str, Dict[str, Histogram]]] = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(Histogram)))
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def operation(self, operation: str, sender: str = '', **fields: Any):
+        current = _current.get()
+        if current is not None:
+            current.fields.update(fields)
+            yield current
+            return
+        timing = SendTiming(operation, sender)
+        timing.fields.update(fields)
+        token = _current.set(timing)
+        outcome = 'ok'
+        try:
+            yield timing
+        except BaseException as e:
+            outcome = f"error:{type(e).__name__}"
+            raise
+        finally:
+            _current.reset(token)
+            self._finish(timing, timing.fields.pop('outcome', outcome))
+
+    def timed(self, operation: str):
+        """Decorator for a Flask view: the whole request is one operation; 4xx/5xx count as errors"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                with self.operation(operation) as timing:
+                    response = view(*args, **kwargs)
+                    status = response[1] if isinstance(response, tuple) and len(response) > 1 else 200
+                    timing.fields.setdefault('status', status)
+                    if isinstance(status, int) and status >= 400:
+                        timing.fields['outcome'] = f"http_{status}"
+                    return response
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            current = _current.get()
+            if current is not None:
+                current.add(name, time.perf_counter() - started)
+
+    def lap(self, name: str) -> None:
+        current = _current.get()
+        if current is not None:
+            current.lap(name)
+
+    def annotate(self, sender: Optional[str] = None, **fields: Any) -> None:
+        """Attach the sender (once known) and extra log fields to the current operation"""
+        current = _current.get()
+        if current is None:
+            return
+        if sender is not None:
+            current.sender = sender
+        current.fields.update(fields)
+
+    def _finish(self, timing: SendTiming, outcome: str) -> None:
+        total = time.perf_counter() - timing.started
+        stages_ms = {stage: round(seconds * 1000, 2) for stage, seconds in timing.stages.items()}
+        sender = (timing.sender or 'unknown').lower()
+        with self._lock:
+            by_stage = self._histograms[sender][timing.operation]
+            for stage, ms in stages_ms.items():
+                by_stage[stage].observe(ms)
+            by_stage['total'].observe(total * 1000)
+        if self.log_enabled:
+            try:
+                _timing_log.info(json.dumps({
+                    'event': 'send_timing', 'operation': timing.operation, 'sender': sender,
+                    'outcome': outcome, 'total_ms': round(total * 1000, 2), 'stages_ms': stages_ms,
+                    **timing.fields
+                }, default=str))
+            except Exception as e:
+                logging.warning(f"⚠️ Could not write send timing log: {e}")
+
+    def snapshot(self, sender: Optional[str] = None, operation: Optional[str] = None) -> Dict[str, Any]:
+        """Histogram summaries by sender -> operation -> stage, plus an all-senders rollup"""
+        with self._lock:
+            rollup: Dict[str, Dict[str, Histogram]] = defaultdict(lambda: defaultdict(Histogram))
+            senders: Dict[str, Any] = {}
+            for sender_key, operations in self._histograms.items():
+                for op, stages in operations.items():
+                    if operation and op != operation:
+                        continue
+                    for stage, histogram in stages.items():
+                        rollup[op][stage].merge(histogram)
+                    if sender and sender_key != sender.lower():
+                        continue
+                    senders.setdefault(sender_key, {})[op] = {s: h.summary() for s, h in stages.items()}
+            return {
+                'buckets_ms': BUCKETS_MS,
+                'all_senders': {op: {s: h.summary() for s, h in stages.items()} for op, stages in rollup.items()},
+                'senders': senders,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+send_metrics = SendMetrics()
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+SENDERS_PATH = os.getenv('SENDERS_PATH', os.path.join(os.getcwd(), 'email.json'))
+# How often lookups may stat email.json for changes
+SENDERS_RELOAD_CHECK_SECONDS = float(os.getenv('SENDERS_RELOAD_CHECK_SECONDS', '2'))
+
+
+@dataclass(frozen=True)
+class SenderProfile:
+    """One sending account from email.json (its first entry)."""
+    email: str
+    name: str = ''
+    phone: str = ''
+    linkedin_url: str = ''
+    years_of_experience: str = ''
+    smtp_username: str = ''
+    smtp_password: str = field(default='', repr=False)
+
+    @classmethod
+    def from_entry(cls, email: str, entry: dict) -> 'SenderProfile':
+        return cls(
+            email=email,
+            name=entry.get('name') or '',
+            phone=entry.get('phone_number') or '',
+            linkedin_url=entry.get('linkedin_url') or '',
+            years_of_experience=str(entry.get('years_of_experience') or ''),
+            smtp_username=entry.get('smtp_username') or email,
+            smtp_password=entry.get('smtp_password') or entry.get('app_password') or '',
+        )
+
+    def public(self) -> Dict[str, str]:
+        """Fields safe to send to the browser (no credentials)"""
+        return {'email': self.email, 'name': self.name, 'phone': self.phone, 'linkedin': self.linkedin_url}
+
+
+class SenderRegistry:
+    """
+    Sender profiles from email.json, parsed once and kept in memory.
+
+    Lookups are dict hits by lower-cased address. At most every
+    ``check_interval`` seconds a lookup stats the file and reloads it if its
+    mtime or size changed; if the new file does not parse, the previous
+    profiles stay in use.
+    """
+
+    def __init__(self, path: str, check_interval: float = SENDERS_RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.check_interval = check_interval
+        self._profiles: Dict[str, SenderProfile] = {}
+        self._order: List[SenderProfile] = []
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self._maybe_reload(force=True)
+
+    def _maybe_reload(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if not force and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                st = os.stat(self.path)
+                signature = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                signature = None
+            if signature == self._signature and not force:
+                return
+            try:
+                profiles = self._load() if signature else []
+            except Exception as e:
+                # Remember the broken version so it is not re-parsed until the file changes again
+                self._signature = signature
+                logging.warning(f"⚠️ Could not reload {self.path}, keeping previous senders: {e}")
+                return
+            self._order = profiles
+            self._profiles = {profile.email.lower(): profile for profile in profiles}
+            self._signature = signature
+            self.reloads += 1
+            print(f"📋 Loaded {len(profiles)} sender profile(s) from {self.path}")
+
+    def _load(self) -> List[SenderProfile]:
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError('expected an object of {email: [entry, ...]}')
+        profiles = []
+        # data is expected to be { email: [ {name, phone_number, smtp_username, smtp_password}, ... ] }
+        for email, entries in data.items():
+            entry = entries[0] if isinstance(entries, list) and entries and isinstance(entries[0], dict) else {}
+            profiles.append(SenderProfile.from_entry(email, entry))
+        return profiles
+
+    def get(self, email: str) -> Optional[SenderProfile]:
+        if not email:
+            return None
+        self._maybe_reload()
+        return self._profiles.get(email.strip().lower())
+
+    def default(self) -> Optional[SenderProfile]:
+        """The first sender in email.json, used when a request names none"""
+        self._maybe_reload()
+        order = self._order
+        return order[0] if order else None
+
+    def all(self) -> List[SenderProfile]:
+        self._maybe_reload()
+        return list(self._order)
+
+
+sender_registry = SenderRegistry(SENDERS_PATH)
@@ -0,0 +1,200 @@
+import atexit
+import hashlib
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from email.message import EmailMessage
+from typing import Dict, List, Tuple
+
+from send_metrics import send_metrics
+
+# Where mail is submitted. Defaults to Gmail over implicit TLS; point these at a
+# local sink (see smtp_sink.py) to test or benchmark without sending real mail.
+# SMTP_SECURITY: 'ssl' (implicit TLS), 'starttls', or 'none' (plain, local use only)
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '465'))
+SMTP_SECURITY = os.getenv('SMTP_SECURITY', 'ssl').lower()
+
+
+class PooledSMTPConnection:
+    """An authenticated SMTP session plus the bookkeeping the pool needs."""
+
+    def __init__(self, smtp: smtplib.SMTP, key: Tuple):
+        self.smtp = smtp
+        self.key = key
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.reused = False
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_used
+
+    def close(self) -> None:
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """
+    Keeps authenticated SMTP sessions alive per sender account so each email
+    skips the TCP + TLS + AUTH handshake.
+
+    A connection is checked out by one thread at a time. On checkout, sessions
+    older than ``max_lifetime`` are retired and sessions idle longer than
+    ``noop_after`` are probed with NOOP; a failed probe means the server closed
+    it, so a fresh one is opened instead. If a reused session still drops
+    mid-send, the message is retried once on a new connection.
+    """
+
+    def __init__(self, host: str, port: int, max_idle_per_account: int = 2,
+                 max_lifetime: float = 600, noop_after: float = 10, security: str = 'ssl'):
+        if security not in ('ssl', 'starttls', 'none'):
+            raise ValueError(f"Unknown SMTP security mode: {security}")
+        self.host = host
+        self.port = port
+        self.security = security
+        self.max_idle_per_account = max_idle_per_account
+        self.max_lifetime = max_lifetime
+        self.noop_after = noop_after
+        self._idle: Dict[Tuple, List[PooledSMTPConnection]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self.stats = {'opened': 0, 'reused': 0, 'noop_failed': 0, 'expired': 0, 'retried': 0, 'closed': 0}
+
+    def _key(self, username: str, password: str) -> Tuple:
+        # Password is part of the key so changed credentials never reuse an old session
+        return (self.host, self.port, username, hashlib.sha256((password or '').encode('utf-8')).hexdigest()[:16])
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _open(self, key: Tuple, username: str, password: str, timeout: float) -> PooledSMTPConnection:
+        with send_metrics.stage('smtp_connect'):
+            if self.security == 'ssl':
+                smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=timeout)
+            else:
+                smtp = smtplib.SMTP(self.host, self.port, timeout=timeout)
+        try:
+            if self.security == 'starttls':
+                with send_metrics.stage('smtp_starttls'):
+                    smtp.starttls()
+            with send_metrics.stage('smtp_login'):
+                smtp.login(username, password)
+        except Exception:
+            smtp.close()
+            raise
+        self._count('opened')
+        return PooledSMTPConnection(smtp, key)
+
+    def _discard(self, conn: PooledSMTPConnection) -> None:
+        conn.close()
+        self._count('closed')
+
+    def _checkout_idle(self, key: Tuple, timeout: float):
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                return None
+            if conn.age() > self.max_lifetime:
+                self._count('expired')
+                self._discard(conn)
+                continue
+            try:
+                if conn.smtp.sock is not None:
+                    conn.smtp.sock.settimeout(timeout)
+                if conn.idle_for() > self.noop_after:
+                    with send_metrics.stage('smtp_noop'):
+                        code = conn.smtp.noop()[0]
+                    if code != 250:
+                        raise smtplib.SMTPServerDisconnected('NOOP rejected')
+            except Exception as e:
+                logging.info(f"SMTP session for {key[2]} went stale ({e}); reconnecting")
+                self._count('noop_failed')
+                self._discard(conn)
+                continue
+            conn.reused = True
+            self._count('reused')
+            return conn
+
+    def acquire(self, username: str, password: str, timeout: float) -> PooledSMTPConnection:
+        key = self._key(username, password)
+        return self._checkout_idle(key, timeout) or self._open(key, username, password, timeout)
+
+    def release(self, conn: PooledSMTPConnection, healthy: bool = True) -> None:
+        conn.last_used = time.monotonic()
+        if healthy and conn.age() < self.max_lifetime:
+            with self._lock:
+                idle = self._idle[conn.key]
+                if len(idle) < self.max_idle_per_account:
+                    idle.append(conn)
+                    return
+        self._discard(conn)
+
+    @contextmanager
+    def connection(self, username: str, password: str, timeout: float):
+        """Check out an authenticated session; it goes back to the pool unless it failed."""
+        conn = self.acquire(username, password, timeout)
+        healthy = False
+        try:
+            yield conn
+            healthy = True
+        except smtplib.SMTPRecipientsRefused:
+            # smtplib already RSET the session; only this message failed
+            healthy = True
+            raise
+        finally:
+            self.release(conn, healthy=healthy)
+
+    def send_message(self, username: str, password: str, msg: EmailMessage, timeout: float) -> None:
+        reused = False
+        try:
+            with self.connection(username, password, timeout) as conn:
+                reused = conn.reused
+                send_metrics.annotate(smtp_reused=reused)
+                with send_metrics.stage('smtp_data'):
+                    conn.smtp.send_message(msg)
+            return
+        except smtplib.SMTPServerDisconnected:
+            if not reused:
+                raise
+            logging.info(f"Pooled SMTP session for {username} dropped mid-send; retrying on a new connection")
+        self._count('retried')
+        send_metrics.annotate(smtp_retried=True)
+        with self.connection(username, password, timeout) as conn:
+            with send_metrics.stage('smtp_data'):
+                conn.smtp.send_message(msg)
+
+    def close_all(self) -> None:
+        with self._lock:
+            connections = [conn for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+        for conn in connections:
+            self._discard(conn)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, 'idle': sum(len(idle) for idle in self._idle.values())}
+
+
+smtp_pool = SMTPConnectionPool(
+    SMTP_HOST, SMTP_PORT,
+    max_idle_per_account=int(os.getenv('SMTP_POOL_MAX_IDLE_PER_ACCOUNT', '2')),
+    max_lifetime=float(os.getenv('SMTP_POOL_MAX_LIFETIME_SECONDS', '600')),
+    noop_after=float(os.getenv('SMTP_POOL_NOOP_AFTER_SECONDS', '10')),
+    security=SMTP_SECURITY
+)
+atexit.register(smtp_pool.close_all)
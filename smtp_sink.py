@@ -0,0 +1,198 @@
+"""
+Local SMTP(S) sink for tests and benchmarks: accepts any login and any message,
+keeps nothing but counters and per-recipient arrival times.
+
+Point the app at it with:
+    SMTP_HOST=127.0.0.1 SMTP_PORT=2525 SMTP_SECURITY=none
+
+Usage:
+    python smtp_sink.py --port 2525 [--latency-ms 50] [--certfile cert.pem --keyfile key.pem]
+
+With a certificate it speaks implicit TLS (use SMTP_SECURITY=ssl, as with Gmail
+on 465). ``--latency-ms`` delays each DATA reply to stand in for a real
+server's round-trip and queueing time.
+"""
+import argparse
+import base64
+import socketserver
+import ssl
+import threading
+import time
+from typing import Dict, Optional
+
+MAX_LINE = 1024 * 1024
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """One SMTP session; just enough of RFC 5321 for smtplib."""
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def _readline(self) -> Optional[str]:
+        line = self.rfile.readline(MAX_LINE)
+        return line.decode('utf-8', 'replace').rstrip('\r\n') if line else None
+
+    def handle(self) -> None:
+        sink = self.server.sink
+        sink._opened()
+        recipients = []
+        try:
+            self._reply('220 localhost SMTP sink ready')
+            while True:
+                line = self._readline()
+                if line is None:
+                    return
+                verb, _, arg = line.partition(' ')
+                verb = verb.upper()
+                if verb == 'EHLO':
+                    self._reply('250-localhost')
+                    self._reply('250-AUTH PLAIN LOGIN')
+                    self._reply('250 SIZE 52428800')
+                elif verb == 'HELO':
+                    self._reply('250 localhost')
+                elif verb == 'AUTH':
+                    mechanism, _, initial = arg.partition(' ')
+                    if mechanism.upper() == 'PLAIN' and not initial:
+                        self._reply('334 ')
+                        self._readline()
+                    elif mechanism.upper() == 'LOGIN':
+                        self._reply('334 ' + base64.b64encode(b'Username:').decode())
+                        self._readline()
+                        self._reply('334 ' + base64.b64encode(b'Password:').decode())
+                        self._readline()
+                    sink._count('logins')
+                    self._reply('235 2.7.0 Authentication successful')
+                elif verb == 'MAIL':
+                    recipients = []
+                    self._reply('250 OK')
+                elif verb == 'RCPT':
+                    recipients.append(arg.split(':', 1)[-1].strip().strip('<>').lower())
+                    self._reply('250 OK')
+                elif verb == 'DATA':
+                    self._reply('354 End data with <CR><LF>.<CR><LF>')
+                    size = 0
+                    while True:
+                        data_line = self.rfile.readline(MAX_LINE)
+                        if not data_line or data_line in (b'.\r\n', b'.\n'):
+                            break
+                        size += len(data_line)
+                    if sink.latency:
+                        time.sleep(sink.latency)
+                    sink._received(recipients, size)
+                    recipients = []
+                    self._reply('250 OK queued')
+                elif verb in ('RSET', 'NOOP'):
+                    if verb == 'RSET':
+                        recipients = []
+                    self._reply('250 OK')
+                elif verb == 'QUIT':
+                    self._reply('221 Bye')
+                    return
+                else:
+                    self._reply('502 Command not implemented')
+        except (ConnectionError, ssl.SSLError, OSError):
+            return
+        finally:
+            sink._closed()
+
+
+class _ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, sink: 'SMTPSink'):
+        self.sink = sink
+        super().__init__(address, _SMTPHandler)
+
+    def get_request(self):
+        sock, addr = super().get_request()
+        if self.sink.ssl_context is not None:
+            # Handshake happens on first read in the session thread, not in the accept loop
+            sock = self.sink.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, addr
+
+
+class SMTPSink:
+    """
+    Threaded SMTP server on localhost. ``port=0`` picks a free port; read it
+    from ``.port`` after start(). ``arrivals`` maps each recipient address to
+    the time.time() its message was accepted.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0,
+                 certfile: Optional[str] = None, keyfile: Optional[str] = None):
+        self.latency = latency_ms / 1000.0
+        self.ssl_context = None
+        if certfile:
+            self.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.ssl_context.load_cert_chain(certfile, keyfile)
+        self._server = _ThreadingSMTPServer((host, port), self)
+        self.host, self.port = self._server.server_address[:2]
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.arrivals: Dict[str, float] = {}
+        self.stats = {'connections': 0, 'active': 0, 'peak_active': 0, 'logins': 0, 'messages': 0, 'bytes': 0}
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += amount
+
+    def _opened(self) -> None:
+        with self._lock:
+            self.stats['connections'] += 1
+            self.stats['active'] += 1
+            self.stats['peak_active'] = max(self.stats['peak_active'], self.stats['active'])
+
+    def _closed(self) -> None:
+        self._count('active', -1)
+
+    def _received(self, recipients, size: int) -> None:
+        now = time.time()
+        with self._lock:
+            self.stats['messages'] += 1
+            self.stats['bytes'] += size
+            for recipient in recipients:
+                self.arrivals[recipient] = now
+
+    def reset_peak(self) -> None:
+        with self._lock:
+            self.stats['peak_active'] = self.stats['active']
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+    def start(self) -> 'SMTPSink':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local SMTP sink that accepts and discards all mail")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--certfile', help="Serve implicit TLS with this certificate (PEM)")
+    parser.add_argument('--keyfile')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.latency_ms, args.certfile, args.keyfile).start()
+    mode = 'ssl' if sink.ssl_context else 'none'
+    print(f"📭 SMTP sink on {sink.host}:{sink.port} (SMTP_SECURITY={mode}); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"📊 {sink.snapshot()}")
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
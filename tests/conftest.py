@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# Modules are flat at the repo root and several create their SQLite stores at
+# import time; point those at a scratch directory before anything imports them.
+_scratch = tempfile.mkdtemp(prefix='email-tests-')
+os.environ.setdefault('EMAIL_ARCHIVE_DB_PATH', os.path.join(_scratch, 'sent_emails.db'))
+os.environ.setdefault('RECIPIENT_INDEX_PATH', os.path.join(_scratch, 'recipient_index.db'))
+os.environ.setdefault('JD_INDEX_PATH', os.path.join(_scratch, 'jd_index.jsonl'))
+os.environ.setdefault('SEND_METRICS_LOG', 'false')
+os.environ.setdefault('OUTBOX_DB_PATH', os.path.join(_scratch, 'outbox.db'))
+os.environ.setdefault('RESUME_ARTIFACTS_DIR', os.path.join(_scratch, 'resume_artifacts'))
+os.environ.setdefault('UPLOADS_DIR', os.path.join(_scratch, 'uploads'))
+os.environ.setdefault('LLM_TOKEN_LIMITS_PATH', os.path.join(_scratch, 'llm_token_limits.json'))
+# The Groq client refuses to build without a key; tests never reach the network
+os.environ.setdefault('GROQ_API_KEY', 'test-key')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,116 @@
+import os
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+
+import pytest
+
+from attachment_cache import AttachmentCache, AttachmentData, mime_type_for
+
+PDF = ('application', 'pdf')
+
+
+@pytest.fixture
+def resume(tmp_path):
+    path = tmp_path / 'resume.pdf'
+    path.write_bytes(b'%PDF-1.4 first version' * 50)
+    return path
+
+
+def attached_bytes(msg):
+    parsed = message_from_bytes(msg.as_bytes(), policy=policy.default)
+    return [(part.get_filename(), part.get_content()) for part in parsed.iter_attachments()]
+
+
+def message(cache, path, filename='Resume.pdf'):
+    msg = EmailMessage()
+    msg['Subject'] = 'Hi'
+    msg.set_content('Hello')
+    cache.attach(msg, str(path), filename, *PDF)
+    return msg
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ('Jane_Resume.DOCX', ('application', 'vnd.openxmlformats-officedocument.wordprocessingml.document')),
+    ('resume.doc', ('application', 'msword')),
+    ('resume.pdf', PDF),
+    ('resume', PDF),
+])
+def test_mime_type_for(filename, expected):
+    assert mime_type_for(filename) == expected
+
+
+def test_repeat_sends_reuse_the_encoded_part(resume):
+    cache = AttachmentCache()
+    first, second = message(cache, resume), message(cache, resume)
+    assert attached_bytes(first) == attached_bytes(second) == [('Resume.pdf', resume.read_bytes())]
+    assert cache.snapshot()['hits'] == 1 and cache.snapshot()['misses'] == 1
+
+
+def test_matches_add_attachment_output(resume):
+    expected = EmailMessage()
+    expected['Subject'] = 'Hi'
+    expected.set_content('Hello')
+    expected.add_attachment(resume.read_bytes(), maintype='application', subtype='pdf', filename='Resume.pdf')
+    assert attached_bytes(message(AttachmentCache(), resume)) == attached_bytes(expected)
+
+
+def test_editing_the_file_invalidates_its_entry(resume):
+    cache = AttachmentCache()
+    message(cache, resume)
+    stat = resume.stat()
+    resume.write_bytes(b'%PDF-1.4 second version' * 50)
+    os.utime(resume, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert attached_bytes(message(cache, resume)) == [('Resume.pdf', resume.read_bytes())]
+    assert cache.snapshot()['misses'] == 2
+
+
+def test_same_size_rewrite_with_a_new_mtime_is_a_miss(resume):
+    cache = AttachmentCache()
+    message(cache, resume)
+    original = resume.read_bytes()
+    resume.write_bytes(original.replace(b'first', b'FIRST'))
+    os.utime(resume, ns=(resume.stat().st_atime_ns, resume.stat().st_mtime_ns + 1_000_000_000))
+    assert attached_bytes(message(cache, resume))[0][1] != original
+
+
+def test_display_name_is_part_of_the_key(resume):
+    cache = AttachmentCache()
+    message(cache, resume, 'Jane_Resume.pdf')
+    assert attached_bytes(message(cache, resume, 'Other.pdf'))[0][0] == 'Other.pdf'
+    assert cache.snapshot()['entries'] == 2
+
+
+def test_least_recently_used_parts_are_evicted(tmp_path):
+    paths = []
+    for n in range(3):
+        path = tmp_path / f"r{n}.pdf"
+        path.write_bytes(bytes([n]) * 3000)  # ~4 KB once base64 encoded
+        paths.append(path)
+    cache = AttachmentCache(max_bytes=9000)
+    message(cache, paths[0])
+    message(cache, paths[1])
+    message(cache, paths[0])  # r0 is now the most recently used
+    message(cache, paths[2])
+    assert cache.snapshot()['evictions'] == 1 and cache.snapshot()['bytes'] <= 9000
+    message(cache, paths[0])
+    assert cache.snapshot()['hits'] == 2
+    message(cache, paths[1])
+    assert cache.snapshot()['misses'] == 4
+
+
+def test_files_larger_than_the_budget_are_never_cached(resume):
+    cache = AttachmentCache(max_bytes=100)
+    message(cache, resume)
+    assert cache.snapshot()['entries'] == 0 and cache.snapshot()['bytes'] == 0
+
+
+def test_in_memory_attachments_are_keyed_by_content(resume):
+    cache = AttachmentCache()
+    data = resume.read_bytes()
+    for attachment in (AttachmentData(data, 'Resume.pdf'), AttachmentData(data, 'Resume.pdf', digest='')):
+        msg = EmailMessage()
+        cache.attach_data(msg, attachment, *PDF)
+        assert attached_bytes(msg) == [('Resume.pdf', data)]
+    msg = EmailMessage()
+    cache.attach_data(msg, AttachmentData(b'other content', 'Resume.pdf'), *PDF)
+    assert cache.snapshot()['hits'] == 1 and cache.snapshot()['entries'] == 2
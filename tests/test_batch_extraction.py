@@ -0,0 +1,82 @@
+import json
+import time
+
+import pytest
+
+import app as app_module
+from deadlines import remaining_budget
+from jd_cache import ResponseCache
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, 'jd_response_cache', ResponseCache())
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def scripted(monkeypatch):
+    """Replace the LLM extraction with scripted (seconds, draft or exception) answers per JD"""
+    script, budgets = {}, []
+
+    def extract(raw_text, years_of_experience):
+        budgets.append(remaining_budget())
+        seconds, answer = script[raw_text]
+        time.sleep(seconds)
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(app_module, '_extract_email_draft', extract)
+    return script, budgets
+
+
+def post_batch(client, raw_texts, **headers):
+    response = client.post('/clean_job_descriptions_batch', json={'raw_texts': raw_texts}, headers=headers)
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return response, lines
+
+
+def test_items_stream_as_they_finish_then_a_summary(client, scripted):
+    script, _ = scripted
+    script.update({'slow JD': (0.3, {'intent': 'job_posting'}), 'fast JD': (0, {'intent': 'recruiter_outreach'}),
+                   'broken JD': (0, RuntimeError('503 from provider'))})
+    response, lines = post_batch(client, ['slow JD', 'fast JD', 'broken JD', '  '])
+    assert response.mimetype == 'application/x-ndjson'
+    items, summary = lines[:-1], lines[-1]
+    assert items[-1]['index'] == 0 and items[-1]['result'] == {'intent': 'job_posting'}
+    by_index = {item['index']: item for item in items}
+    assert by_index[1]['success'] and not by_index[2]['success'] and '503' in by_index[2]['error']
+    assert by_index[3]['error'] == 'Empty job description'
+    assert (summary['done'], summary['total'], summary['succeeded'], summary['failed']) == (True, 4, 2, 2)
+
+
+def test_items_run_concurrently_under_the_request_deadline(client, scripted):
+    script, budgets = scripted
+    texts = [f"JD {n}" for n in range(4)]
+    script.update({text: (0.2, {'n': n}) for n, text in enumerate(texts)})
+    started = time.monotonic()
+    _, lines = post_batch(client, texts, **{'X-Request-Timeout': '30'})
+    assert lines[-1]['succeeded'] == 4
+    assert time.monotonic() - started < 0.6
+    # Workers run in a copy of the request context, so LLM calls see its deadline
+    assert len(budgets) == 4 and all(budget is not None and budget <= 30 for budget in budgets)
+
+
+def test_repeated_jds_are_served_from_the_response_cache(client, scripted):
+    script, budgets = scripted
+    script['same JD'] = (0, {'intent': 'job_posting'})
+    post_batch(client, ['same JD'])
+    _, lines = post_batch(client, ['same JD'])
+    assert lines[0]['result'] == {'intent': 'job_posting'} and len(budgets) == 1
+
+
+@pytest.mark.parametrize('payload', [{}, {'raw_texts': []}, {'raw_texts': 'one JD'}])
+def test_empty_or_malformed_batches_are_rejected(client, payload):
+    assert client.post('/clean_job_descriptions_batch', json=payload).status_code == 400
+
+
+def test_oversized_batches_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'BATCH_MAX_ITEMS', 2)
+    response = client.post('/clean_job_descriptions_batch', json={'raw_texts': ['a', 'b', 'c']})
+    assert response.status_code == 400 and 'At most 2' in response.get_json()['error']
@@ -0,0 +1,125 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from bulk_sender import BulkSendEngine
+from mail_merge import MailMerge, MergeRecipient
+from recipient_index import RecipientIndex
+
+
+class FakeSender:
+    def __init__(self, sender_email='me@example.com', fail_for=(), delay=0.0):
+        self.sender_email = sender_email
+        self.fail_for = set(fail_for)
+        self.delay = delay
+        self.delivered = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def deliver(self, recruiter_email, name, subject, body, attach_resume, resume_file=None):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if recruiter_email in self.fail_for:
+                raise RuntimeError('550 mailbox unavailable')
+            with self._lock:
+                self.delivered.append((recruiter_email, subject, body))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return RecipientIndex(str(tmp_path / 'recipient_index.db'))
+
+
+def recipients(count):
+    return [MergeRecipient.from_value({'email': f"hr{i}@acme.com", 'name': f"Person {i}"}) for i in range(count)]
+
+
+@pytest.mark.parametrize('count, seconds', [(0, 0), (2, 0), (3, 3), (38, 108), (39, 111)])
+def test_estimated_seconds_follows_the_burst_limit(count, seconds):
+    engine = BulkSendEngine(per_minute=20, connections_per_sender=2)
+    assert engine.estimated_seconds(count) == pytest.approx(seconds)
+
+
+def test_max_recipients_within_is_the_largest_batch_that_fits():
+    engine = BulkSendEngine(per_minute=20, connections_per_sender=2)
+    largest = engine.max_recipients_within(110)
+    assert largest == 38
+    assert engine.estimated_seconds(largest) <= 110 < engine.estimated_seconds(largest + 1)
+    assert engine.max_recipients_within(0) == 2
+
+
+def test_send_personalises_and_reports_in_input_order(ledger):
+    engine = BulkSendEngine(per_minute=6000, connections_per_sender=2, ledger=ledger)
+    sender = FakeSender(fail_for={'hr1@acme.com'})
+    progress = []
+    results = engine.send(sender, recipients(3), MailMerge('Hi {first_name}', 'Dear {name}'), attach_resume=False,
+                          progress=lambda result, done, total: progress.append((done, total)))
+    assert [r['email'] for r in results] == ['hr0@acme.com', 'hr1@acme.com', 'hr2@acme.com']
+    assert [r['success'] for r in results] == [True, False, True]
+    assert '550' in results[1]['error']
+    assert sorted(progress) == [(1, 3), (2, 3), (3, 3)]
+    assert ('hr2@acme.com', 'Hi Person', 'Dear Person 2') in sender.delivered
+
+
+def test_send_uses_at_most_connections_per_sender_in_parallel(ledger):
+    engine = BulkSendEngine(per_minute=6000, connections_per_sender=2, ledger=ledger)
+    sender = FakeSender(delay=0.02)
+    engine.send(sender, recipients(8), MailMerge('Hi', 'Hello'), attach_resume=False)
+    assert len(sender.delivered) == 8
+    assert sender.max_in_flight == 2
+
+
+def test_guard_skips_before_any_quota_is_used(ledger):
+    engine = BulkSendEngine(per_minute=6000, connections_per_sender=1, ledger=ledger)
+    sender = FakeSender()
+    results = engine.send(sender, recipients(2), MailMerge('Hi', 'Hello'), attach_resume=False,
+                          guard=lambda recipient, subject: 'already emailed' if recipient.email == 'hr0@acme.com' else None)
+    assert results[0]['skipped'] and results[0]['duplicate'] and not results[0]['success']
+    assert results[1]['success'] and [d[0] for d in sender.delivered] == ['hr1@acme.com']
+    assert ledger.sends_today('me@example.com') == 1
+
+
+def test_daily_quota_is_shared_by_workers_and_survives_restarts(ledger):
+    # Two engines on one ledger stand in for two gunicorn workers
+    first = BulkSendEngine(daily_limit=5, per_minute=6000, ledger=ledger)
+    second = BulkSendEngine(daily_limit=5, per_minute=6000, ledger=ledger)
+    sender = FakeSender()
+    results = first.send(sender, recipients(3), MailMerge('Hi', 'Hello'), attach_resume=False)
+    results += second.send(sender, recipients(4), MailMerge('Hi', 'Hello'), attach_resume=False)
+    assert sum(r['success'] for r in results) == 5
+    assert [r['error'] for r in results if not r['success']] == ['Daily sending quota reached for this account'] * 2
+    restarted = BulkSendEngine(daily_limit=5, ledger=ledger)
+    assert restarted.throttle_for('ME@example.com').remaining_today() == 0
+
+
+def test_failed_sends_give_their_quota_back(ledger):
+    # One connection, so the failed send is refunded before the next one reserves
+    engine = BulkSendEngine(daily_limit=2, per_minute=6000, connections_per_sender=1, ledger=ledger)
+    results = engine.send(FakeSender(fail_for={'hr0@acme.com'}), recipients(3), MailMerge('Hi', 'Hello'),
+                          attach_resume=False)
+    assert [r['success'] for r in results].count(True) == 2
+    assert engine.throttle_for('me@example.com').remaining_today() == 0
+
+
+def test_archived_sends_count_once_and_single_sends_count_too(ledger):
+    engine = BulkSendEngine(daily_limit=3, per_minute=6000, ledger=ledger)
+    sender = FakeSender()
+
+    def archive(result, done, total):
+        # What /send_bulk does for every success
+        ledger.record({'to_email': result['email'], 'from_email': sender.sender_email, 'subject': 'Hi',
+                       'timestamp': datetime.utcnow().isoformat(), 'send_status': 'sent'})
+
+    engine.send(sender, recipients(1), MailMerge('Hi', 'Hello'), attach_resume=False, progress=archive)
+    assert ledger.sends_today('me@example.com') == 1
+    archive({'email': 'single@globex.com'}, 1, 1)  # a one-off /send_email
+    assert engine.throttle_for('me@example.com').remaining_today() == 1
@@ -0,0 +1,51 @@
+import contextvars
+import threading
+import time
+
+import pytest
+
+from deadlines import DeadlineExceeded, budget_note, deadline_scope, remaining_budget, timeout_for
+
+
+def test_without_a_deadline_the_default_timeout_applies():
+    assert remaining_budget() is None
+    assert timeout_for(60, 'LLM call') == 60
+    assert budget_note() == ''
+
+
+def test_timeout_is_capped_by_the_remaining_budget():
+    with deadline_scope(5, '/extract_jd'):
+        assert timeout_for(60) == pytest.approx(5, abs=0.1)
+        assert timeout_for(2) == 2
+        assert budget_note().startswith(' [budget ')
+
+
+def test_too_little_budget_raises_before_the_call():
+    with deadline_scope(0.2, '/send_email'):
+        assert timeout_for(10, floor=0.1) <= 0.2
+        with pytest.raises(DeadlineExceeded, match='SMTP send: /send_email deadline'):
+            timeout_for(10, 'SMTP send', floor=0.5)
+        time.sleep(0.25)
+        with pytest.raises(DeadlineExceeded):
+            timeout_for(10, floor=0.1)
+
+
+def test_scopes_nest_and_restore():
+    with deadline_scope(30, 'request'):
+        with deadline_scope(1, 'prefetch'):
+            assert remaining_budget() <= 1
+        assert remaining_budget() > 1
+    assert remaining_budget() is None
+
+
+def test_worker_threads_see_the_deadline_only_through_a_copied_context():
+    seen = {}
+    with deadline_scope(5, 'batch'):
+        context = contextvars.copy_context()
+        plain = threading.Thread(target=lambda: seen.update(plain=remaining_budget()))
+        copied = threading.Thread(target=lambda: seen.update(copied=context.run(remaining_budget)))
+        for thread in (plain, copied):
+            thread.start()
+            thread.join()
+    assert seen['plain'] is None
+    assert 0 < seen['copied'] <= 5
@@ -0,0 +1,120 @@
+import pytest
+
+from email_archive import EmailArchive, counter_names
+
+
+def email(n, day='2026-03-01', to_email=None, from_email='me@example.com', **fields):
+    return {'timestamp': f"{day}T09:{n // 60 % 60:02d}:{n % 60:02d}", 'to_email': to_email or f"hr{n}@acme.com",
+            'from_email': from_email, 'subject': f"Role {n}", 'body': 'Hello', **fields}
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return EmailArchive(str(tmp_path / 'sent_emails.db'))
+
+
+def test_counter_names_for_a_record():
+    record = email(1, to_email='Jane@Acme.COM', from_email='Me@Example.com', resume_attached=True,
+                   phone='555', send_status='sent')
+    assert counter_names(record) == ['total', 'with_resume', 'with_phone', 'sender:me@example.com',
+                                     'day:2026-03-01', 'domain:acme.com', 'status:sent']
+    assert counter_names({})[1:] == ['sender:unknown', 'day:unknown', 'domain:unknown']
+
+
+def test_stats_follow_appends_and_status_updates(archive):
+    archive.append(email(1, resume_attached=True, send_status='queued', message_id='m1'))
+    archive.append(email(2, day='2026-03-02', to_email='a@globex.com', phone='555', send_status='sent'))
+    archive.update_by_message_id('m1', lambda record: record.update(send_status='sent'))
+    stats = archive.stats()
+    assert (stats['total'], stats['with_resume'], stats['with_phone']) == (2, 1, 1)
+    assert stats['by_status'] == {'sent': 2}
+    assert stats['by_sender'] == {'me@example.com': 2}
+    assert stats['by_day'] == {'2026-03-01': 1, '2026-03-02': 1}
+    assert archive.count() == 2
+
+
+def test_stats_limits_days_and_top_domains(archive):
+    for n, (day, domain) in enumerate([('2026-03-01', 'a.com'), ('2026-03-02', 'b.com'), ('2026-03-03', 'b.com'),
+                                       ('2026-03-04', 'c.com'), ('2026-03-04', 'c.com'), ('2026-03-04', 'c.com')]):
+        archive.append(email(n, day=day, to_email=f"hr@{domain}"))
+    stats = archive.stats(days=2, top=2)
+    assert list(stats['by_day'].items()) == [('2026-03-03', 1), ('2026-03-04', 3)]
+    assert list(stats['by_domain'].items()) == [('c.com', 3), ('b.com', 2)]
+    assert archive.stats(days=0, top=0)['by_day'] == {}
+
+
+def test_rebuild_matches_incremental_counters(archive):
+    for n in range(20):
+        archive.append(email(n, day=f"2026-03-{n % 5 + 1:02d}", send_status='queued', message_id=f"m{n}"))
+    for n in range(0, 20, 3):
+        archive.update_by_message_id(f"m{n}", lambda record: record.update(send_status='dead'))
+    incremental = archive.stats(days=100, top=100)
+    assert archive.rebuild_counters() == 20
+    assert archive.stats(days=100, top=100) == incremental
+    assert incremental['by_status'] == {'dead': 7, 'queued': 13}
+
+
+def test_statuses_that_drop_to_zero_are_omitted(archive):
+    archive.append(email(1, send_status='queued', message_id='m1'))
+    archive.update_by_message_id('m1', lambda record: record.update(send_status='sent'))
+    assert archive.stats()['by_status'] == {'sent': 1}
+
+
+def test_cursor_pages_cover_every_email_once_newest_first(archive):
+    for n in range(23):
+        archive.append(email(n % 10))  # repeated timestamps: seq breaks the ties
+    seen, cursor, pages = [], None, 0
+    while True:
+        records, cursor = archive.page(limit=5, after=cursor)
+        seen.extend(records)
+        pages += 1
+        if cursor is None:
+            break
+    assert pages == 5 and len(seen) == 23
+    assert len({record['id'] for record in seen}) == 23
+    assert [record['timestamp'] for record in seen] == sorted((record['timestamp'] for record in seen), reverse=True)
+
+
+def test_cursor_is_stable_when_newer_emails_arrive(archive):
+    for n in range(6):
+        archive.append(email(n))
+    first, cursor = archive.page(limit=3)
+    archive.append(email(59))
+    second, _ = archive.page(limit=3, after=cursor)
+    assert [r['subject'] for r in first + second] == [f"Role {n}" for n in range(5, -1, -1)]
+
+
+def test_offset_paging_still_works(archive):
+    for n in range(4):
+        archive.append(email(n))
+    records, cursor = archive.page(limit=2, offset=2)
+    assert [r['subject'] for r in records] == ['Role 1', 'Role 0'] and cursor is None
+
+
+def test_invalid_cursor_is_rejected(archive):
+    with pytest.raises(ValueError):
+        archive.page(after='not-a-cursor')
+
+
+def test_rebuild_counters_does_not_touch_emails(archive):
+    archive.append(email(1))
+    with archive._connect() as conn:
+        conn.execute("INSERT INTO emails (email_id, timestamp, record) VALUES ('legacy', NULL, '{}')")
+        before = conn.execute('SELECT * FROM emails ORDER BY seq').fetchall()
+    assert archive.rebuild_counters() == 2
+    with archive._connect() as conn:
+        assert conn.execute('SELECT * FROM emails ORDER BY seq').fetchall() == before
+
+
+def test_counters_migration_normalises_null_timestamps(tmp_path):
+    path = str(tmp_path / 'sent_emails.db')
+    archive = EmailArchive(path)
+    archive.append(email(1))
+    with archive._connect() as conn:
+        conn.execute("INSERT INTO emails (email_id, timestamp, record) VALUES ('legacy', NULL, '{}')")
+        conn.execute("DELETE FROM meta WHERE key = 'counters_version'")
+    reopened = EmailArchive(path)
+    with reopened._connect() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM emails WHERE timestamp IS NULL').fetchone()[0] == 0
+    records, _ = reopened.page(limit=10)
+    assert len(records) == 2 and reopened.count() == 2
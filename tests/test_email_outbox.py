@@ -0,0 +1,94 @@
+import smtplib
+
+import pytest
+
+from email_outbox import DEAD, RETRYING, SENT, EmailOutbox, is_permanent_error
+
+
+class FakeSender:
+    def __init__(self, error=None):
+        self.error = error
+        self.delivered = []
+
+    def deliver(self, recruiter_email, *args, **kwargs):
+        if self.error is not None:
+            raise self.error
+        self.delivered.append(recruiter_email)
+
+
+def make_outbox(tmp_path, sender, backoff=60):
+    # drain() keeps delivering while anything is due, so a zero backoff runs every attempt in one call
+    statuses = []
+    outbox = EmailOutbox(str(tmp_path / 'outbox.db'), lambda *args: sender,
+                         on_status=lambda message_id, status, details: statuses.append(status),
+                         max_attempts=3, backoff_base=backoff, backoff_max=backoff)
+    return outbox, statuses
+
+
+def queue_one(outbox):
+    return outbox.enqueue('me@example.com', {'recruiter_email': 'them@example.com', 'subject': 'Hi', 'body': 'Hello'})
+
+
+@pytest.mark.parametrize('error, permanent', [
+    (smtplib.SMTPDataError(550, b'5.7.1 Message rejected'), True),
+    (smtplib.SMTPDataError(451, b'4.7.0 Try again later'), False),
+    (smtplib.SMTPDataError(421, b'4.7.28 Rate limited'), False),
+    (smtplib.SMTPRecipientsRefused({'a@x.com': (550, b'No such user')}), True),
+    (smtplib.SMTPRecipientsRefused({'a@x.com': (550, b'No such user'), 'b@x.com': (452, b'Mailbox full')}), False),
+    (smtplib.SMTPRecipientsRefused({'a@x.com': (450, b'Greylisted')}), False),
+    (smtplib.SMTPServerDisconnected('Connection unexpectedly closed'), False),
+    (ValueError('The queued attachment is no longer stored'), True),
+])
+def test_is_permanent_error(error, permanent):
+    assert is_permanent_error(error) is permanent
+
+
+def test_delivered_message_is_sent(tmp_path):
+    sender = FakeSender()
+    outbox, statuses = make_outbox(tmp_path, sender)
+    message_id = queue_one(outbox)
+    assert outbox.drain() == 1
+    assert outbox.get(message_id)['status'] == SENT
+    assert sender.delivered == ['them@example.com']
+    assert statuses[-1] == SENT
+
+
+def test_temporary_smtp_error_is_retried(tmp_path):
+    outbox, statuses = make_outbox(tmp_path, FakeSender(smtplib.SMTPDataError(451, b'4.7.0 Try again later')))
+    message_id = queue_one(outbox)
+    outbox.drain()
+    message = outbox.get(message_id)
+    assert message['status'] == RETRYING
+    assert message['attempts'] == 1
+    assert statuses[-1] == RETRYING
+
+
+def test_permanent_smtp_error_is_dead_lettered_on_first_attempt(tmp_path):
+    outbox, statuses = make_outbox(tmp_path, FakeSender(smtplib.SMTPDataError(554, b'5.6.0 Message rejected')))
+    message_id = queue_one(outbox)
+    outbox.drain()
+    message = outbox.get(message_id)
+    assert message['status'] == DEAD
+    assert message['attempts'] == 1
+    assert statuses[-1] == DEAD
+
+
+def test_temporary_errors_dead_letter_after_max_attempts(tmp_path):
+    outbox, _ = make_outbox(tmp_path, FakeSender(smtplib.SMTPRecipientsRefused({'t@x.com': (421, b'Slow down')})),
+                            backoff=0)
+    message_id = queue_one(outbox)
+    assert outbox.drain() == 3
+    message = outbox.get(message_id)
+    assert message['status'] == DEAD
+    assert message['attempts'] == 3
+
+
+def test_dead_message_can_be_requeued(tmp_path):
+    sender = FakeSender(ValueError('bad payload'))
+    outbox, _ = make_outbox(tmp_path, sender)
+    message_id = queue_one(outbox)
+    outbox.drain()
+    assert outbox.retry(message_id)
+    sender.error = None
+    outbox.drain()
+    assert outbox.get(message_id)['status'] == SENT
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import extraction_eval
+from extraction_eval import DEFAULT_BACKENDS, TASKS
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    # main() setdefaults these for the process; keep them scoped to the test
+    for name, value in [('LLM_CIRCUIT_FAILURE_THRESHOLD', '1000000'), ('LLM_HEDGING_ENABLED', 'false'),
+                        ('LLM_REQUESTS_PER_MINUTE', '1000000'), ('GROQ_API_KEY', 'offline-replay')]:
+        monkeypatch.setenv(name, value)
+    import cleaning_jd
+    import llm_client
+    from jd_similarity import jd_index
+    monkeypatch.setattr(cleaning_jd, 'groq_model', cleaning_jd.groq_model)
+    monkeypatch.setattr(jd_index, 'enabled', jd_index.enabled)
+    monkeypatch.setattr(llm_client, 'llm_rate_limiter', llm_client.RateLimiter(requests_per_minute=6000,
+                                                                                max_concurrency=4))
+
+
+def test_replay_scores_the_corpus_from_the_committed_recordings(offline, tmp_path):
+    output = tmp_path / 'eval_report.json'
+    assert extraction_eval.main(['--mode', 'replay', '--output', str(output)]) == 0
+    results = json.loads(output.read_text())['results']
+    assert set(results) == set(DEFAULT_BACKENDS)
+    for backend in DEFAULT_BACKENDS:
+        assert set(results[backend]) == set(TASKS)
+        for task, summary in results[backend].items():
+            assert summary['missing_recordings'] == 0 and summary['errors'] == 0, (backend, task)
+            assert summary['scored'] == summary['items'] == 3
+            assert 0 < summary['overall_accuracy'] <= 1
+
+
+def test_replay_without_recordings_exits_with_usage_hint(offline, tmp_path, capsys):
+    assert extraction_eval.main(['--mode', 'replay', '--recordings', str(tmp_path / 'missing.jsonl')]) == 2
+    assert '--mode record' in capsys.readouterr().err
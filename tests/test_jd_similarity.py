@@ -0,0 +1,120 @@
+import os
+import threading
+
+import pytest
+
+from jd_similarity import SIMHASH_BITS, NearDuplicateIndex, hamming, normalize_jd, simhash
+
+JD = """Hi Team,
+Role: Senior Python Developer
+Location: Dallas, TX (Hybrid 3 days onsite)
+Must have 8+ years of experience in Python development with Django and Flask.
+Strong experience with AWS services such as Lambda, S3 and DynamoDB.
+Experience building REST APIs and microservices on Kubernetes.
+Hands on experience with Docker and Jenkins CI/CD pipelines.
+Visa: USC, GC, H1B transfer accepted.
+
+Thanks,
+John Carter
+john.carter@abcstaffing.com | 555-123-4567"""
+
+# Same role from another vendor: different greeting, signature and bullet order
+REPOST = """Hello,
+Role: Senior Python Developer
+Location: Dallas, TX (Hybrid 3 days onsite)
+Strong experience with AWS services such as Lambda, S3 and DynamoDB.
+Must have 8+ years of experience in Python development with Django and Flask.
+Hands on experience with Docker and Jenkins CI/CD pipelines.
+Experience building REST APIs and microservices on Kubernetes.
+Visa: USC, GC, H1B transfer accepted.
+
+Regards,
+Priya Shah
+priya@otherstaffing.com | +1 (555) 987-6543"""
+
+OTHER = """Role: Java Full Stack Engineer
+Location: Remote, USA
+10+ years with Java, Spring Boot and Hibernate in banking domain projects.
+Front end work in Angular and TypeScript with NgRx state management.
+Oracle and PostgreSQL performance tuning, Kafka event streaming experience.
+Must be comfortable leading offshore teams across time zones."""
+
+
+@pytest.fixture
+def index(tmp_path):
+    return NearDuplicateIndex(str(tmp_path / 'jd_index.jsonl'), similarity_threshold=0.9)
+
+
+def test_normalize_drops_greeting_signature_and_contacts():
+    tokens = [t for line in normalize_jd(JD) for t in line]
+    assert 'hi' not in tokens and 'carter' not in tokens and '555' not in tokens
+    assert normalize_jd(JD) != [] and sorted(map(tuple, normalize_jd(JD))) == sorted(map(tuple, normalize_jd(REPOST)))
+
+
+def test_shuffled_repost_has_the_same_fingerprint():
+    assert hamming(simhash(normalize_jd(JD)), simhash(normalize_jd(REPOST))) == 0
+
+
+@pytest.mark.parametrize('threshold, max_distance', [(1.0, 0), (0.9, 6), (0.8, 13)])
+def test_threshold_sets_max_hamming_distance(tmp_path, threshold, max_distance):
+    index = NearDuplicateIndex(str(tmp_path / 'jd_index.jsonl'), similarity_threshold=threshold)
+    assert index.max_distance == max_distance
+    assert len(index._bands) == max_distance + 1
+    assert index._bands[-1][1] == SIMHASH_BITS
+
+
+def test_find_returns_near_duplicate_payload(index):
+    index.add('skills', JD, {'skills': ['python']})
+    match = index.find('skills', REPOST)
+    assert match == {'payload': {'skills': ['python']}, 'similarity': 1.0}
+    assert index.find('skills', OTHER) is None
+
+
+def test_find_is_scoped_by_namespace_and_variant(index):
+    index.add('email_draft', JD, 'draft', variant='v1')
+    assert index.find('skills', JD) is None
+    assert index.find('email_draft', JD, variant='v2') is None
+    assert index.find('email_draft', JD, variant='v1')['payload'] == 'draft'
+
+
+def test_short_text_is_neither_stored_nor_matched(index):
+    index.add('skills', 'Python developer, Dallas', 'short')
+    assert index._entries == []
+    assert index.find('skills', 'Python developer, Dallas') is None
+
+
+def test_disabled_index_neither_stores_nor_matches(index):
+    index.add('skills', JD, 'payload')
+    index.enabled = False
+    assert index.find('skills', JD) is None
+    index.add('skills', OTHER, 'other')
+    index.enabled = True
+    assert index.find('skills', OTHER) is None
+
+
+def test_entries_written_by_another_worker_are_picked_up(tmp_path):
+    path = str(tmp_path / 'jd_index.jsonl')
+    writer, reader = NearDuplicateIndex(path), NearDuplicateIndex(path)
+    writer.add('skills', JD, 'shared')
+    assert reader.find('skills', REPOST)['payload'] == 'shared'
+
+
+def test_concurrent_writers_keep_offsets_on_line_boundaries(tmp_path):
+    # One index per "worker", all appending to the same file at once
+    path = str(tmp_path / 'jd_index.jsonl')
+    workers = [NearDuplicateIndex(path) for _ in range(4)]
+
+    def write(worker, n):
+        for i in range(15):
+            worker.add('skills', f"{OTHER}\nRequisition {n}-{i} " + ' '.join(f"w{n}x{i}y{k}" for k in range(5)), i)
+
+    threads = [threading.Thread(target=write, args=(worker, n)) for n, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    size = os.path.getsize(path)
+    for worker in workers:
+        worker._refresh()
+        assert worker._offset == size
+        assert len(worker._entries) == 60
@@ -0,0 +1,292 @@
+import json
+import threading
+import time
+from collections import defaultdict
+
+import groq
+import httpx
+import pytest
+
+import llm_client
+from deadlines import DeadlineExceeded, deadline_scope
+from llm_client import (CircuitBreaker, CircuitOpenError, StructuredOutputError, compile_schema, invoke_llm,
+                        invoke_structured, is_provider_failure)
+
+
+class FakeReply:
+    def __init__(self, content):
+        self.content = content
+        self.response_metadata = {}
+
+
+class FakeModel:
+    """
+    Chat model stand-in: each invoke() pops the next scripted reply (a string or an
+    exception), optionally as a (seconds, reply) pair to simulate a slow provider.
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def bind(self, **kwargs):
+        return self
+
+    def invoke(self, messages, **kwargs):
+        with self._lock:
+            self.calls.append(messages)
+            reply = self.replies.pop(0)
+        if isinstance(reply, tuple):
+            seconds, reply = reply
+            time.sleep(seconds)
+        if isinstance(reply, BaseException):
+            raise reply
+        return FakeReply(reply)
+
+
+@pytest.fixture(autouse=True)
+def fresh_llm_state(monkeypatch):
+    monkeypatch.setattr(llm_client, '_circuit_breakers', {})
+    limiter = llm_client.RateLimiter(requests_per_minute=6000, max_concurrency=4)
+    monkeypatch.setattr(llm_client, 'llm_rate_limiter', limiter)
+    yield
+    # Let abandoned calls finish so they release this limiter, not the restored one
+    for _ in range(limiter.capacity):
+        assert limiter._slots.acquire(timeout=5)
+
+
+NAME_SCHEMA = {'type': 'object', 'required': ['name'], 'properties': {'name': {'type': 'string'}}}
+
+
+def test_compile_schema_reports_every_problem():
+    validate = compile_schema({'type': 'object', 'required': ['name', 'tags'], 'properties': {
+        'name': {'type': ['string', 'null']}, 'level': {'enum': ['junior', 'senior']},
+        'years': {'type': 'integer'}, 'tags': {'type': 'array', 'items': {'type': 'string'}}}})
+    assert validate({'name': None, 'tags': ['a'], 'years': 3}) == []
+    errors = validate({'level': 'lead', 'years': True, 'tags': ['a', 1]})
+    assert "$: missing required field 'name'" in errors
+    assert any(e.startswith('$.level:') for e in errors)
+    assert any(e.startswith('$.years: expected integer') for e in errors)
+    assert any(e.startswith('$.tags[]: expected string') for e in errors)
+
+
+def test_validators_are_cached_by_schema_content_not_identity():
+    invoke_structured(FakeModel('{"name": "Jane"}'), [], NAME_SCHEMA, call_type='test_cache')
+    # A different schema that could reuse a collected dict's id() must get its own validator
+    other = {'type': 'object', 'required': ['email'], 'properties': {'email': {'type': 'string'}}}
+    with pytest.raises(StructuredOutputError):
+        invoke_structured(FakeModel('{"name": "Jane"}', '{"name": "Jane"}'), [], other, call_type='test_cache')
+    assert json.dumps(NAME_SCHEMA, sort_keys=True) in llm_client._compiled_schemas
+    assert json.dumps(other, sort_keys=True) in llm_client._compiled_schemas
+
+
+def test_invalid_reply_gets_one_repair_call():
+    model = FakeModel('{"nome": "Jane"}', '```json\n{"name": "Jane"}\n```')
+    assert invoke_structured(model, [], NAME_SCHEMA, call_type='test_repair') == {'name': 'Jane'}
+    assert len(model.calls) == 2
+    assert "missing required field 'name'" in model.calls[1][-1].content
+
+
+def api_error(error_class, status, code='json_validate_failed'):
+    request = httpx.Request('POST', 'https://api.groq.com/openai/v1/chat/completions')
+    body = {'error': {'message': f"error {status}", 'code': code}}
+    return error_class(f"Error code: {status} - {body}", response=httpx.Response(status, request=request, json=body),
+                       body=body)
+
+
+def breaker_for(model, threshold=2, reset=30.0):
+    breaker = llm_client._circuit_breakers['fakemodel'] = CircuitBreaker('fakemodel', threshold, reset)
+    assert llm_client.get_circuit_breaker(model) is breaker
+    return breaker
+
+
+def test_breaker_opens_after_threshold_then_probes_once():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure(RuntimeError('503'))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.06)
+    breaker.before_call()  # the single half-open probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure(RuntimeError('503'))
+    assert breaker.state == CircuitBreaker.OPEN and breaker.times_opened == 2
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.snapshot()['state'] == CircuitBreaker.CLOSED and breaker.consecutive_failures == 0
+
+
+@pytest.mark.parametrize('error, failure', [
+    (api_error(groq.InternalServerError, 503), True),
+    (api_error(groq.RateLimitError, 429, 'rate_limit_exceeded'), True),
+    (groq.APIConnectionError(request=httpx.Request('POST', 'https://api.groq.com')), True),
+    (api_error(groq.BadRequestError, 400), False),
+    (api_error(groq.AuthenticationError, 401, 'invalid_api_key'), False),
+    (api_error(groq.APIStatusError, 413, 'request_too_large'), False),
+    (ValueError('bad prompt'), False),
+])
+def test_only_provider_health_errors_count_as_failures(error, failure):
+    assert is_provider_failure(error) is failure
+
+
+def test_client_errors_do_not_open_the_circuit():
+    model = FakeModel(*[api_error(groq.BadRequestError, 400, 'context_length_exceeded')] * 3)
+    breaker = breaker_for(model)
+    for _ in range(3):
+        with pytest.raises(groq.BadRequestError):
+            invoke_llm(model, [], call_type='test_breaker')
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_server_errors_open_the_circuit():
+    model = FakeModel(*[api_error(groq.InternalServerError, 500)] * 2)
+    breaker = breaker_for(model)
+    for _ in range(2):
+        with pytest.raises(groq.InternalServerError):
+            invoke_llm(model, [], call_type='test_breaker')
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        invoke_llm(model, [], call_type='test_breaker')
+    assert len(model.calls) == 2
+
+
+def json_rejected(generation):
+    error = api_error(groq.BadRequestError, 400)
+    error.body['error']['failed_generation'] = generation
+    return error
+
+
+def test_provider_json_rejection_takes_the_repair_path():
+    model = FakeModel(json_rejected('{"name": Jane}'), '{"name": "Jane"}')
+    breaker = breaker_for(model)
+    assert invoke_structured(model, [], NAME_SCHEMA, call_type='test_rejected') == {'name': 'Jane'}
+    repair = model.calls[1]
+    assert repair[-2].content == '{"name": Jane}'
+    assert 'invalid JSON' in repair[-1].content
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.consecutive_failures == 0
+
+
+def test_provider_json_rejection_twice_raises_structured_output_error():
+    model = FakeModel(json_rejected(''), json_rejected('{'))
+    with pytest.raises(StructuredOutputError) as excinfo:
+        invoke_structured(model, [], NAME_SCHEMA, call_type='test_rejected')
+    assert excinfo.value.raw_text == '{'
+    assert llm_client.get_structured_output_stats()['test_rejected']['failed'] >= 1
+
+
+def test_other_client_errors_are_not_repaired():
+    model = FakeModel(api_error(groq.BadRequestError, 400, 'context_length_exceeded'))
+    with pytest.raises(groq.BadRequestError):
+        invoke_structured(model, [], NAME_SCHEMA, call_type='test_rejected')
+    assert len(model.calls) == 1
+
+
+def test_rate_limiter_times_out_when_every_slot_is_busy():
+    limiter = llm_client.RateLimiter(requests_per_minute=6000, max_concurrency=2)
+    assert limiter.acquire(timeout=0.1) and limiter.acquire(timeout=0.1)
+    started = time.monotonic()
+    assert limiter.acquire(timeout=0.05) is False
+    assert time.monotonic() - started < 0.5
+    limiter.release()
+    assert limiter.acquire(timeout=0.1)
+
+
+def test_rate_limiter_refunds_the_token_when_no_slot_frees_up():
+    limiter = llm_client.RateLimiter(requests_per_minute=600, max_concurrency=1)  # one token per 0.1s
+    assert limiter.acquire()
+    time.sleep(0.15)  # the bucket refills while the only slot stays busy
+    assert limiter.acquire(timeout=0.05) is False
+    limiter.release()
+    # Without the refund the bucket would still be refilling and this would fail
+    assert limiter.acquire(timeout=0)
+
+
+def test_call_stops_waiting_when_the_request_deadline_passes(monkeypatch):
+    limiter = llm_client.RateLimiter(requests_per_minute=6000, max_concurrency=1)
+    monkeypatch.setattr(llm_client, 'llm_rate_limiter', limiter)
+    model = FakeModel((1.0, 'late'))
+    started = time.monotonic()
+    with deadline_scope(0.8, '/extract_jd'):
+        with pytest.raises(DeadlineExceeded, match=r'LLM call \(test_deadline\): no response'):
+            invoke_llm(model, [], call_type='test_deadline')
+    assert time.monotonic() - started < 0.95
+    # The abandoned call keeps its slot until the provider really answers
+    assert limiter.acquire(timeout=0) is False
+    assert limiter.acquire(timeout=1)
+
+
+def test_no_call_is_made_without_enough_budget():
+    model = FakeModel('never sent')
+    with deadline_scope(0.2, '/extract_jd'):
+        with pytest.raises(DeadlineExceeded):
+            invoke_llm(model, [], call_type='test_deadline')
+    assert model.calls == []
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(llm_client, 'LLM_HEDGING_ENABLED', True)
+    monkeypatch.setattr(llm_client, 'LLM_HEDGE_DEFAULT_DELAY_SECONDS', 0.05)
+    monkeypatch.setattr(llm_client, 'llm_latency', llm_client.LatencyTracker())
+    monkeypatch.setattr(llm_client, 'hedge_budget', llm_client.HedgeBudget(ratio=0.1))
+    monkeypatch.setattr(llm_client, 'hedge_stats', defaultdict(llm_client.hedge_stats.default_factory))
+
+
+def test_hedge_budget_earns_a_fraction_per_call_up_to_the_burst():
+    budget = llm_client.HedgeBudget(ratio=0.5, burst=2)
+    assert budget.try_spend() and not budget.try_spend()
+    budget.earn()
+    assert not budget.try_spend()
+    for _ in range(10):
+        budget.earn()
+    assert budget.try_spend() and budget.try_spend() and not budget.try_spend()
+    budget.refund()
+    assert budget.try_spend()
+
+
+def test_latency_percentile_needs_enough_samples():
+    tracker = llm_client.LatencyTracker()
+    for n in range(llm_client.LLM_HEDGE_MIN_SAMPLES - 1):
+        tracker.record('draft', n / 100)
+    assert tracker.percentile('draft', 0.9) is None
+    tracker.record('draft', 0.19)
+    assert tracker.percentile('draft', 0.9) == pytest.approx(0.18)
+
+
+def test_slow_primary_is_hedged_and_the_first_reply_wins(hedging):
+    model = FakeModel((0.5, 'primary'), 'hedge')
+    assert invoke_llm(model, [], call_type='test_hedge', hedge=True).content == 'hedge'
+    assert len(model.calls) == 2
+    assert llm_client.get_hedge_stats()['test_hedge'] == {
+        'hedged': 1, 'hedge_wins': 1, 'primary_wins': 0, 'skipped_budget': 0, 'skipped_no_slot': 0,
+        'hedge_win_rate': 1.0}
+
+
+def test_fast_primary_and_unhedged_calls_send_one_request(hedging):
+    model = FakeModel('fast', (0.2, 'slow but not hedged'))
+    assert invoke_llm(model, [], call_type='test_hedge', hedge=True).content == 'fast'
+    assert invoke_llm(model, [], call_type='test_hedge').content == 'slow but not hedged'
+    assert len(model.calls) == 2 and 'test_hedge' not in llm_client.get_hedge_stats()
+
+
+def test_hedges_stop_when_the_budget_runs_out(hedging):
+    model = FakeModel((0.3, 'primary'), 'hedge', (0.3, 'primary again'))
+    invoke_llm(model, [], call_type='test_hedge', hedge=True)
+    assert invoke_llm(model, [], call_type='test_hedge', hedge=True).content == 'primary again'
+    stats = llm_client.get_hedge_stats()['test_hedge']
+    assert (stats['hedged'], stats['skipped_budget']) == (1, 1)
+
+
+def test_no_free_slot_skips_the_hedge_and_keeps_the_budget(hedging, monkeypatch):
+    monkeypatch.setattr(llm_client, 'llm_rate_limiter', llm_client.RateLimiter(requests_per_minute=6000,
+                                                                                max_concurrency=1))
+    model = FakeModel((0.3, 'primary'))
+    assert invoke_llm(model, [], call_type='test_hedge', hedge=True).content == 'primary'
+    assert llm_client.get_hedge_stats()['test_hedge']['skipped_no_slot'] == 1
+    assert llm_client.hedge_budget.try_spend()
@@ -0,0 +1,64 @@
+import pytest
+
+from mail_merge import DEFAULT_RECIPIENT_NAME, MailMerge, MergeRecipient, MergeTemplate, TemplateError
+
+JD_ANALYSIS = {'recruiter_name': 'John Carter', 'recruiter_email': 'john@abc.com',
+               'company_name': 'Acme', 'title': 'Python Developer', 'location': 'Dallas, TX'}
+
+
+def test_plain_address_gets_default_name():
+    recipient = MergeRecipient.from_value('jane@example.com')
+    assert recipient.email == 'jane@example.com'
+    assert recipient.name == DEFAULT_RECIPIENT_NAME
+
+
+def test_shared_job_fields_apply_to_every_recipient():
+    recipient = MergeRecipient.from_value('jane@example.com', JD_ANALYSIS)
+    assert (recipient.company, recipient.role, recipient.location) == ('Acme', 'Python Developer', 'Dallas, TX')
+
+
+def test_shared_recruiter_fields_are_not_applied():
+    # The JD's recruiter is one person; they must not become every recipient's name or address
+    assert MergeRecipient.from_value('jane@example.com', JD_ANALYSIS).name == DEFAULT_RECIPIENT_NAME
+    assert MergeRecipient.from_value({'name': 'Jane'}, JD_ANALYSIS).email == ''
+    assert MergeRecipient.from_value({}, {'name': 'Shared', 'email': 'x@y.com'}) == MergeRecipient(email='')
+
+
+def test_recipient_fields_override_shared_ones():
+    recipient = MergeRecipient.from_value({'email': 'jane@example.com', 'company': 'Globex', 'job_title': 'Lead'},
+                                          JD_ANALYSIS)
+    assert (recipient.company, recipient.role, recipient.location) == ('Globex', 'Lead', 'Dallas, TX')
+
+
+def test_recipient_aliases_are_applied():
+    recipient = MergeRecipient.from_value({'recruiter_name': ' Jane Doe ', 'recruiter_email': 'jane@example.com',
+                                           'resume_path': '/tmp/r.docx'})
+    assert (recipient.name, recipient.email, recipient.resume_path) == ('Jane Doe', 'jane@example.com', '/tmp/r.docx')
+
+
+def test_template_renders_aliases_and_fallbacks():
+    template = MergeTemplate('Hi {first_name}, {company_name|your team} {json} {}')
+    assert template.fields == {'first_name', 'company', 'json'}
+    assert template.unknown_fields == ['json']
+    values = MergeRecipient.from_value({'email': 'a@b.com', 'name': 'Jane Doe'}).values()
+    assert template.render(values) == 'Hi Jane, your team  {}'
+
+
+def test_validate_reports_every_problem():
+    merge = MailMerge('About {role}', 'Hello {name}, {bogus}')
+    errors = merge.validate([MergeRecipient.from_value('not-an-address'),
+                             MergeRecipient.from_value({'email': 'a@b.com', 'resume_path': '/no/such/file.docx'})])
+    assert any('Unknown merge field' in e for e in errors)
+    assert any('invalid email address' in e for e in errors)
+    assert sum('no value for {role}' in e for e in errors) == 2
+    assert any('resume not found' in e for e in errors)
+    with pytest.raises(TemplateError) as excinfo:
+        merge.check([MergeRecipient.from_value('a@b.com')], attach_resume=False)
+    assert excinfo.value.errors
+
+
+def test_sender_fields_render_but_recipient_wins():
+    merge = MailMerge('{role|a role}', '{name} from {sender_name}', sender_fields={'sender_name': 'Sam', 'sender_phone': ''})
+    recipient = MergeRecipient.from_value({'email': 'a@b.com', 'name': 'Jane'})
+    assert merge.render(recipient) == ('a role', 'Jane from Sam')
+    assert merge.validate([recipient]) == []
@@ -0,0 +1,85 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from recipient_index import RecipientIndex, subject_key
+
+
+def archived(to_email, subject, days_ago=0.0, status='sent', message_id=None, from_email='Me@Example.com'):
+    timestamp = (datetime.utcnow() - timedelta(days=days_ago)).isoformat()
+    return {'to_email': to_email, 'subject': subject, 'from_email': from_email, 'timestamp': timestamp,
+            'message_id': message_id, 'send_status': status}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return RecipientIndex(str(tmp_path / 'recipient_index.db'))
+
+
+@pytest.mark.parametrize('a, b', [
+    ('Application for Senior ML Engineer - Acme', 'Re: Acme: senior ML engineer role'),
+    ('Senior Python Developer', 'FWD: interest in the Senior Python Developer position'),
+])
+def test_subject_key_ignores_prefixes_filler_and_order(a, b):
+    assert subject_key(a) == subject_key(b)
+
+
+def test_subject_key_distinguishes_roles():
+    assert subject_key('Senior Python Developer') != subject_key('Senior Java Developer')
+
+
+def test_same_subject_within_window_is_duplicate(index):
+    index.record(archived(' Jane@Acme.com ', 'Application for Senior Python Developer', days_ago=3))
+    result = index.check('jane@acme.com', 'Re: senior python developer')
+    assert result['contacted'] and result['duplicate']
+    assert result['last_contact']['from_email'] == 'me@example.com'
+    reason = RecipientIndex.describe(result)
+    assert 'jane@acme.com' in reason and '3 day(s) ago' in reason
+
+
+def test_other_subject_is_contact_but_not_duplicate(index):
+    index.record(archived('jane@acme.com', 'Senior Python Developer'))
+    result = index.check('jane@acme.com', 'Data Engineer')
+    assert result['contacted'] and not result['duplicate']
+    assert index.duplicate_reason('jane@acme.com', 'Data Engineer') is None
+
+
+def test_contacts_outside_window_are_ignored(index):
+    index.record(archived('jane@acme.com', 'Senior Python Developer', days_ago=45))
+    assert not index.check('jane@acme.com', 'Senior Python Developer', within_days=30)['contacted']
+    assert index.check('jane@acme.com', 'Senior Python Developer', within_days=60)['duplicate']
+
+
+@pytest.mark.parametrize('status', ['dead', 'failed'])
+def test_undelivered_emails_never_count(index, status):
+    index.record(archived('jane@acme.com', 'Senior Python Developer', status=status))
+    assert not index.check('jane@acme.com', 'Senior Python Developer')['contacted']
+
+
+def test_status_update_by_message_id(index):
+    index.record(archived('jane@acme.com', 'Senior Python Developer', status='queued', message_id='m1'))
+    assert index.check('jane@acme.com', 'Senior Python Developer')['duplicate']
+    index.update_status('m1', 'dead')
+    assert not index.check('jane@acme.com', 'Senior Python Developer')['duplicate']
+
+
+def test_ensure_built_loads_archive_once(index):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return [archived('jane@acme.com', 'Senior Python Developer'), {'to_email': '', 'timestamp': 'bad'}]
+
+    index.ensure_built(load)
+    index.ensure_built(load)
+    assert calls == [1]
+    assert index.check('jane@acme.com', 'Senior Python Developer')['duplicate']
+
+
+def test_send_times_by_sender(index):
+    index.record(archived('a@acme.com', 'One', days_ago=0))
+    index.record(archived('b@acme.com', 'Two', days_ago=2))
+    index.record(archived('c@acme.com', 'Three', from_email='other@example.com'))
+    assert len(index.send_times('me@example.com', time.time() - 86400)) == 1
+    assert len(index.send_times('ME@example.com', 0)) == 2
@@ -0,0 +1,93 @@
+import socket
+import time
+from email.message import EmailMessage
+
+import pytest
+
+from smtp_pool import SMTPConnectionPool
+from smtp_sink import SMTPSink
+
+
+@pytest.fixture
+def sink():
+    sink = SMTPSink().start()
+    yield sink
+    sink.stop()
+
+
+def make_pool(sink, **kwargs):
+    return SMTPConnectionPool(sink.host, sink.port, security='none', **kwargs)
+
+
+def message(to='hr@acme.com'):
+    msg = EmailMessage()
+    msg['From'], msg['To'], msg['Subject'] = 'me@example.com', to, 'Hi'
+    msg.set_content('Hello')
+    return msg
+
+
+def drop(pool):
+    # What a server closing an idle session looks like from our side
+    for idle in pool._idle.values():
+        for conn in idle:
+            conn.smtp.sock.shutdown(socket.SHUT_RDWR)
+
+
+def test_sessions_are_reused_per_account(sink):
+    pool = make_pool(sink)
+    for n in range(3):
+        pool.send_message('me@example.com', 'secret', message(f"hr{n}@acme.com"), timeout=5)
+    pool.send_message('other@example.com', 'secret', message(), timeout=5)
+    assert sink.snapshot()['logins'] == 2 and sink.snapshot()['messages'] == 4
+    assert pool.snapshot()['opened'] == 2 and pool.snapshot()['reused'] == 2
+    pool.close_all()
+    assert pool.snapshot()['idle'] == 0 and pool.snapshot()['closed'] == 2
+
+
+def test_changed_password_never_reuses_the_old_session(sink):
+    pool = make_pool(sink)
+    pool.send_message('me@example.com', 'old', message(), timeout=5)
+    pool.send_message('me@example.com', 'new', message(), timeout=5)
+    assert pool.snapshot()['opened'] == 2 and pool.snapshot()['reused'] == 0
+
+
+def test_sessions_past_their_lifetime_are_retired(sink):
+    pool = make_pool(sink, max_lifetime=0.1)
+    pool.send_message('me@example.com', 'secret', message(), timeout=5)
+    time.sleep(0.15)
+    pool.send_message('me@example.com', 'secret', message(), timeout=5)
+    assert pool.snapshot()['expired'] == 1 and pool.snapshot()['opened'] == 2
+
+
+def test_stale_idle_session_fails_noop_and_is_replaced(sink):
+    pool = make_pool(sink, noop_after=0)
+    pool.send_message('me@example.com', 'secret', message(), timeout=5)
+    drop(pool)
+    pool.send_message('me@example.com', 'secret', message(), timeout=5)
+    stats = pool.snapshot()
+    assert (stats['noop_failed'], stats['opened'], stats['retried']) == (1, 2, 0)
+    assert sink.snapshot()['messages'] == 2
+
+
+def test_session_dropped_mid_send_is_retried_once_on_a_new_connection(sink):
+    pool = make_pool(sink, noop_after=60)  # no probe, so the drop surfaces during the send
+    pool.send_message('me@example.com', 'secret', message(), timeout=5)
+    drop(pool)
+    pool.send_message('me@example.com', 'secret', message('second@acme.com'), timeout=5)
+    assert pool.snapshot()['retried'] == 1 and pool.snapshot()['opened'] == 2
+    assert 'second@acme.com' in sink.arrivals
+
+
+def test_extra_sessions_beyond_max_idle_are_closed(sink):
+    pool = make_pool(sink, max_idle_per_account=1)
+    with pool.connection('me@example.com', 'secret', 5), pool.connection('me@example.com', 'secret', 5):
+        assert sink.snapshot()['connections'] == 2
+    assert pool.snapshot()['idle'] == 1 and pool.snapshot()['closed'] == 1
+
+
+def test_failed_session_is_not_returned_to_the_pool(sink):
+    pool = make_pool(sink)
+    with pytest.raises(RuntimeError):
+        with pool.connection('me@example.com', 'secret', 5):
+            raise RuntimeError('boom')
+    assert pool.snapshot()['idle'] == 0 and pool.snapshot()['closed'] == 1
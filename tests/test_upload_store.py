@@ -0,0 +1,106 @@
+import io
+import os
+import time
+
+import pytest
+
+from upload_store import UploadStore
+
+DAY = 24 * 3600
+
+
+class OneShotStream(io.RawIOBase):
+    """A request body that can only be read forward, like a chunked upload"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def readinto(self, buffer):
+        chunk = self._data.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / 'uploads'), memory_limit=1024, memory_cache_bytes=4096, retention_days=14)
+
+
+def age(store, digest, days):
+    path = store._path(digest)
+    past = time.time() - days * DAY
+    os.utime(path, (past, past))
+
+
+def test_same_content_is_stored_once(store):
+    first = store.ingest(io.BytesIO(b'resume v1'), 'Jane_Resume.pdf')
+    second = store.ingest(io.BytesIO(b'resume v1'), '../../etc/Renamed.pdf')
+    assert first.digest == second.digest and not first.reused and second.reused
+    assert second.filename == 'Renamed.pdf'
+    assert (store.stats['stored'], store.stats['reused']) == (1, 1)
+    assert os.listdir(os.path.dirname(store._path(first.digest))) == [first.digest]
+
+
+def test_forward_only_and_large_streams_are_stored_intact(store):
+    data = os.urandom(200 * 1024)
+    upload = store.ingest(OneShotStream(data), 'big.pdf')
+    assert upload.size == len(data)
+    assert store.snapshot()['memory_entries'] == 0  # over memory_limit: disk only
+    assert store.read(upload.digest) == data and store.stats['disk_reads'] == 1
+
+
+def test_small_blobs_are_read_from_memory(store):
+    upload = store.ingest(io.BytesIO(b'small resume'), 'r.pdf')
+    assert store.read(upload.digest) == b'small resume'
+    assert store.stats['memory_hits'] == 1 and store.stats['disk_reads'] == 0
+
+
+def test_memory_cache_stays_within_budget(store):
+    for n in range(8):
+        store.ingest(io.BytesIO(bytes([n]) * 1000), f"r{n}.pdf")
+    assert store.snapshot()['memory_bytes'] <= 4096 and store.snapshot()['memory_entries'] == 4
+
+
+def test_prune_removes_only_blobs_unused_past_retention(store):
+    old = store.ingest(io.BytesIO(b'old resume'), 'old.pdf')
+    recent = store.ingest(io.BytesIO(b'recent resume'), 'recent.pdf')
+    age(store, old.digest, 15)
+    age(store, recent.digest, 13)
+    assert store.prune() == 1
+    assert not store.exists(old.digest) and store.exists(recent.digest)
+    assert store.stats['pruned'] == 1
+    with pytest.raises(FileNotFoundError):
+        store.read(old.digest)  # dropped from memory too
+
+
+def test_sending_or_reuploading_keeps_a_blob_alive(store):
+    sent = store.ingest(io.BytesIO(b'x' * 2000), 'sent.pdf')  # over memory_limit, so read() hits disk
+    reuploaded = store.ingest(io.BytesIO(b'reuploaded'), 'again.pdf')
+    age(store, sent.digest, 30)
+    age(store, reuploaded.digest, 30)
+    store.read(sent.digest)
+    store.ingest(io.BytesIO(b'reuploaded'), 'again.pdf')
+    assert store.prune() == 0
+
+
+def test_prune_runs_at_most_hourly_on_ingest(store):
+    store.ingest(io.BytesIO(b'first'), 'a.pdf')
+    stale = store.ingest(io.BytesIO(b'stale'), 'b.pdf')
+    age(store, stale.digest, 30)
+    store.ingest(io.BytesIO(b'third'), 'c.pdf')
+    assert store.exists(stale.digest)
+    store._last_prune -= 3601
+    store.ingest(io.BytesIO(b'fourth'), 'd.pdf')
+    assert not store.exists(stale.digest)
+
+
+@pytest.mark.parametrize('digest', ['', 'abc', '../' + 'a' * 61, 'A' * 64])
+def test_invalid_digests_are_rejected(store, digest):
+    with pytest.raises(ValueError):
+        store.read(digest)
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional
+
+UPLOADS_DIR = os.getenv('UPLOADS_DIR', os.path.join(os.getcwd(), 'uploads'))
+# Uploads up to this size are spooled and cached in memory; larger ones go through a temp file
+UPLOAD_MEMORY_LIMIT_BYTES = int(os.getenv('UPLOAD_MEMORY_LIMIT_KB', '1024')) * 1024
+UPLOAD_MEMORY_CACHE_BYTES = int(os.getenv('UPLOAD_MEMORY_CACHE_MB', '32')) * 1024 * 1024
+# Blobs not sent or re-uploaded for this long are deleted
+UPLOAD_RETENTION_DAYS = float(os.getenv('UPLOAD_RETENTION_DAYS', '14'))
+
+CHUNK_SIZE = 64 * 1024
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    """A stored upload: its content hash plus the name it was uploaded under."""
+    digest: str
+    size: int
+    filename: str
+    reused: bool = False
+
+
+def seekable_stream(stream: BinaryIO, memory_limit: int = UPLOAD_MEMORY_LIMIT_BYTES) -> BinaryIO:
+    """``stream`` itself when it can seek, otherwise a copy spooled to memory (or disk past ``memory_limit``)"""
+    try:
+        if stream.seekable():
+            return stream
+    except (AttributeError, ValueError):
+        pass
+    spool = tempfile.SpooledTemporaryFile(max_size=memory_limit)
+    shutil.copyfileobj(stream, spool, CHUNK_SIZE)
+    spool.seek(0)
+    return spool
+
+
+class UploadStore:
+    """
+    Content-addressed store for uploaded (and queued) resume files.
+
+    Each file is hashed while it streams in and kept once under its SHA-256,
+    so sending the same resume again reuses the stored blob instead of writing
+    a new copy. Small blobs are also kept in an in-memory LRU so sends read
+    them without touching disk. Blobs unused for ``retention_days`` are pruned.
+    """
+
+    def __init__(self, root: str, memory_limit: int = UPLOAD_MEMORY_LIMIT_BYTES,
+                 memory_cache_bytes: int = UPLOAD_MEMORY_CACHE_BYTES, retention_days: float = UPLOAD_RETENTION_DAYS):
+        self.root = root
+        self.memory_limit = memory_limit
+        self.memory_cache_bytes = memory_cache_bytes
+        self.retention_days = retention_days
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.stats = {'stored': 0, 'reused': 0, 'memory_hits': 0, 'disk_reads': 0, 'pruned': 0}
+
+    def _path(self, digest: str) -> str:
+        if not _DIGEST_RE.match(digest or ''):
+            raise ValueError(f"Invalid upload digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _remember(self, digest: str, data: bytes) -> None:
+        if len(data) > self.memory_limit:
+            return
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                return
+            self._memory[digest] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_cache_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += amount
+
+    def ingest(self, stream: BinaryIO, filename: str) -> StoredUpload:
+        """Hash and store an upload stream (e.g. a werkzeug FileStorage.stream)"""
+        stream = seekable_stream(stream, self.memory_limit)
+        start = stream.tell()
+        hasher = hashlib.sha256()
+        size = 0
+        small_chunks = []
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+            size += len(chunk)
+            if size <= self.memory_limit:
+                small_chunks.append(chunk)
+        digest = hasher.hexdigest()
+        path = self._path(digest)
+
+        reused = os.path.exists(path)
+        if reused:
+            os.utime(path)
+            self._count('reused')
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            stream.seek(start)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    shutil.copyfileobj(stream, out, CHUNK_SIZE)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._count('stored')
+        if size <= self.memory_limit:
+            self._remember(digest, b''.join(small_chunks))
+        self._maybe_prune()
+        return StoredUpload(digest=digest, size=size, filename=os.path.basename(filename or '') or digest, reused=reused)
+
+    def ingest_path(self, path: str, filename: Optional[str] = None) -> StoredUpload:
+        """Store a file that is already on the server (e.g. a generated resume)"""
+        with open(path, 'rb') as f:
+            return self.ingest(f, filename or os.path.basename(path))
+
+    def read(self, digest: str) -> bytes:
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+                self.stats['memory_hits'] += 1
+                return data
+        path = self._path(digest)
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.utime(path)
+        self._count('disk_reads')
+        self._remember(digest, data)
+        return data
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def _maybe_prune(self) -> None:
+        # At most hourly, piggybacked on uploads
+        if time.time() - self._last_prune > 3600:
+            self._last_prune = time.time()
+            self.prune()
+
+    def prune(self) -> int:
+        """Delete blobs not used within the retention window; returns how many were removed"""
+        cutoff = time.time() - self.retention_days * 24 * 3600
+        removed = 0
+        if not os.path.isdir(self.root):
+            return 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                        with self._lock:
+                            evicted = self._memory.pop(name, None)
+                            if evicted is not None:
+                                self._memory_size -= len(evicted)
+                except FileNotFoundError:
+                    continue
+        if removed:
+            self._count('pruned', removed)
+            print(f"🧹 Pruned {removed} unused upload(s)")
+        return removed
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, 'memory_entries': len(self._memory), 'memory_bytes': self._memory_size}
+
+
+upload_store = UploadStore(UPLOADS_DIR)